@@ -0,0 +1,266 @@
+'''
+Throughput and p50/p95/p99 latency of API end-points: login, refresh, list, query, get,
+create, update and delete.
+
+main:app is driven in-process through httpx ASGI transport, Redis is replaced by fakeredis
+(or --redis-url), database is a temporary SQLite file (or --db-url). For every size the schema
+is recreated and one account with that many contacts is seeded, so runs are reproducible
+from --seed. Rate limiter is off. Results are written as JSON to compare runs over time.
+
+--db-url of Postgres drops and recreates all tables, use a dedicated database.
+
+Usage:
+    python -m benchmarks.endpoints --sizes 1000 100000 1000000 --requests 200 --output bench.json
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import httpx
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import src.database.db as database
+
+ENDPOINTS = ('login', 'refresh', 'list', 'query', 'get', 'create', 'update', 'delete')
+EMAIL = 'bench@example.com'
+PASSWORD = 'secret78'
+FIRST_NAMES = ('Anna', 'Bohdan', 'Daria', 'Ivan', 'Kateryna', 'Mykola', 'Olena', 'Petro', 'Sofia', 'Taras')
+LAST_NAMES = ('Bondar', 'Hnatiuk', 'Kovalenko', 'Melnyk', 'Shevchenko', 'Tkachenko')
+DOMAINS = ('gmail.com', 'ukr.net', 'meta.ua', 'example.com')
+SEED_CHUNK = 10000
+
+
+def install_redis(url: str | None) -> None:
+    '''
+    Replaces Redis client before services, which keep reference to it, are imported.
+    '''
+    if url:
+        import redis.asyncio as redis
+        database.rds_cache = redis.Redis.from_url(url, decode_responses=True)
+    else:
+        import fakeredis
+        database.rds_cache = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+def contact(rng: random.Random, number: int) -> dict:
+    first_name = rng.choice(FIRST_NAMES)
+    last_name = rng.choice(LAST_NAMES)
+    birthday = date(1950, 1, 1) + timedelta(days=rng.randrange(365 * 55))
+    return {'first_name': first_name, 'last_name': last_name,
+            'email': f'{first_name.lower()}{number}@{rng.choice(DOMAINS)}'[:30],
+            'birthday': birthday, 'notes': f'{last_name} contact {number}'}
+
+
+async def seed(engine, sessionmaker, size: int, rng: random.Random) -> tuple[int, int]:
+    '''
+    Recreates schema and adds benchmark account with size contacts.
+
+    Returns:
+        'tuple': lowest and highest ID of seeded contacts
+    '''
+    from src.database.models import Base, Record, User, birthday_key
+    from src.services.auth import auth_service
+
+    async with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            await conn.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gin'))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    now = datetime.now()
+    async with sessionmaker() as db:
+        user = User(username='bench', email=EMAIL, pwd_hash=await auth_service.get_pasword_hash(PASSWORD), confirmed=True)
+        db.add(user)
+        await db.flush()
+        for start in range(0, size, SEED_CHUNK):
+            rows = [contact(rng, number) for number in range(start, min(size, start + SEED_CHUNK))]
+            await db.execute(insert(Record), [
+                {**row, 'birthday_md': birthday_key(row['birthday']), 'created_at': now, 'updated_at': now,
+                 'user_id': user.id} for row in rows])
+        await db.commit()
+        result = await db.execute(select(func.min(Record.id), func.max(Record.id)))
+        return tuple(result.one())
+
+
+class Bench():
+    '''
+    Requests of every end-point, state (tokens, created contacts) is shared between them
+    '''
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, size: int, ids: tuple[int, int]):
+        self.client = client
+        self.rng = rng
+        self.size = size
+        self.ids = ids
+        self.created: list[int] = []
+        self.headers: dict = {}
+        self.refresh_token = ''
+
+    async def authorize(self) -> None:
+        tokens = (await self.login()).json()
+        self.headers = {'Authorization': f'Bearer {tokens["access_token"]}'}
+        self.refresh_token = tokens['refresh_token']
+
+    def body(self) -> dict:
+        row = contact(self.rng, self.rng.randrange(10 ** 6))
+        return {**row, 'birthday': row['birthday'].isoformat()}
+
+    async def login(self) -> httpx.Response:
+        return await self.client.post('/api/auth/login', data={'username': EMAIL, 'password': PASSWORD})
+
+    async def refresh(self) -> httpx.Response:
+        response = await self.client.get('/api/auth/refresh', headers={'Authorization': f'Bearer {self.refresh_token}'})
+        if response.status_code == 200:
+            self.refresh_token = response.json()['refresh_token']
+        return response
+
+    async def list(self) -> httpx.Response:
+        offset = self.rng.randrange(max(1, self.size - 50))
+        return await self.client.get('/api/contacts/', params={'limit': 50, 'offset': offset}, headers=self.headers)
+
+    async def query(self) -> httpx.Response:
+        if self.rng.random() < 0.5:
+            params = {'first_name': self.rng.choice(FIRST_NAMES)[:3].lower(), 'limit': 50}
+        else:
+            params = {'days_to_birthday': 7, 'limit': 50}
+        return await self.client.get('/api/contacts/query', params=params, headers=self.headers)
+
+    async def get(self) -> httpx.Response:
+        return await self.client.get(f'/api/contacts/{self.rng.randint(*self.ids)}', headers=self.headers)
+
+    async def create(self) -> httpx.Response:
+        response = await self.client.post('/api/contacts/', json=self.body(), headers=self.headers)
+        if response.status_code == 201:
+            self.created.append(response.json()['id'])
+        return response
+
+    async def update(self) -> httpx.Response:
+        rec_id = self.rng.choice(self.created)
+        return await self.client.put(f'/api/contacts/{rec_id}', json=self.body(), headers=self.headers)
+
+    async def delete(self) -> httpx.Response:
+        return await self.client.delete(f'/api/contacts/{self.created.pop()}', headers=self.headers)
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    '''
+    Nearest-rank percentile of sorted latencies.
+    '''
+    return latencies[max(0, min(len(latencies) - 1, round(q / 100 * len(latencies)) - 1))]
+
+
+async def measure(request, count: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await request()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'requests': count, 'errors': errors, 'throughput_rps': round(count / elapsed, 1),
+            **{f'p{q}_ms': round(percentile(latencies, q) * 1000, 2) for q in (50, 95, 99)}}
+
+
+async def run_size(app, engine, sessionmaker, size: int, args) -> dict:
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    ids = await seed(engine, sessionmaker, size, rng)
+    print(f'seeded {size:,} contacts in {time.perf_counter() - started:.1f}s')
+    await database.rds_cache.flushdb()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        bench = Bench(client, rng, size, ids)
+        await bench.authorize()
+        results = {}
+        for name in ENDPOINTS:
+            # password hashing makes login and refresh slow, refresh tokens rotate so refresh runs sequentially
+            count = args.auth_requests if name in ('login', 'refresh') else args.requests
+            concurrency = 1 if name == 'refresh' else args.concurrency
+            if name == 'refresh':
+                await bench.authorize()
+            results[name] = await measure(getattr(bench, name), count, concurrency)
+            print(f'{size:>9,} {name:>8}: {results[name]["throughput_rps"]:>9,.1f} req/s '
+                  f'p50 {results[name]["p50_ms"]:>8.2f} p95 {results[name]["p95_ms"]:>8.2f} '
+                  f'p99 {results[name]["p99_ms"]:>8.2f} ms, errors {results[name]["errors"]}')
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> None:
+    install_redis(args.redis_url)
+    from main import app
+    from src.conf.config import route_rst
+    from src.database.db import get_db
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_url = args.db_url or f'sqlite+aiosqlite:///{os.path.join(directory, "bench.db")}'
+        connect_args = {'timeout': 30} if db_url.startswith('sqlite') else {}
+        engine = create_async_engine(db_url, connect_args=connect_args)
+        sessionmaker = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+        async def bench_get_db():
+            session = database.LazySession(sessionmaker)
+            try:
+                yield session
+            finally:
+                await session.close()
+
+        app.dependency_overrides[get_db] = bench_get_db
+        database.sessionmanager._sessionmaker = sessionmaker
+        route_rst.rate_limiter.enabled = False
+
+        results = {}
+        async with app.router.lifespan_context(app):
+            for size in args.sizes:
+                results[str(size)] = await run_size(app, engine, sessionmaker, size, args)
+        await engine.dispose()
+
+    report = {
+        'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                 'python': platform.python_version(), 'database': engine.dialect.name,
+                 'redis': 'redis' if args.redis_url else 'fakeredis', 'seed': args.seed,
+                 'requests': args.requests, 'auth_requests': args.auth_requests, 'concurrency': args.concurrency},
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000], help='contacts of the account')
+    parser.add_argument('--requests', type=int, default=200, help='requests per end-point')
+    parser.add_argument('--auth-requests', type=int, default=20, help='requests of login and refresh')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight')
+    parser.add_argument('--seed', type=int, default=42, help='seed of generated data and requests')
+    parser.add_argument('--db-url', default=None, help='async SQLAlchemy URL, temporary SQLite file by default')
+    parser.add_argument('--redis-url', default=None, help='Redis URL, fakeredis by default')
+    parser.add_argument('--output', default='bench_endpoints.json', help='JSON file of results')
+    args = parser.parse_args()
+    asyncio.run(main(args))
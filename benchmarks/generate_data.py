@@ -0,0 +1,202 @@
+'''
+Synthetic users and contacts for load and scale testing.
+
+Contacts per user follow heavy-tailed (Pareto) distribution, so a few accounts hold most
+of the rows. Birthdays are spread over all days of the year, first names, last name
+prefixes and e-mail domains come from shared weighted pools, so search and birthday
+filters select realistic fractions of rows. Output depends only on --seed and sizes.
+
+Rows are written by COPY on Postgres (asyncpg) and by batched INSERT on other databases.
+On Postgres secondary indexes of 'records' are dropped during the load and rebuilt after it.
+
+All users get password --password (one bcrypt hash shared by all of them) and are confirmed.
+
+Usage:
+    python -m benchmarks.generate_data --users 10000 --contacts 10000000 --seed 1
+    python -m benchmarks.generate_data --db-url sqlite+aiosqlite:///load.db --reset --contacts 100000
+'''
+import argparse
+import asyncio
+import bisect
+import itertools
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from src.database.models import Base, Record, User, birthday_key
+
+FIRST_NAMES = (
+    'Oleksandr', 'Olena', 'Andrii', 'Anna', 'Ivan', 'Iryna', 'Mykola', 'Maria', 'Serhii', 'Svitlana',
+    'Dmytro', 'Daria', 'Volodymyr', 'Viktoria', 'Yurii', 'Yulia', 'Taras', 'Tetiana', 'Petro', 'Polina',
+    'Bohdan', 'Kateryna', 'Roman', 'Oksana', 'Vasyl', 'Nataliia', 'Maksym', 'Larysa', 'Artem', 'Sofia',
+    'John', 'Jane', 'Michael', 'Emily', 'David', 'Sarah', 'James', 'Laura', 'Robert', 'Linda',
+)
+LAST_NAME_PREFIXES = ('Kov', 'Shev', 'Bond', 'Tkach', 'Kravch', 'Melnyk', 'Oliin', 'Lysen', 'Mart', 'Hnat',
+                      'Pavl', 'Sav', 'Rud', 'Moroz', 'Kuz', 'Pon', 'Vasyl', 'Kost', 'Hrych', 'Lev')
+LAST_NAME_SUFFIXES = ('enko', 'chuk', 'ar', 'yk', 'iv', 'ovych', 'ets', 'uk', 'ak', 'ko')
+LAST_NAMES = tuple(prefix + suffix for prefix in LAST_NAME_PREFIXES for suffix in LAST_NAME_SUFFIXES)
+DOMAINS = ('gmail.com', 'ukr.net', 'meta.ua', 'i.ua', 'outlook.com', 'yahoo.com', 'proton.me', 'example.com')
+NOTES = ('Colleague', 'Friend from school', 'Neighbour', 'Met at conference', 'Family', 'Client',
+         'Dentist', 'Gym', 'Old friend', 'Call back')
+
+COLUMNS = ('first_name', 'last_name', 'email', 'birthday', 'birthday_md', 'notes', 'created_at', 'updated_at', 'user_id')
+BIRTHDAY_FIRST = date(1940, 1, 1).toordinal()
+BIRTHDAY_SPAN = date(2012, 12, 31).toordinal() - BIRTHDAY_FIRST
+CREATED_SPAN = 3 * 365 * 24 * 3600
+
+
+def zipf_weights(size: int, exponent: float = 1.0) -> list[float]:
+    '''
+    Cumulative Zipf weights: value of rank r is chosen with probability ~ 1 / r ** exponent.
+    '''
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+FIRST_WEIGHTS = zipf_weights(len(FIRST_NAMES))
+LAST_WEIGHTS = zipf_weights(len(LAST_NAMES), 0.8)
+DOMAIN_WEIGHTS = zipf_weights(len(DOMAINS), 1.5)
+
+
+def contacts_per_user(users: int, contacts: int, seed: int, alpha: float = 1.2) -> list[int]:
+    '''
+    Splits contacts between users by Pareto distribution.
+
+    Args:
+        users: number of users
+        contacts: total number of contacts
+        seed: random seed
+        alpha: shape of Pareto distribution, lower is more skewed
+    Returns:
+        'list': contacts of every user, sum is equal to contacts
+    '''
+    rng = random.Random(f'{seed}:counts')
+    weights = [rng.paretovariate(alpha) for _ in range(users)]
+    total = sum(weights)
+    counts = [int(contacts * weight / total) for weight in weights]
+    # remainder goes to the largest accounts
+    for index in sorted(range(users), key=lambda index: -weights[index])[:contacts - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+def user_contacts(seed: int, user_index: int, user_id: int, count: int, now: datetime) -> Iterator[tuple]:
+    '''
+    Contacts of one user as tuples of COLUMNS, independent of other users.
+
+    Args:
+        seed: random seed
+        user_index: number of the user
+        user_id: ID of the user in db
+        count: number of contacts
+        now: time of the newest contact
+    Returns:
+        'Iterator': rows of the user
+    '''
+    rng = random.Random(f'{seed}:{user_index}')
+    first_names = rng.choices(FIRST_NAMES, cum_weights=FIRST_WEIGHTS, k=count)
+    last_names = rng.choices(LAST_NAMES, cum_weights=LAST_WEIGHTS, k=count)
+    domains = rng.choices(DOMAINS, cum_weights=DOMAIN_WEIGHTS, k=count)
+    random_ = rng.random
+    for number, first_name, last_name, domain in zip(range(count), first_names, last_names, domains):
+        birthday = date.fromordinal(BIRTHDAY_FIRST + int(random_() * BIRTHDAY_SPAN)) if random_() < 0.8 else None
+        email = f'{first_name[:6].lower()}.{number}@{domain}' if random_() < 0.85 else None
+        notes = NOTES[int(random_() * len(NOTES))] if random_() < 0.6 else None
+        created_at = now - timedelta(seconds=int(random_() * CREATED_SPAN))
+        yield (first_name, last_name if random_() < 0.9 else None, email, birthday,
+               birthday_key(birthday), notes, created_at, created_at, user_id)
+
+
+def rows(seed: int, user_ids: list[int], counts: list[int], now: datetime) -> Iterator[tuple]:
+    for user_index, (user_id, count) in enumerate(zip(user_ids, counts)):
+        yield from user_contacts(seed, user_index, user_id, count, now)
+
+
+def batches(iterable: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+async def insert_users(conn: AsyncConnection, users: int, seed: int, pwd_hash: str) -> list[int]:
+    '''
+    Adds confirmed users 'load<N>@<domain>' and returns their IDs in order of N.
+    '''
+    rng = random.Random(f'{seed}:users')
+    ids = []
+    for batch in batches(iter(range(users)), 10000):
+        result = await conn.execute(insert(User).returning(User.id, sort_by_parameter_order=True), [
+            {'username': f'load{index}', 'email': f'load{index}@{DOMAINS[bisect.bisect(DOMAIN_WEIGHTS, rng.random() * DOMAIN_WEIGHTS[-1])]}',
+             'pwd_hash': pwd_hash, 'confirmed': True} for index in batch])
+        ids.extend(result.scalars())
+    return ids
+
+
+async def copy_records(conn: AsyncConnection, batch: list[tuple]) -> None:
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(Record.__tablename__, records=batch, columns=COLUMNS)
+
+
+async def insert_records(conn: AsyncConnection, batch: list[tuple]) -> None:
+    await conn.execute(insert(Record), [dict(zip(COLUMNS, row)) for row in batch])
+
+
+async def main(args) -> None:
+    from src.conf.config import config
+    from src.services.auth import auth_service
+
+    engine = create_async_engine(args.db_url or config.DB_URL)
+    copy = engine.dialect.driver == 'asyncpg'
+    indexes = [index for index in Record.__table__.indexes] if copy and not args.keep_indexes else []
+    counts = contacts_per_user(args.users, args.contacts, args.seed)
+    now = datetime(2024, 1, 1) + timedelta(days=args.seed % 365)
+    started = time.perf_counter()
+
+    async with engine.begin() as conn:
+        if args.reset:
+            if engine.dialect.name == 'postgresql':
+                await conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                await conn.execute(text('CREATE EXTENSION IF NOT EXISTS btree_gin'))
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        user_ids = await insert_users(conn, args.users, args.seed, await auth_service.get_pasword_hash(args.password))
+        for index in indexes:
+            await conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+
+    write = copy_records if copy else insert_records
+    written = 0
+    for batch in batches(rows(args.seed, user_ids, counts, now), args.batch):
+        # every batch is committed, so long load does not hold one huge transaction
+        async with engine.begin() as conn:
+            await write(conn, batch)
+        written += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f'\r{written:>12,} / {args.contacts:,} contacts, {written / elapsed:>10,.0f} rows/s', end='', flush=True)
+    print()
+
+    async with engine.begin() as conn:
+        for index in indexes:
+            print(f'building index {index.name}')
+            await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn))
+        if engine.dialect.name == 'postgresql':
+            await conn.execute(text(f'ANALYZE {User.__tablename__}, {Record.__tablename__}'))
+    await engine.dispose()
+    print(f'{args.users:,} users, {args.contacts:,} contacts (largest account {max(counts, default=0):,}) '
+          f'in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000, help='users to create')
+    parser.add_argument('--contacts', type=int, default=1000000, help='contacts of all users')
+    parser.add_argument('--seed', type=int, default=1, help='random seed, same seed gives same data')
+    parser.add_argument('--batch', type=int, default=100000, help='contacts per COPY or INSERT')
+    parser.add_argument('--password', default='secret78', help='password of all users')
+    parser.add_argument('--db-url', default=None, help='async SQLAlchemy URL, DB_URL by default')
+    parser.add_argument('--reset', action='store_true', help='drop and create all tables first')
+    parser.add_argument('--keep-indexes', action='store_true', help='do not drop indexes of records during COPY')
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,90 @@
+'''
+Rows per second and memory per row of contact list reads: ORM 'Record' entities
+(with joined-eager user) vs Core select mapped into 'RecordRow' (CONTACTS_CORE_READS).
+
+Runs against in-memory SQLite, so it measures Python side cost of the read path.
+
+Usage:
+    python -m benchmarks.read_contacts --rows 10000 --repeat 10
+'''
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, Record, RecordRow, User
+
+
+async def read_orm(db, user_id: int) -> list:
+    result = await db.execute(select(Record).filter(Record.user_id == user_id).order_by(Record.id))
+    records = result.scalars().all()
+    db.expunge_all()
+    return records
+
+
+async def read_core(db, user_id: int) -> list:
+    result = await db.execute(select(*RecordRow.columns()).filter(Record.user_id == user_id).order_by(Record.id))
+    return [RecordRow(*row) for row in result.tuples()]
+
+
+async def seed(sessionmaker, rows: int) -> int:
+    now = datetime.now()
+    async with sessionmaker() as db:
+        user = User(username='bench', email='bench@example.com', pwd_hash='x', confirmed=True)
+        db.add(user)
+        await db.flush()
+        await db.execute(insert(Record), [
+            {'first_name': f'First{i}', 'last_name': f'Last{i}', 'email': f'user{i}@example.com',
+             'birthday': date(1990, 1, 1) + timedelta(days=i % 365), 'notes': f'Note about contact {i}',
+             'created_at': now, 'updated_at': now, 'user_id': user.id}
+            for i in range(rows)])
+        await db.commit()
+        return user.id
+
+
+async def measure(read, sessionmaker, user_id: int, rows: int, repeat: int) -> tuple[float, float]:
+    async with sessionmaker() as db:
+        await read(db, user_id)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            await read(db, user_id)
+        rate = rows * repeat / (time.perf_counter() - start)
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = await read(db, user_id)
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del result
+    return rate, retained / rows
+
+
+async def main(rows: int, repeat: int) -> None:
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:', poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    user_id = await seed(sessionmaker, rows)
+
+    results = {}
+    for name, read in (('orm', read_orm), ('core', read_core)):
+        results[name] = await measure(read, sessionmaker, user_id, rows, repeat)
+        print(f'{name:>5}: {results[name][0]:>10,.0f} rows/s {results[name][1]:>8,.0f} bytes/row')
+    print(f'speedup: {results["core"][0] / results["orm"][0]:.1f}x, '
+          f'memory: {results["core"][1] / results["orm"][1]:.2f}x')
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='contacts to read per query')
+    parser.add_argument('--repeat', type=int, default=10, help='queries to run')
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,79 @@
+'''
+Messages per second delivered to local SMTP server (aiosmtpd): connection per message
+(previous send_email behaviour) vs MailSender with persistent connections and batching.
+
+Usage:
+    python -m benchmarks.send_mail --messages 500 --pool 2 --batch 50
+'''
+import argparse
+import asyncio
+import socket
+import time
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+from src.conf.config import config
+from src.services.email import MailSender
+
+
+class CountingSink(Sink):
+    received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def connection_per_message(sender: MailSender, messages: list) -> None:
+    for message in messages:
+        smtp = sender.connection()
+        await smtp.connect()
+        await smtp.send_message(message)
+        await smtp.quit()
+
+
+async def mail_sender(sender: MailSender, messages: list) -> None:
+    for message in messages:
+        await sender.send(message)
+    await sender.close()
+
+
+async def main(messages: int, pool: int, batch: int) -> None:
+    handler = CountingSink()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    settings = config.model_copy(update={'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': controller.port,
+                                         'MAIL_SSL_TLS': False, 'MAIL_STARTTLS': False, 'USE_CREDENTIALS': False,
+                                         'MAIL_POOL_SIZE': pool, 'MAIL_BATCH_SIZE': batch})
+    results = {}
+    try:
+        for name, send in (('per_message', connection_per_message), ('mail_sender', mail_sender)):
+            sender = MailSender(settings)
+            letters = [sender.message(f'user{i}@example.com', 'Confirm your e-mail', 'email_confirmation.html',
+                                      fullname=f'User {i}', host='http://localhost:8000/', token='token')
+                       for i in range(messages)]
+            handler.received = 0
+            start = time.perf_counter()
+            await send(sender, letters)
+            results[name] = messages / (time.perf_counter() - start)
+            assert handler.received == messages, handler.received
+            print(f'{name:>15}: {results[name]:>10,.0f} messages/s')
+    finally:
+        controller.stop()
+    print(f'{"speedup":>15}: {results["mail_sender"] / results["per_message"]:>10.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500, help='messages to send')
+    parser.add_argument('--pool', type=int, default=2, help='MAIL_POOL_SIZE')
+    parser.add_argument('--batch', type=int, default=50, help='MAIL_BATCH_SIZE')
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.pool, args.batch))
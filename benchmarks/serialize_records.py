@@ -0,0 +1,65 @@
+'''
+Rows per second serialized by list endpoints: FastAPI response_model path
+(validation of ORM records + standard json encoder) vs fast path (FAST_JSON).
+
+Usage:
+    python -m benchmarks.serialize_records --rows 50 --repeat 2000
+'''
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.database.models import Record
+from src.database.schemas import RecordResponseSchema
+from src.services.fast_json import RecordsJSONResponse
+
+
+def make_records(rows: int) -> list[Record]:
+    now = datetime.now()
+    return [
+        Record(id=i, first_name=f'First{i}', last_name=f'Last{i}', email=f'user{i}@example.com',
+               birthday=date(1990, 1, 1) + timedelta(days=i % 365), notes=f'Note about contact {i}',
+               created_at=now, updated_at=now, user_id=1)
+        for i in range(1, rows + 1)
+    ]
+
+
+async def response_model_path(field, records) -> bytes:
+    content = await serialize_response(field=field, response_content=records, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fast_path(field, records) -> bytes:
+    return RecordsJSONResponse(records).body
+
+
+async def measure(serializer, field, records, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await serializer(field, records)
+    return len(records) * repeat / (time.perf_counter() - start)
+
+
+async def main(rows: int, repeat: int) -> None:
+    field = create_response_field(name='Response', type_=list[RecordResponseSchema])
+    records = make_records(rows)
+    assert await response_model_path(field, records) == await fast_path(field, records)
+
+    results = {}
+    for name, serializer in (('response_model', response_model_path), ('fast_json', fast_path)):
+        results[name] = await measure(serializer, field, records, repeat)
+        print(f'{name:>15}: {results[name]:>12,.0f} rows/s')
+    print(f'{"speedup":>15}: {results["fast_json"] / results["response_model"]:>12.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50, help='contacts per response (page size)')
+    parser.add_argument('--repeat', type=int, default=2000, help='responses to serialize')
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -1,24 +1,45 @@
-from fastapi import FastAPI, Depends
-from fastapi_limiter import FastAPILimiter
+from fastapi import FastAPI, Depends, Header, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 import uvicorn
-from contextlib import contextmanager
+import asyncio
+import contextlib
+import secrets
+from contextlib import asynccontextmanager
 
-from src.routes import contacts, users
-from src.conf.config import route_rst
-from src.database.db import rds_cache
+from src.routes import contacts, users, jobs
+from src.conf.config import route_rst, config
+from src.conf import messages
+from src.database.db import rds_cache, sessionmanager
+from src.services.cache import user_cache
+from src.services.auth import auth_service
+from src.services.avatars import avatar_service
+from src.services.email import mail_sender
+from src.services.metrics import metrics, app_metrics, MetricsMiddleware, CONTENT_TYPE
 
 
 # replace depricated @app.on_event('startup')
-@contextmanager
+@asynccontextmanager
 async def lifespan(app: FastAPI):
-    await FastAPILimiter.init(rds_cache)
+    await route_rst.rate_limiter.init(rds_cache)
+    await auth_service.calibrate_hashing()
+    user_cache_listener = asyncio.create_task(user_cache.listen())
+    mail_sender.start()
     yield
-app = FastAPI(lifespan=lifespan)
+    user_cache_listener.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await user_cache_listener
+    await route_rst.rate_limiter.close()
+    await sessionmanager.close()
+    await avatar_service.close()
+    await mail_sender.close()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(users.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
+app.include_router(jobs.router, prefix='/api')
+if config.AVATAR_STORAGE == 'local':
+    app.mount(config.AVATAR_BASE_URL, StaticFiles(directory=config.AVATAR_LOCAL_DIR, check_dir=False), name='avatars')
 
 origins = ["http://localhost:3000"]
 app.add_middleware(
@@ -26,12 +47,26 @@ app.add_middleware(
     allow_origins = origins, 
     allow_credentials=True,
     allow_methods = ["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=[contacts.NEXT_CURSOR_HEADER, 'ETag']
     )
 
+if config.METRICS_ENABLED:
+    metrics.instrument_db()
+    metrics.instrument_redis(rds_cache)
+    metrics.register(app_metrics)
+    # outermost middleware, latency includes CORS and rate limiter
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    @app.get('/metrics', include_in_schema=False)
+    async def get_metrics(authorization: str | None = Header(default=None)):
+        if config.METRICS_TOKEN and not secrets.compare_digest((authorization or '').encode(), f'Bearer {config.METRICS_TOKEN}'.encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.METRICS_TOKEN_INVALID)
+        return Response(metrics.render(), media_type=CONTENT_TYPE)
+
 # @app.on_event('startup')
 # async def startup():
-#     await FastAPILimiter.init(rds_cache)
+#     await route_rst.rate_limiter.init(rds_cache)
 
 @app.get('/', dependencies=[Depends(route_rst.rate_limiter)])
 def index():
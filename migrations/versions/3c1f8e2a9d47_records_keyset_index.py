@@ -0,0 +1,26 @@
+"""records keyset pagination index
+
+Revision ID: 3c1f8e2a9d47
+Revises: b0d2f5529960
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f8e2a9d47'
+down_revision: Union[str, None] = 'b0d2f5529960'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_records_user_id_id', 'records', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_records_user_id_id', table_name='records')
@@ -0,0 +1,37 @@
+"""records trigram search indexes
+
+Revision ID: 5e7a0b4c2f18
+Revises: 3c1f8e2a9d47
+Create Date: 2026-10-18 11:03:27.918230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7a0b4c2f18'
+down_revision: Union[str, None] = '3c1f8e2a9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ('first_name', 'last_name', 'email', 'notes')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    for column in SEARCH_COLUMNS:
+        op.create_index(f'ix_records_{column}_trgm', 'records', ['user_id', column], unique=False,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f'ix_records_{column}_trgm', table_name='records')
@@ -0,0 +1,34 @@
+"""records birthday key
+
+Revision ID: 8d24c6f1e0b3
+Revises: 5e7a0b4c2f18
+Create Date: 2026-10-18 12:20:54.301877
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d24c6f1e0b3'
+down_revision: Union[str, None] = '5e7a0b4c2f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('records', sa.Column('birthday_md', sa.SmallInteger(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('UPDATE records SET birthday_md = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) '
+                   'WHERE birthday IS NOT NULL')
+    else:
+        op.execute("UPDATE records SET birthday_md = CAST(strftime('%m%d', birthday) AS INTEGER) "
+                   "WHERE birthday IS NOT NULL")
+    op.create_index('ix_records_user_id_birthday_md', 'records', ['user_id', 'birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_records_user_id_birthday_md', table_name='records')
+    op.drop_column('records', 'birthday_md')
@@ -1,14 +1,37 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import EmailStr, ConfigDict, field_validator
-from fastapi_limiter.depends import RateLimiter
+from src.services.rate_limiter import HybridRateLimiter, RatePolicy
 
 class Route_restrictions():
-    def __init__(self):
+    '''
+    Rate limit policies: default one, per route ('METHOD /path/{param}') and per user e-mail.
+    User policy has priority over route policy.
+    '''
+    def __init__(self, settings: 'Settings'):
         self.TIME_SLOT_SECONDS = 5
         self.REQUESTS_PER_TIME_SLOT = 2
-        self.rate_limiter = RateLimiter(times=self.REQUESTS_PER_TIME_SLOT,
-                    seconds=self.TIME_SLOT_SECONDS)
-        self.restict_descr = f'No more than {self.REQUESTS_PER_TIME_SLOT} requests per {self.TIME_SLOT_SECONDS} seconds.'
+        self.default_policy = RatePolicy(self.REQUESTS_PER_TIME_SLOT, self.TIME_SLOT_SECONDS)
+        self.route_policies = {route: RatePolicy.parse(policy) for route, policy in settings.RATE_LIMIT_ROUTES.items()}
+        self.user_policies = {user: RatePolicy.parse(policy) for user, policy in settings.RATE_LIMIT_USERS.items()}
+        self.rate_limiter = HybridRateLimiter(self.policy, secret=settings.SECRET_JWT, algorithm=settings.ALGORITHM_JWT,
+                                              sync_interval=settings.RATE_LIMIT_SYNC_SECONDS)
+        self.restict_descr = str(self.default_policy)
+
+    def policy(self, route: str, identity: str) -> RatePolicy:
+        '''
+        Selects policy for the request.
+
+        Args:
+            route: route of the request, e.g. 'GET /api/contacts/{rec_id}'
+            identity: 'user:<e-mail>' or 'ip:<address>'
+        Returns:
+            obj: 'RatePolicy'
+        '''
+        kind, _, name = identity.partition(':')
+        if kind == 'user' and name in self.user_policies:
+            return self.user_policies[name]
+        return self.route_policies.get(route, self.default_policy)
 
 class Settings(BaseSettings):
     MAIL_USERNAME: EmailStr
@@ -21,10 +44,25 @@ class Settings(BaseSettings):
     MAIL_SSL_TLS: bool
     USE_CREDENTIALS: bool
     VALIDATE_CERTS: bool
+    # persistent SMTP connections, messages sent per connection in one batch, idle seconds before disconnect
+    MAIL_POOL_SIZE: int = 2
+    MAIL_BATCH_SIZE: int = 50
+    MAIL_IDLE_TIMEOUT: float = 30
 
     SECRET_JWT: str
     ALGORITHM_JWT: str
 
+    # JSON objects of policies 'times/seconds', e.g. {"POST /api/auth/login": "5/60"}
+    RATE_LIMIT_ROUTES: dict[str, str] = {}
+    RATE_LIMIT_USERS: dict[str, str] = {}
+    RATE_LIMIT_SYNC_SECONDS: float = 1.0
+
+    PWD_HASH_WORKERS: int = 4
+    PWD_HASH_QUEUE: int = 64
+    PWD_HASH_TARGET_MS: int = 250
+    PWD_MIN_ROUNDS: int = 10
+    PWD_MAX_ROUNDS: int = 15
+
     POSTGRES_DB: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
@@ -32,15 +70,59 @@ class Settings(BaseSettings):
     POSTGRES_PORT: int
 
     DB_URL: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # transaction pooling of PgBouncer does not keep prepared statements between transactions
+    DB_PGBOUNCER: bool = False
+    # request sessions commit read-only transactions after every SELECT to give the connection back early
+    DB_RELEASE_AFTER_READ: bool = True
 
     REDIS_HOST: str
     REDIS_PORT: int
     # REDIS_PASSWORD: str | None
 
+    # serialize contact lists with orjson, without response_model validation
+    FAST_JSON: bool = False
+    # read contact lists with Core select into RecordRow instead of ORM 'Record'
+    CONTACTS_CORE_READS: bool = False
+
+    CONTACTS_CACHE_TTL: int = 60
+    USER_CACHE_TTL: int = 900
+    USER_CACHE_LOCAL_TTL: int = 30
+    USER_CACHE_LOCAL_SIZE: int = 10000
+
+    # 'cloudinary' or 'local' (files in AVATAR_LOCAL_DIR served at AVATAR_BASE_URL)
+    AVATAR_STORAGE: Literal['cloudinary', 'local'] = 'cloudinary'
+    AVATAR_LOCAL_DIR: str = 'avatars'
+    AVATAR_BASE_URL: str = '/avatars'
+    AVATAR_SIZE: int = 250
+    AVATAR_MAX_BYTES: int = 5 * 1024 * 1024
+    AVATAR_WORKERS: int = 2
+
     CLOUDINARY_NAME: str
     CLOUDINARY_API_KEY: str
     CLOUDINARY_API_SECRET: str
 
+    # checks of @query_budget of repository functions: 'off', 'warn' (print report) or 'raise'
+    QUERY_BUDGET_MODE: Literal['off', 'warn', 'raise'] = 'off'
+
+    # /metrics end-point in Prometheus format, off by default: it shows traffic, pool and cache stats.
+    # If METRICS_TOKEN is set, scrapers must send 'Authorization: Bearer <token>'
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: str = ''
+
+    # confirmation mails and avatars are processed by worker process (python -m src.worker)
+    JOB_QUEUE: bool = False
+    JOB_STREAM: str = 'jobs'
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_BACKOFF_BASE: float = 2
+    JOB_BACKOFF_MAX: float = 300
+    JOB_CLAIM_IDLE: float = 60
+    JOB_CONCURRENCY: int = 10
 
     model_config = ConfigDict(extra='ignore', env_file='.env', env_file_encoding='utf-8')
 
@@ -52,4 +134,4 @@ class Settings(BaseSettings):
         return value
 
 config = Settings()
-route_rst = Route_restrictions()
+route_rst = Route_restrictions(config)
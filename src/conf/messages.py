@@ -3,7 +3,17 @@ EMAIL_INVALID = 'Invalid e-mail.'
 EMAIL_NOT_CONFIRMED = 'E-mail not confirmed.'
 PASSWORD_INVALID = 'Invalid password.'
 REFRESH_TOKEN_INVALID = 'Database error.'
+CURSOR_INVALID = 'Invalid cursor.'
+CURSOR_WITH_RANKED = 'Cursor can not be used with ranked search.'
+BIRTHDAY_RANGE_INVALID = 'Both birthday_from and birthday_to are required, birthday_from must not be after birthday_to.'
 
 EMAIL_CONFIRMED_SUCCESS = 'E-mail confirmed'
 EMAIL_ALREADY_CONFIRMED = 'E-mail already confirmed'
 VERIFICATION_ERROR = 'Verification error'
+SERVER_BUSY = 'Server is busy, try again later.'
+CONTACT_MODIFIED = 'Contact was modified, reload it and retry.'
+FIELDS_INVALID = 'Unknown field requested.'
+AVATAR_INVALID = 'File is not a supported image.'
+AVATAR_TOO_LARGE = 'Image is too large.'
+JOB_QUEUE_UNAVAILABLE = 'Job queue is not available.'
+METRICS_TOKEN_INVALID = 'Invalid metrics token.'
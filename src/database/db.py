@@ -1,17 +1,234 @@
 import redis.asyncio as redis
 import contextlib
-from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
-from src.conf.config import config
+import time
+import uuid
+from sqlalchemy import Select, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from src.conf.config import config, Settings
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    '''
+    Connection pool which measures how long checkouts wait for a connection
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def stats(self) -> dict:
+        '''
+        Pool usage
+
+        Returns:
+            'dict': pool size, connections in use, saturation (in use / max connections),
+            checkouts count, average and max checkout wait in ms, checkout timeouts
+        '''
+        capacity = self.size() + max(self._max_overflow, 0)
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'overflow': max(self.overflow(), 0),
+            'saturation': round(self.checkedout() / capacity, 3) if capacity else 0,
+            'checkouts': self.checkouts,
+            'wait_avg_ms': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+            'wait_max_ms': round(self.wait_max * 1000, 3),
+            'timeouts': self.timeouts,
+        }
+
+
+def engine_options(url: str, settings: Settings) -> dict:
+    '''
+    Engine parameters for the database URL
+
+    Args:
+        url: database URL
+        settings: application settings with DB_* pool parameters
+    Returns:
+        'dict': keyword arguments of create_async_engine
+    '''
+    driver = make_url(url).get_driver_name()
+    if driver != 'asyncpg':
+        # SQLite in-memory databases use their dialect's default pool
+        return {'pool_pre_ping': settings.DB_POOL_PRE_PING}
+
+    connect_args = {
+        # asyncpg cache of prepared statements per connection
+        'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+        # SQLAlchemy cache of asyncpg prepared statements per connection
+        'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    if settings.DB_PGBOUNCER:
+        # statements can't be reused on another server connection, names must not clash
+        connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0,
+                            prepared_statement_name_func=lambda: f'__asyncpg_{uuid.uuid4()}__')
+    return {
+        'poolclass': InstrumentedPool,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+class LazySession():
+    '''
+    Request session which is created on first use and gives its connection back to the pool early.
+
+    AsyncSession checks out a connection on the first statement and keeps it until the end
+    of the request, also while the handler hashes passwords, calls Redis or serializes the response.
+    After a plain SELECT, when the session has no pending changes, writes or row locks,
+    the transaction is committed at once, so the connection returns to the pool and the next
+    statement checks out a new one. Commit does not expire loaded objects (expire_on_commit=False).
+    Every other attribute is proxied to the AsyncSession, which is not created at all
+    if the handler does not use the database, e.g. the user is served from cache.
+    '''
+    def __init__(self, sessionmaker: async_sessionmaker, release_after_read: bool = True, stats: dict | None = None):
+        self._sessionmaker = sessionmaker
+        self._session: AsyncSession | None = None
+        self._release_after_read = release_after_read
+        # writes, row locks or open streams keep the transaction until commit or rollback
+        self._holding = False
+        self._stats = stats if stats is not None else {'sessions': 0, 'opened': 0, 'released': 0}
+        self._stats['sessions'] += 1
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._sessionmaker()
+            self._stats['opened'] += 1
+        return self._session
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    @staticmethod
+    def is_read(statement) -> bool:
+        return isinstance(statement, Select) and statement._for_update_arg is None
+
+    async def release(self) -> bool:
+        '''
+        Ends read-only transaction, connection goes back to the pool
+
+        Returns:
+            bool: True if the connection was released
+        '''
+        session = self._session
+        if (session is None or self._holding or not session.in_transaction()
+                or session.new or session.dirty or session.deleted):
+            return False
+        await session.commit()
+        self._stats['released'] += 1
+        return True
+
+    async def _run(self, method: str, statement, *args, **kwargs):
+        read = self.is_read(statement)
+        if not read:
+            self._holding = True
+        result = await getattr(self.session, method)(statement, *args, **kwargs)
+        # results of AsyncSession are buffered, rows stay readable without the connection
+        if read and self._release_after_read:
+            await self.release()
+        return result
+
+    async def execute(self, statement, *args, **kwargs):
+        return await self._run('execute', statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await self._run('scalar', statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        return await self._run('scalars', statement, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        self._holding = True
+        return await self.session.stream(statement, *args, **kwargs)
+
+    async def stream_scalars(self, statement, *args, **kwargs):
+        self._holding = True
+        return await self.session.stream_scalars(statement, *args, **kwargs)
+
+    async def connection(self, *args, **kwargs):
+        self._holding = True
+        return await self.session.connection(*args, **kwargs)
+
+    async def commit(self) -> None:
+        if self._session is not None:
+            await self._session.commit()
+        self._holding = False
+
+    async def rollback(self) -> None:
+        if self._session is not None:
+            await self._session.rollback()
+        self._holding = False
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        self._holding = False
 
 
 class DatabaseSessionManager():
     '''
     initialize parameters of connection to database
     '''
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url=url)
+    def __init__(self, url: str, settings: Settings = config):
+        self._engine: AsyncEngine | None = create_async_engine(url=url, **engine_options(url, settings))
+        # rows returned by writes stay usable after commit without reload
         self._sessionmaker: async_sessionmaker = async_sessionmaker(
-            autoflush=False, autocommit=False, bind=self._engine)
+            autoflush=False, autocommit=False, expire_on_commit=False, bind=self._engine)
+        self._release_after_read = settings.DB_RELEASE_AFTER_READ
+        self._lazy_stats = {'sessions': 0, 'opened': 0, 'released': 0}
+
+    def pool_stats(self) -> dict:
+        '''
+        Usage of the connection pool
+
+        Returns:
+            'dict': pool metrics, empty if pool is not instrumented
+        '''
+        pool = self._engine.pool if self._engine is not None else None
+        return pool.stats() if isinstance(pool, InstrumentedPool) else {}
+
+    def session_stats(self) -> dict:
+        '''
+        Usage of request sessions
+
+        Returns:
+            'dict': request sessions, sessions which were used (created),
+            connections released early after reads
+        '''
+        return dict(self._lazy_stats)
+
+    async def close(self):
+        '''
+        Closes pooled connections, the engine opens new ones if used again
+        '''
+        if self._engine is not None:
+            await self._engine.dispose()
 
     @contextlib.asynccontextmanager
     async def session(self):
@@ -35,17 +252,39 @@ class DatabaseSessionManager():
         finally:
             await session.close()
 
+    @contextlib.asynccontextmanager
+    async def lazy_session(self):
+        '''
+        Creates session of a request, see LazySession
+
+        Yelds:
+            session: 'LazySession' instance
+        Raises:
+            Exception: If session parameters are not initialized or connection to database fails.
+        '''
+        if self._sessionmaker is None:
+            raise Exception('db.py - Session is not initialized')
+        session = LazySession(self._sessionmaker, self._release_after_read, self._lazy_stats)
+        try:
+            yield session
+        except Exception as err:
+            await session.rollback()
+            print('Error in db.py')
+            raise
+        finally:
+            await session.close()
+
 sessionmanager = DatabaseSessionManager(config.DB_URL)
 
 
 async def get_db():
     '''
-    manage session coonection to database
+    manage session coonection to database, session is created only if the request uses it
 
     Yelds:
-        session: session instance
+        session: 'LazySession' instance
     '''
-    async with sessionmanager.session() as session:
+    async with sessionmanager.lazy_session() as session:
         yield session
 
 rds_cache = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=0,
@@ -1,10 +1,28 @@
 # from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Integer, String, Boolean, DateTime, func, Date, ForeignKey
-from sqlalchemy.orm import Mapped, mapped_column, relationship, declarative_base
+from dataclasses import dataclass, fields as dataclass_fields
+from datetime import date, datetime
+from sqlalchemy import Integer, SmallInteger, String, Boolean, DateTime, func, Date, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column, relationship, backref, declarative_base, validates
 
 Base = declarative_base()
 
 
+def birthday_key(birthday: date | str | None) -> int | None:
+    '''
+    Converts birthday to year independent sortable key MMDD, e.g. 1231 for 31 December.
+
+    Args:
+        birthday: date of birth or its ISO string
+    Returns:
+        'int' | None: month * 100 + day
+    '''
+    if birthday is None:
+        return None
+    if isinstance(birthday, str):
+        birthday = date.fromisoformat(birthday)
+    return birthday.month * 100 + birthday.day
+
+
 # class Record(Base):
 #     __tablename__ = "records"
 #     id = Column(Integer, primary_key=True)
@@ -18,18 +36,54 @@ Base = declarative_base()
 
 class Record(Base):
     __tablename__ = "records"
+    __table_args__ = (
+        # keyset pagination key: WHERE user_id = ? AND id > ? ORDER BY id
+        Index('ix_records_user_id_id', 'user_id', 'id'),
+        Index('ix_records_user_id_birthday_md', 'user_id', 'birthday_md'),
+        # substring search (ILIKE '%x%'), Postgres only: pg_trgm + btree_gin extensions
+        *(Index(f'ix_records_{column}_trgm', 'user_id', column, postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'})
+          for column in ('first_name', 'last_name', 'email', 'notes')),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     first_name: Mapped[str] = mapped_column(
         String(30), nullable=False, index=True)
     last_name: Mapped[str] = mapped_column(String(30), nullable=True)
     email: Mapped[str] = mapped_column(String(30), nullable=True)
     birthday: Mapped[Date] = mapped_column(Date, nullable=True)
+    # birthday_key(birthday), kept in sync by set_birthday
+    birthday_md: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     notes: Mapped[str] = mapped_column(String(150), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[DateTime] = mapped_column(
         DateTime, default=func.now(), onupdate=func.now(), nullable=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="records", lazy="joined")
+    # relationships are never loaded implicitly, call sites which need them load them with explicit options
+    user: Mapped["User"] = relationship("User", backref=backref("records", lazy="raise"), lazy="raise")
+
+    @validates('birthday')
+    def set_birthday(self, key, value):
+        self.birthday_md = birthday_key(value)
+        return value
+
+@dataclass(slots=True)
+class RecordRow():
+    '''
+    Lightweight read-only contact built from Core select row, without ORM instrumentation
+    '''
+    id: int
+    first_name: str
+    last_name: str | None
+    email: str | None
+    birthday: date | None
+    notes: str | None
+    created_at: datetime
+    updated_at: datetime | None
+
+    @classmethod
+    def columns(cls) -> list:
+        return [getattr(Record, field.name) for field in dataclass_fields(cls)]
+
 
 class User(Base):
     __tablename__ = "users"
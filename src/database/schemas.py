@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field, EmailStr, ConfigDict
+from functools import lru_cache
+from pydantic import BaseModel, Field, EmailStr, ConfigDict, create_model
 from datetime import datetime, date
 
 
@@ -28,6 +29,39 @@ class RecordResponseSchema(BaseModel):
     #     from_attributes = True
     model_config = ConfigDict(from_attributes=True)
 
+
+@lru_cache(maxsize=128)
+def record_projection_schema(fields: tuple[str, ...]) -> type[BaseModel]:
+    '''
+    Builds trimmed RecordResponseSchema with only given fields.
+
+    Args:
+        fields: names of RecordResponseSchema fields
+    Returns:
+        'type': pydantic model class
+    '''
+    return create_model('RecordProjectionSchema', __config__=ConfigDict(from_attributes=True),
+                        **{field: (RecordResponseSchema.model_fields[field].annotation, ...) for field in fields})
+
+
+# max number of records in one batch request
+BATCH_SIZE_MAX = 100
+
+
+class RecordPatchSchema(BaseModel):
+    id: int
+    # only fields present in request are updated, first_name can't be cleared
+    first_name: str = Field(default=None, min_length=3, max_length=30)
+    last_name: str | None = Field(default=None, min_length=0, max_length=30)
+    email: EmailStr | None = None
+    birthday: date | None = None
+    notes: str | None = Field(default=None, min_length=0, max_length=150)
+
+
+class BatchDeleteResultSchema(BaseModel):
+    id: int
+    deleted: bool
+
 class UserSchema(BaseModel):
     username: str = Field(min_length=3, max_length=30)
     email: EmailStr
@@ -43,6 +77,15 @@ class UserResponseSchema(BaseModel):
     #     from_attributes = True
     model_config = ConfigDict(from_attributes=True)
 
+class UserCacheSchema(BaseModel):
+    id: int
+    username: str
+    email: str
+    avatar: str | None
+    confirmed: bool | None
+
+    model_config = ConfigDict(from_attributes=True)
+
 class UserDBSchema(BaseModel):
     username: str = Field(min_length=3, max_length=30)
     email: str = Field(min_length=3, max_length=30)
@@ -58,3 +101,13 @@ class TokenSchema(BaseModel):
 
 class EmailSchema(BaseModel):
     email: EmailStr
+
+class JobQueueStatsSchema(BaseModel):
+    depth: int
+    pending: int
+    delayed: int
+    dead: int
+    lag_seconds: float
+    processed: int
+    retried: int
+    failed: int
@@ -1,66 +1,276 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text
-from datetime import datetime
+from sqlalchemy import select, insert, update, delete, case, func, or_
+from sqlalchemy.orm import raiseload
+from pydantic import ValidationError
+from datetime import datetime, date, timedelta
+from typing import AsyncIterator
+import base64
+import json
 
-from src.database.models import Record, User
-from src.database.schemas import RecordSchema, RecordUpdateSchema
+from src.database.db import rds_cache
+from src.database.models import Record, RecordRow, User, birthday_key
+from src.database.schemas import RecordSchema, RecordUpdateSchema, RecordResponseSchema, RecordPatchSchema, record_projection_schema, BATCH_SIZE_MAX
+from src.services.cache import ReadThroughCache
+from src.services.queries import query_budget
+from src.conf.config import config
 
+# cached reads return RecordResponseSchema instances instead of 'Record'
+contacts_cache = ReadThroughCache(rds_cache, schema=RecordResponseSchema, prefix='contacts', ttl=config.CONTACTS_CACHE_TTL)
+# contacts are returned without the user, loading it by accident raises instead of adding a query per contact
+NO_RELATIONS = raiseload('*')
 
-async def get_contacts(user: User, limit: int, offset: int, db: AsyncSession):
+
+def encode_cursor(record_id: int) -> str:
+    '''
+    Builds opaque pagination cursor pointing after given record.
+
+    Args:
+        record_id: ID of the last record of the page
+    Returns:
+        'str': url-safe cursor
+    '''
+    raw = json.dumps({'id': record_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    '''
+    Decodes pagination cursor built by encode_cursor.
+
+    Args:
+        cursor: cursor received from client
+    Returns:
+        'int': ID of the last record of the previous page
+    Raises:
+        ValueError: If cursor is malformed
+    '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        record_id = json.loads(raw)['id']
+    except (ValueError, TypeError, KeyError) as err:
+        raise ValueError('Invalid cursor') from err
+    if not isinstance(record_id, int) or isinstance(record_id, bool) or record_id < 0:
+        raise ValueError('Invalid cursor')
+    return record_id
+
+
+def projection_columns(fields: tuple[str, ...]) -> tuple[str, ...]:
+    '''
+    Columns to select for projection: requested fields, ID and updated_at used by cursors and ETags.
+
+    Args:
+        fields: requested fields of RecordResponseSchema
+    Returns:
+        'tuple': column names
+    '''
+    return tuple(dict.fromkeys(('id', *fields, 'updated_at')))
+
+
+def select_contacts(fields: tuple[str, ...] | None):
+    '''
+    Builds select of whole 'Record' entities or Core select of columns only,
+    which skips ORM hydration.
+    Core select is used for projection and, if CONTACTS_CORE_READS is enabled, for whole contacts.
+
+    Args:
+        fields: requested fields or None for whole records
+    Returns:
+        'Select': statement to add filters to
+    '''
+    if fields is not None:
+        return select(*(getattr(Record, column) for column in projection_columns(fields)))
+    if config.CONTACTS_CORE_READS:
+        return select(*RecordRow.columns())
+    return select(Record).options(NO_RELATIONS)
+
+
+async def fetch_contacts(stmt, fields: tuple[str, ...] | None, db: AsyncSession) -> list:
+    '''
+    Runs statement built by select_contacts.
+
+    Args:
+        stmt: statement built by select_contacts
+        fields: requested fields or None for whole records
+        db: async db session
+    Returns:
+        'list': 'Record' db records, 'RecordRow' contacts or rows with selected columns
+    '''
+    result = await db.execute(stmt)
+    if fields is not None:
+        return result.all()
+    if config.CONTACTS_CORE_READS:
+        return [RecordRow(*row) for row in result.tuples()]
+    return result.scalars().all()
+
+
+def projection_schema(fields: tuple[str, ...] | None):
+    return record_projection_schema(projection_columns(fields)) if fields is not None else None
+
+
+@query_budget(1)
+async def get_contacts(user: User, limit: int, offset: int, db: AsyncSession, after_id: int | None = None,
+                       fields: tuple[str, ...] | None = None):
     '''
     Retrieves a list of contacts for a specific user with specified pagination parameters.
+    Records are ordered by ID, so pages can be walked with keyset pagination (after_id)
+    using index (user_id, id) instead of scanning skipped rows.
     
     Args:
         user: The user to retrieve contacts for.
         limit: The maximum number of contacts to return.
         offset: The number of contacts to skip.
         db: async db session
+        after_id: return only contacts with ID greater than given. Optional
+        fields: select only these fields (plus id and updated_at) instead of whole records. Optional
     Returns:
-        obj: 'list' of obj: User: A list of contacts.
+        obj: 'list' of obj: User: A list of contacts, rows with selected columns if fields are given.
     '''
-    stmt = select(Record).filter_by(
-        user_id=user.id).offset(offset).limit(limit)
-    result = await db.execute(stmt)
-    return result.scalars().all()
+    async def fetch():
+        stmt = select_contacts(fields).filter(Record.user_id == user.id)
+        if after_id is not None:
+            stmt = stmt.filter(Record.id > after_id)
+        stmt = stmt.order_by(Record.id).offset(offset).limit(limit)
+        return await fetch_contacts(stmt, fields, db)
+
+    params = {'limit': limit, 'offset': offset, 'after_id': after_id, 'fields': fields}
+    return await contacts_cache.cached(user.id, 'list', params, fetch, schema=projection_schema(fields))
+
+
+async def stream_contacts(user: User, db: AsyncSession, chunk_size: int = 1000) -> AsyncIterator[list[Record]]:
+    '''
+    Streams all contacts of a specific user ordered by ID using server-side cursor,
+    only one chunk of contacts is kept in memory at a time.
+
+    Args:
+        user: The user to retrieve contacts for.
+        db: async db session
+        chunk_size: number of contacts fetched at once
+    Yields:
+        obj: 'list' of obj: 'Record': next chunk of contacts
+    '''
+    stmt = (select(Record).filter_by(user_id=user.id).order_by(Record.id)
+            .options(NO_RELATIONS).execution_options(yield_per=chunk_size))
+    result = await db.stream_scalars(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
+def escape_like(pattern: str) -> str:
+    '''
+    Escapes LIKE wildcards in user input so it is matched literally.
+
+    Args:
+        pattern: search pattern from client
+    Returns:
+        'str': escaped pattern, escape character is backslash
+    '''
+    return pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_filters(terms: dict) -> tuple[list, list]:
+    '''
+    Builds case-insensitive substring filters and relevance scores for searched columns.
+    Filters are bound parameters (ILIKE on Postgres served by pg_trgm GIN indexes).
+
+    Args:
+        terms: mapping of column name to search pattern, empty patterns are skipped
+    Returns:
+        'tuple': list of filter clauses and list of relevance score expressions
+    '''
+    filters, scores = [], []
+    for name, pattern in terms.items():
+        if not pattern:
+            continue
+        column = getattr(Record, name)
+        escaped = escape_like(pattern)
+        filters.append(column.ilike(f'%{escaped}%', escape='\\'))
+        # exact match ranks above prefix match, prefix match above any other substring
+        scores.append(case(
+            (func.lower(column) == pattern.lower(), 3),
+            (column.ilike(f'{escaped}%', escape='\\'), 2),
+            else_=1))
+    return filters, scores
+
+
+def birthday_window(date_from: date, date_to: date):
+    '''
+    Builds filter for contacts with birthday between two dates (both included).
+    Uses stored birthday key, so the filter is an index range scan on (user_id, birthday_md);
+    windows crossing New Year are split into two ranges.
+
+    Args:
+        date_from: first day of the window
+        date_to: last day of the window
+    Returns:
+        filter clause
+    '''
+    if (date_to - date_from).days >= 365:
+        return Record.birthday_md.is_not(None)
+    start, end = birthday_key(date_from), birthday_key(date_to)
+    if start <= end:
+        return Record.birthday_md.between(start, end)
+    return or_(Record.birthday_md >= start, Record.birthday_md <= end)
 
 
+@query_budget(1)
 async def get_contacts_query(user: User, first_name: str | None, last_name: str | None, email: str | None, days_to_birthday: int | None,
-                             limit: int, offset: int, db: AsyncSession):
+                             limit: int, offset: int, db: AsyncSession, after_id: int | None = None,
+                             notes: str | None = None, ranked: bool = False,
+                             birthday_from: date | None = None, birthday_to: date | None = None,
+                             fields: tuple[str, ...] | None = None):
     '''
     Retrieves a list of contacts with pecific search pattern for a specific user with specified pagination parameters.
+    Patterns are matched case-insensitive as substrings.
 
     Args:        
         user: The user to retrieve ontacts for
         first_name: Pattern to search in First name
         last_name: Pattern to search in Last name
         email: Pattern to search in e-mail
-        days_to_birthday: Filter contacts with birthday in given days
+        days_to_birthday: Filter contacts with birthday from today to given days ahead
         limit: The maximum number of contacts to return.
         offset: The number of contacts to skip.
         db: async db session
+        after_id: return only contacts with ID greater than given. Optional
+        notes: Pattern to search in notes. Optional
+        ranked: order contacts by relevance to search patterns instead of ID. Optional
+        birthday_from: Filter contacts with birthday from given date, used with birthday_to. Optional
+        birthday_to: Filter contacts with birthday up to given date, used with birthday_from. Optional
+        fields: select only these fields (plus id and updated_at) instead of whole records. Optional
     Returns:
-        obj: 'list' of obj: 'Record': A list of contacts.
+        obj: 'list' of obj: 'Record': A list of contacts, rows with selected columns if fields are given.
     '''
-    filters = [f"user_id={user.id}"]
-
-    if first_name:
-        filters.append(f"first_name LIKE '%{first_name}%'")
-    if last_name:
-        filters.append(f"last_name LIKE '%{last_name}%'")
-    if email:
-        filters.append(f"email LIKE '%{email}%'")
+    terms = {'first_name': first_name, 'last_name': last_name, 'email': email, 'notes': notes}
     if days_to_birthday:
-        filters.append(
-            f"(birthday-DATE_TRUNC('year', birthday)+DATE_TRUNC('year', CURRENT_DATE)) <= CURRENT_DATE+{days_to_birthday}")
+        # window is resolved here, so cached pages do not outlive the day they were built for
+        today = date.today()
+        days_from, days_to = today, today + timedelta(days=days_to_birthday)
+    else:
+        days_from = days_to = None
 
-    sql_text = text(
-        f'SELECT * FROM records WHERE {" AND ".join(filters)}  LIMIT {limit} OFFSET {offset};')
+    async def fetch():
+        filters, scores = search_filters(terms)
+        stmt = select_contacts(fields).filter(Record.user_id == user.id, *filters)
+        if after_id is not None:
+            stmt = stmt.filter(Record.id > after_id)
+        if days_from is not None:
+            stmt = stmt.filter(birthday_window(days_from, days_to))
+        if birthday_from is not None and birthday_to is not None:
+            stmt = stmt.filter(birthday_window(birthday_from, birthday_to))
 
-    stmt = select(Record).from_statement(sql_text)
-    result = await db.execute(stmt)
-    return result.scalars().all()
+        if ranked and scores:
+            stmt = stmt.order_by(sum(scores[1:], scores[0]).desc(), Record.id)
+        else:
+            stmt = stmt.order_by(Record.id)
+        stmt = stmt.offset(offset).limit(limit)
+        return await fetch_contacts(stmt, fields, db)
+
+    params = {**terms, 'days_from': days_from, 'days_to': days_to, 'birthday_from': birthday_from, 'birthday_to': birthday_to,
+              'ranked': ranked, 'limit': limit, 'offset': offset, 'after_id': after_id, 'fields': fields}
+    return await contacts_cache.cached(user.id, 'query', params, fetch, schema=projection_schema(fields))
 
 
+@query_budget(1)
 async def get_contact(user: User, record_id: int, db: AsyncSession):
     '''
     Retrieves contacts by ID for a specific user.
@@ -72,14 +282,60 @@ async def get_contact(user: User, record_id: int, db: AsyncSession):
     Returns:
         obj: 'Record' | None: Contact with given ID or None.
     '''
-    stmt = select(Record).filter_by(id=record_id, user_id=user.id)
+    async def fetch():
+        stmt = select(Record).filter_by(id=record_id, user_id=user.id).options(NO_RELATIONS)
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    return await contacts_cache.cached(user.id, 'get', {'id': record_id}, fetch)
+
+
+@query_budget(1)
+async def get_contacts_by_ids(user: User, record_ids: list[int], db: AsyncSession):
+    '''
+    Retrieves many contacts by IDs for a specific user with single IN query.
+
+    Args:
+        user: The user to retrieve ontacts for.
+        record_ids: IDs of records to search
+        db: async db session
+    Returns:
+        list: Contacts found, in order of record_ids, missing IDs are skipped.
+    '''
+    record_ids = list(dict.fromkeys(record_ids))
+
+    async def fetch():
+        stmt = select(Record).filter(Record.user_id == user.id, Record.id.in_(record_ids)).options(NO_RELATIONS)
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+    found = {rec.id: rec for rec in await contacts_cache.cached(user.id, 'batch', {'ids': sorted(record_ids)}, fetch)}
+    return [found[record_id] for record_id in record_ids if record_id in found]
+
+
+@query_budget(1)
+async def get_contact_for_update(user: User, record_id: int, db: AsyncSession):
+    '''
+    Retrieves contact by ID for a specific user and locks it until the transaction ends
+    (SELECT ... FOR UPDATE), cache is not used.
+
+    Args:
+        user: The user to retrieve ontacts for.
+        record_id: ID of record to lock
+        db: async db session
+    Returns:
+        obj: 'Record' | None: Contact with given ID or None.
+    '''
+    stmt = (select(Record).filter_by(id=record_id, user_id=user.id).options(NO_RELATIONS)
+            .with_for_update().execution_options(populate_existing=True))
     result = await db.execute(stmt)
     return result.scalar_one_or_none()
 
 
+@query_budget(1)
 async def create_contact(user: User, body: RecordSchema, db: AsyncSession):
     '''
-    Creates new contact for a specific user.
+    Creates new contact for a specific user with single INSERT ... RETURNING.
 
     Args:    
         user: The user to retrieve ontacts for.
@@ -88,18 +344,19 @@ async def create_contact(user: User, body: RecordSchema, db: AsyncSession):
     Returns:
         obj: 'Record' | None: Contact with ID or None.
     '''
-
-    rec = Record(**body.model_dump())
-    rec.user_id = user.id
-    db.add(rec)
+    stmt = insert(Record).values(
+        **body.model_dump(), birthday_md=birthday_key(body.birthday), user_id=user.id).returning(Record)
+    result = await db.execute(stmt)
+    rec = result.scalar_one_or_none()
     await db.commit()
-    await db.refresh(rec)
+    await contacts_cache.invalidate(user.id)
     return rec
 
 
+@query_budget(1)
 async def update_contact(user: User, record_id: int, body: RecordUpdateSchema, db: AsyncSession):
     '''
-    Updates contact for a specific user.
+    Updates contact for a specific user with single UPDATE ... RETURNING.
 
     Args:    
         user: The user to retrieve ontacts for.
@@ -109,35 +366,168 @@ async def update_contact(user: User, record_id: int, body: RecordUpdateSchema, d
     Returns:
         obj: 'Record' | None: Contact with ID or None.
     '''
-    stmt = select(Record).filter_by(id=record_id, user_id=user.id)
+    stmt = (update(Record).filter_by(id=record_id, user_id=user.id)
+            .values(**body.model_dump(), birthday_md=birthday_key(body.birthday), updated_at=datetime.now())
+            .returning(Record))
     result = await db.execute(stmt)
     result = result.scalar_one_or_none()
     if result:
-        result.first_name = body.first_name
-        result.last_name = body.last_name
-        result.email = body.email
-        result.birthday = body.birthday
-        result.notes = body.notes
-        result.updated_at = datetime.now()
         await db.commit()
-        await db.refresh(result)
+        await contacts_cache.invalidate(user.id)
     return result
 
+@query_budget(1)
 async def delete_contact(user: User, record_id: int, db: AsyncSession):
     '''
-    Deletes contact for a specific user.
+    Deletes contact for a specific user with single DELETE ... RETURNING.
 
     Args:    
         user: The user to retrieve ontacts for.
         record_id: ID of record to delete
         db: async db session
     Returns:
-        None
+        obj: 'Record' | None: deleted contact or None.
     '''
-    stmt = select(Record).filter_by(id=record_id, user_id=user.id)
+    stmt = delete(Record).filter_by(id=record_id, user_id=user.id).returning(Record)
     result = await db.execute(stmt)
     result = result.scalar_one_or_none()
     if result:
-        await db.delete(result)
         await db.commit()
+        await contacts_cache.invalidate(user.id)
     return result
+
+
+@query_budget(BATCH_SIZE_MAX, allow_repeated=True)
+async def update_contacts(user: User, patches: list[RecordPatchSchema], db: AsyncSession):
+    '''
+    Applies partial updates to many contacts of a specific user in one transaction,
+    every patch is single UPDATE ... RETURNING of the fields present in it.
+
+    Args:
+        user: The user to update contacts for.
+        patches: IDs of records and fields to change
+        db: async db session
+    Returns:
+        list: Updated contacts in order of patches, missing IDs and patches without fields are skipped.
+    '''
+    updated = {}
+    for patch in patches:
+        values = patch.model_dump(exclude_unset=True, exclude={'id'})
+        if not values:
+            continue
+        if 'birthday' in values:
+            values['birthday_md'] = birthday_key(values['birthday'])
+        values['updated_at'] = datetime.now()
+        stmt = update(Record).filter_by(id=patch.id, user_id=user.id).values(**values).returning(Record)
+        result = await db.execute(stmt)
+        rec = result.scalar_one_or_none()
+        if rec is not None:
+            updated[rec.id] = rec
+    if updated:
+        await db.commit()
+        await contacts_cache.invalidate(user.id)
+    return list(updated.values())
+
+
+@query_budget(1)
+async def delete_contacts(user: User, record_ids: list[int], db: AsyncSession) -> list[dict]:
+    '''
+    Deletes many contacts of a specific user with single DELETE ... RETURNING.
+
+    Args:
+        user: The user to delete contacts for.
+        record_ids: IDs of records to delete
+        db: async db session
+    Returns:
+        list: result for every requested ID: {'id': ID, 'deleted': True if contact was deleted}
+    '''
+    record_ids = list(dict.fromkeys(record_ids))
+    stmt = delete(Record).filter(Record.user_id == user.id, Record.id.in_(record_ids)).returning(Record.id)
+    result = await db.execute(stmt)
+    deleted = set(result.scalars().all())
+    if deleted:
+        await db.commit()
+        await contacts_cache.invalidate(user.id)
+    return [{'id': record_id, 'deleted': record_id in deleted} for record_id in record_ids]
+
+
+IMPORT_COLUMNS = ('first_name', 'last_name', 'email', 'birthday', 'birthday_md', 'notes',
+                  'created_at', 'updated_at', 'user_id')
+
+
+@query_budget(1)
+async def insert_contacts(user: User, bodies: list[RecordSchema], db: AsyncSession) -> int:
+    '''
+    Inserts many contacts for a specific user in one statement, COPY is used on Postgres.
+    Transaction is not committed.
+
+    Args:
+        user: The user to create contacts for.
+        bodies: data of new contact records
+        db: async db session
+    Returns:
+        'int': number of inserted contacts
+    '''
+    if not bodies:
+        return 0
+    now = datetime.now()
+    rows = [
+        {**body.model_dump(), 'birthday_md': birthday_key(body.birthday),
+         'created_at': now, 'updated_at': now, 'user_id': user.id}
+        for body in bodies
+    ]
+    if db.get_bind().dialect.name == 'postgresql':
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            Record.__tablename__, columns=IMPORT_COLUMNS,
+            records=[tuple(row[column] for column in IMPORT_COLUMNS) for row in rows])
+    else:
+        # Core insert of the table: ORM bulk insert splits rows into batches by columns with None values
+        await db.execute(insert(Record.__table__), rows)
+    return len(rows)
+
+
+async def import_contacts(user: User, rows: AsyncIterator[tuple[int, dict | str]], db: AsyncSession,
+                          chunk_size: int = 1000) -> AsyncIterator[dict]:
+    '''
+    Validates parsed rows and inserts them chunk by chunk, every chunk is committed separately,
+    so memory use does not depend on the number of rows.
+
+    Args:
+        user: The user to create contacts for.
+        rows: row number and contact data or parsing error message
+        db: async db session
+        chunk_size: number of rows validated and inserted at once
+    Yields:
+        'dict': progress after every chunk: processed, imported and errors of the chunk
+    '''
+    processed = imported = 0
+    bodies, errors = [], []
+
+    async def flush():
+        nonlocal imported
+        inserted = await insert_contacts(user=user, bodies=bodies, db=db)
+        await db.commit()
+        if inserted:
+            await contacts_cache.invalidate(user.id)
+        imported += inserted
+        progress = {'processed': processed, 'imported': imported, 'errors': list(errors)}
+        bodies.clear()
+        errors.clear()
+        return progress
+
+    async for row, data in rows:
+        processed += 1
+        if isinstance(data, str):
+            errors.append({'row': row, 'error': data})
+        else:
+            try:
+                bodies.append(RecordSchema(**data))
+            except ValidationError as err:
+                errors.append({'row': row, 'error': '; '.join(
+                    f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors())})
+        if len(bodies) + len(errors) >= chunk_size:
+            yield await flush()
+    if bodies or errors or not processed:
+        yield await flush()
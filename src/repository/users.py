@@ -1,10 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from src.database.models import User
 from src.database.schemas import UserDBSchema
+from src.services.cache import user_cache
+from src.services.queries import query_budget
 
 
+@query_budget(1)
 async def get_user_by_email(email: str, db: AsyncSession) -> User:
     '''
     find user in db by given e-mail
@@ -20,23 +25,72 @@ async def get_user_by_email(email: str, db: AsyncSession) -> User:
     return result.scalar_one_or_none()
 
 
-async def create_user(body: UserDBSchema, db: AsyncSession) -> User:
+@query_budget(1)
+async def email_exists(email: str, db: AsyncSession) -> bool:
     '''
-    create new user in db
+    checks if user with given e-mail exists, only ID is read
+
+    Args:
+        email: user's e-mail
+        db: async db session
+    Returns:
+        bool: True if e-mail is registered
+    '''
+    stmt = select(User.id).filter_by(email=email).limit(1)
+    return await db.scalar(stmt) is not None
+
+
+def insert_stmt(db: AsyncSession):
+    '''
+    dialect specific INSERT construct supporting ON CONFLICT
+
+    Args:
+        db: async db session
+    Returns:
+        insert function of Postgres or SQLite dialect
+    '''
+    return pg_insert if db.get_bind().dialect.name == 'postgresql' else sqlite_insert
+
+
+@query_budget(1)
+async def create_user(body: UserDBSchema, db: AsyncSession) -> User | None:
+    '''
+    create new user in db with single INSERT ... ON CONFLICT DO NOTHING RETURNING
 
     Args:
         body: new user data
         db: async db session
     Returns:
-        obj: 'User': returns user record from db
+        obj: 'User' | None: returns user record from db, None if e-mail is already registered
     '''
-    user = User(**body.model_dump())
-    db.add(user)
+    stmt = (insert_stmt(db)(User).values(**body.model_dump())
+            .on_conflict_do_nothing(index_elements=[User.email]).returning(User))
+    result = await db.execute(stmt)
+    user = result.scalar_one_or_none()
     await db.commit()
-    await db.refresh(user)
     return user
 
 
+@query_budget(1)
+async def update_user(user: User, db: AsyncSession, **values) -> User | None:
+    '''
+    update user's fields in db with single UPDATE ... RETURNING and drop cached user
+
+    Args:
+        user: user to update, may be detached 'User' built from cache
+        db: async db session
+        values: new values of the fields
+    Returns:
+        obj: 'User' | None: returns updated user record from db
+    '''
+    stmt = update(User).filter_by(id=user.id).values(**values).returning(User)
+    result = await db.execute(stmt)
+    updated = result.scalar_one_or_none()
+    await db.commit()
+    await user_cache.invalidate(user.email)
+    return updated
+
+
 async def update_user_token(user: User, token: str | None, db: AsyncSession) -> User:
     '''
     update refresh token of user in db
@@ -48,10 +102,21 @@ async def update_user_token(user: User, token: str | None, db: AsyncSession) ->
     Returns:
         obj: 'User': returns user record from db
     '''
-    user.refresh_token = token
-    await db.commit()
-    await db.refresh(user)
-    return user
+    return await update_user(user, db, refresh_token=token)
+
+
+async def update_user_password(user: User, pwd_hash: str, db: AsyncSession) -> User:
+    '''
+    store new password hash of user in db
+
+    Args:
+        user: user to update
+        pwd_hash: new password hash
+        db: async db session
+    Returns:
+        obj: 'User': returns user record from db
+    '''
+    return await update_user(user, db, pwd_hash=pwd_hash)
 
 
 async def user_email_confirmation(user: User, db: AsyncSession) -> User:
@@ -64,10 +129,7 @@ async def user_email_confirmation(user: User, db: AsyncSession) -> User:
     Returns:
         obj: 'User': returns user record from db
     '''
-    user.confirmed = True
-    await db.commit()
-    await db.refresh(user)
-    return user
+    return await update_user(user, db, confirmed=True)
 
 
 async def update_user_avatar(user: User, url:str, db: AsyncSession) -> User:
@@ -81,7 +143,4 @@ async def update_user_avatar(user: User, url:str, db: AsyncSession) -> User:
     Returns:
         obj 'User': returns user record from db
     '''
-    user.avatar = url
-    await db.commit()
-    await db.refresh(user)
-    return user
+    return await update_user(user, db, avatar=url)
@@ -1,15 +1,122 @@
-from fastapi import APIRouter, HTTPException, status, Path, Query, Depends
+from fastapi import APIRouter, HTTPException, status, Path, Query, Body, Header, Depends, Response, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from datetime import date
+from typing import Literal
+import json
 
-from src.database.db import get_db
-from src.database.schemas import RecordSchema, RecordUpdateSchema, RecordResponseSchema
+from src.database.db import get_db, sessionmanager
+from src.database.schemas import RecordSchema, RecordUpdateSchema, RecordResponseSchema, RecordPatchSchema, BatchDeleteResultSchema, BATCH_SIZE_MAX
 from src.database.models import User
 from src.repository import contacts as rep_contacts
 from src.services.auth import auth_service
-from src.conf.config import route_rst
+from src.services import contacts_io
+from src.services.etag import make_etag, etag_matches
+from src.services.fast_json import RecordsJSONResponse, RECORD_FIELDS, validate_records
+from src.conf.config import route_rst, config
+from src.conf import messages
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    '''
+    Decodes pagination cursor from query parameters.
+
+    Args:
+        cursor: cursor received from client or None
+    Returns:
+        'int' | None: ID of the last record of the previous page
+    Raises:
+        HTTPException: If cursor is malformed
+    '''
+    if cursor is None:
+        return None
+    try:
+        return rep_contacts.decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CURSOR_INVALID)
+
+
+def set_next_cursor(response: Response, result: list, limit: int) -> None:
+    '''
+    Adds cursor of the next page to response headers if page is full.
+
+    Args:
+        response: response to add header to
+        result: records of the current page
+        limit: requested page size
+    Returns:
+        None
+    '''
+    if result and len(result) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = rep_contacts.encode_cursor(result[-1].id)
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...] | None:
+    '''
+    Parses comma separated list of contact fields to return, ID is always returned.
+
+    Args:
+        fields: fields received from client or None
+    Returns:
+        'tuple' | None: fields in RecordResponseSchema order, None for all fields
+    Raises:
+        HTTPException: If unknown field is requested
+    '''
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(',') if name.strip()}
+    if not names or not names <= set(RECORD_FIELDS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=messages.FIELDS_INVALID)
+    return tuple(field for field in RECORD_FIELDS if field in names or field == 'id')
+
+
+def not_modified(response: Response, records: list, if_none_match: str | None,
+                 fields: tuple[str, ...] | None = None) -> Response | None:
+    '''
+    Sets ETag of the contacts in response headers and checks If-None-Match request header.
+
+    Args:
+        response: response to set ETag header in
+        records: contacts of the response
+        if_none_match: If-None-Match header of the request
+        fields: fields of the contacts in response, None for all fields. Optional
+    Returns:
+        'Response' | None: empty 304 response if client already has these contacts
+    '''
+    etag = make_etag(records, variant=','.join(fields) if fields else '')
+    response.headers['ETag'] = etag
+    if not etag_matches(if_none_match, etag):
+        return None
+    headers = {'ETag': etag}
+    if NEXT_CURSOR_HEADER in response.headers:
+        headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def render_records(response: Response, records: list, fields: tuple[str, ...] | None = None):
+    '''
+    Returns contacts as is for response_model serialization,
+    or serialized by fast path without validation if FAST_JSON is enabled.
+    Contacts trimmed to fields are validated with trimmed schema instead of response_model.
+
+    Args:
+        response: response with headers to keep
+        records: contacts of the response
+        fields: fields to return, None for all fields. Optional
+    Returns:
+        'list' | 'Response': contacts or JSON response
+    '''
+    if config.FAST_JSON:
+        return RecordsJSONResponse(records, fields=fields, headers=response.headers)
+    if fields is None:
+        return records
+    return Response(validate_records(records, fields), media_type='application/json', headers=response.headers)
 
 
 @router.get('/healthchecker', dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
@@ -35,111 +142,312 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/", response_model=list[RecordResponseSchema], dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
-async def get_contacts(limit: int = Query(default=10, ge=1, le=50, description="Records per response to show"), 
+async def get_contacts(response: Response,
+                       limit: int = Query(default=10, ge=1, le=50, description="Records per response to show"), 
                        offset: int = Query(
                            default=0, ge=0, description="Records to skip in response"),
+                       cursor: str | None = Query(
+                           default=None, description=f"Cursor of the next page from {NEXT_CURSOR_HEADER} header"),
+                       fields: str | None = Query(
+                           default=None, description="Comma separated fields to return, e.g. first_name,last_name. ID is always returned"),
+                       if_none_match: str | None = Header(default=None),
                        db: AsyncSession = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     '''
     Retrieves a list of contacts for a specific user with specified pagination parameters.
     
     Args:
+        response: response to set next page cursor and ETag headers in
         current_user: The user to retrieve contacts for.
         limit: The maximum number of contacts to return.
         offset: The number of contacts to skip.
+        cursor: cursor of the next page. Optional
+        fields: comma separated fields to return. Optional
+        if_none_match: ETag of the page client already has. Optional
         db: async db session
     Returns:
-        obj: 'list' of obj: User: A list of contacts.
+        obj: 'list' of obj: User: A list of contacts, or empty 304 response if page is not modified.
+    Raises:
+        HTTPException: If cursor or fields are invalid
     '''
-    result = await rep_contacts.get_contacts(user=current_user, limit=limit, offset=offset, db=db)
-    return result
+    after_id = decode_cursor(cursor)
+    fields = parse_fields(fields)
+    result = await rep_contacts.get_contacts(user=current_user, limit=limit, offset=offset, db=db, after_id=after_id, fields=fields)
+    set_next_cursor(response, result, limit)
+    return not_modified(response, result, if_none_match, fields) or render_records(response, result, fields)
 
 
 @router.get("/query", response_model=list[RecordResponseSchema], dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
-async def get_contacts_query(first_name: str | None = Query(default=None, description="Pattern to search in First name"),
+async def get_contacts_query(response: Response,
+                           first_name: str | None = Query(default=None, description="Pattern to search in First name"),
                            last_name: str | None = Query(
                                default=None, description="Pattern to search in Last name"),
                            email: str | None = Query(
                                default=None, description="Pattern to search in e-mail"),
-                           days_to_birthday: int | None = Query(default=None, le=30, description="Filter contacts with birthday in given days"),
+                           notes: str | None = Query(
+                               default=None, description="Pattern to search in notes"),
+                           days_to_birthday: int | None = Query(default=None, ge=0, le=30, description="Filter contacts with birthday in given days"),
+                           birthday_from: date | None = Query(default=None, description="Filter contacts with birthday from date, requires birthday_to"),
+                           birthday_to: date | None = Query(default=None, description="Filter contacts with birthday up to date, requires birthday_from"),
                            limit: int = Query(default=10, ge=1, le=50, description="Records per response to show"), 
                            offset: int = Query(default=0, ge=0, description="Records to skip in response"),
+                           cursor: str | None = Query(
+                               default=None, description=f"Cursor of the next page from {NEXT_CURSOR_HEADER} header"),
+                           ranked: bool = Query(default=False, description="Order contacts by relevance to search patterns"),
+                           fields: str | None = Query(
+                               default=None, description="Comma separated fields to return, e.g. first_name,last_name. ID is always returned"),
+                           if_none_match: str | None = Header(default=None),
                            db: AsyncSession = Depends(get_db),
                            current_user: User = Depends(auth_service.get_current_user)):
     '''
     Retrieves a list of contacts with pecific search pattern for a specific user with specified pagination parameters.
+    Patterns are matched case-insensitive as substrings.
 
     Args:        
         first_name: Pattern to search in First name, default=None
         last_name: Pattern to search in Last name, default=None
         email: Pattern to search in e-mail, default=None
-        days_to_birthday: Filter contacts with birthday in given days, max=30 days, default=None
+        notes: Pattern to search in notes, default=None
+        days_to_birthday: Filter contacts with birthday in given days, 0 to 30 days, default=None
+        birthday_from: Filter contacts with birthday from date (year is ignored after range check), default=None
+        birthday_to: Filter contacts with birthday up to date, default=None
         limit: The maximum number of contacts to return. min=1, max=50, default=10
         offset: The number of contacts to skip. min=0, default=0
+        cursor: cursor of the next page, can not be combined with ranked, default=None
+        ranked: order contacts by relevance instead of ID, default=False
+        fields: comma separated fields to return, default=None
+        if_none_match: ETag of the page client already has, default=None
+        response: response to set next page cursor and ETag headers in
         current_user: The user to retrieve ontacts for.
         db: async db session Default=Depends(get_db)
     Returns:
-        obj: 'list' of obj: 'Record': A list of contacts.
+        obj: 'list' of obj: 'Record': A list of contacts, or empty 304 response if page is not modified.
+    Raises:
+        HTTPException: If cursor is invalid or used with ranked search, birthday range or fields are invalid
     '''
+    if ranked and cursor is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CURSOR_WITH_RANKED)
+    if (birthday_from is None) != (birthday_to is None) or (birthday_from and birthday_from > birthday_to):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=messages.BIRTHDAY_RANGE_INVALID)
+    after_id = decode_cursor(cursor)
+    fields = parse_fields(fields)
     result = await rep_contacts.get_contacts_query(user=current_user, first_name=first_name, last_name=last_name, email=email, days_to_birthday=days_to_birthday,
-                                                   limit=limit, offset=offset, db=db)
-    return result
+                                                   limit=limit, offset=offset, db=db, after_id=after_id, notes=notes, ranked=ranked,
+                                                   birthday_from=birthday_from, birthday_to=birthday_to, fields=fields)
+    if not ranked:
+        set_next_cursor(response, result, limit)
+    return not_modified(response, result, if_none_match, fields) or render_records(response, result, fields)
+
+
+class UploadStreamingResponse(StreamingResponse):
+    '''
+    Streaming response which body is produced while request body is still being read.
+    StreamingResponse listens for client disconnect on receive channel at the same time,
+    which would consume request body chunks, so here only the response is streamed.
+    '''
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+@router.post("/import", response_class=UploadStreamingResponse, dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
+async def import_contacts(request: Request,
+                          format: Literal['csv', 'ndjson', 'vcard'] = Query(description="Format of request body"),
+                          chunk_size: int = Query(default=1000, ge=1, le=10000, description="Rows inserted per transaction"),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    '''
+    Imports contacts for a specific user from request body (CSV with header, NDJSON or vCard).
+    Body is parsed as a stream and inserted in chunks. Response is NDJSON: progress line
+    after every chunk, a line per invalid row and summary line at the end.
+
+    Args:
+        request: end-point HTTP request with contacts in body
+        format: format of request body
+        chunk_size: rows validated and inserted per transaction, default=1000
+        current_user: The user to import contacts for.
+    Returns:
+        NDJSON stream of progress, row errors and summary
+    '''
+    parser = contacts_io.PARSERS[format]
+
+    async def progress():
+        failed = 0
+        async with sessionmanager.session() as db:
+            rows = parser(contacts_io.iter_lines(request.stream()))
+            async for chunk in rep_contacts.import_contacts(user=current_user, rows=rows, db=db, chunk_size=chunk_size):
+                for error in chunk['errors']:
+                    failed += 1
+                    yield json.dumps(error) + '\n'
+                yield json.dumps({'processed': chunk['processed'], 'imported': chunk['imported']}) + '\n'
+        yield json.dumps({'processed': chunk['processed'], 'imported': chunk['imported'], 'failed': failed, 'done': True}) + '\n'
+
+    return UploadStreamingResponse(progress(), media_type='application/x-ndjson')
+
+
+@router.get("/export", response_class=StreamingResponse, dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
+async def export_contacts(format: Literal['csv', 'ndjson', 'vcard'] = Query(default='ndjson', description="Format of exported file"),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    '''
+    Exports all contacts of a specific user as a file (CSV with header, NDJSON or vCard).
+    Contacts are read with server-side cursor and serialized chunk by chunk.
+
+    Args:
+        format: format of exported file, default=ndjson
+        current_user: The user to export contacts for.
+    Returns:
+        stream of exported contacts
+    '''
+    media_type, header, serialize = contacts_io.EXPORTERS[format]
+
+    async def content():
+        if header:
+            yield header
+        async with sessionmanager.session() as db:
+            async for records in rep_contacts.stream_contacts(user=current_user, db=db):
+                yield serialize(records)
+
+    extension = 'vcf' if format == 'vcard' else format
+    return StreamingResponse(content(), media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="contacts.{extension}"'})
+
+
+@router.get("/batch", response_model=list[RecordResponseSchema], dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
+async def get_contacts_batch(response: Response,
+                             ids: list[int] = Query(min_length=1, max_length=BATCH_SIZE_MAX, description="IDs of records to search"),
+                             if_none_match: str | None = Header(default=None),
+                             db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(auth_service.get_current_user)):
+    '''
+    Retrieves many contacts by IDs for a specific user.
+
+    Args:
+        response: response to set ETag header in
+        ids: IDs of records to search
+        if_none_match: ETag of the contacts client already has. Optional
+        current_user: The user to retrieve ontacts for.
+        db: async db session Default=Depends(get_db)
+    Returns:
+        list: Contacts found, in order of ids, missing IDs are skipped, or empty 304 response if not modified.
+    '''
+    result = await rep_contacts.get_contacts_by_ids(user=current_user, record_ids=ids, db=db)
+    return not_modified(response, result, if_none_match) or render_records(response, result)
+
+
+@router.patch("/batch", response_model=list[RecordResponseSchema], dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
+async def update_contacts_batch(body: list[RecordPatchSchema] = Body(min_length=1, max_length=BATCH_SIZE_MAX),
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User = Depends(auth_service.get_current_user)):
+    '''
+    Applies partial updates to many contacts for a specific user in one transaction.
+
+    Args:
+        body: IDs of records and fields to change
+        current_user: The user to update contacts for.
+        db: async db session Default=Depends(get_db)
+    Returns:
+        list: Updated contacts, missing IDs are skipped.
+    '''
+    return await rep_contacts.update_contacts(user=current_user, patches=body, db=db)
+
+
+@router.delete("/batch", response_model=list[BatchDeleteResultSchema], dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
+async def delete_contacts_batch(ids: list[int] = Query(min_length=1, max_length=BATCH_SIZE_MAX, description="IDs of records to delete"),
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User = Depends(auth_service.get_current_user)):
+    '''
+    Deletes many contacts for a specific user.
+
+    Args:
+        ids: IDs of records to delete
+        current_user: The user to delete contacts for.
+        db: async db session Default=Depends(get_db)
+    Returns:
+        list: result for every requested ID.
+    '''
+    return await rep_contacts.delete_contacts(user=current_user, record_ids=ids, db=db)
 
 
 @router.get("/{rec_id}", response_model=RecordResponseSchema, dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
-async def get_contact(rec_id: int = Path(description="ID of record to search"),
+async def get_contact(response: Response,
+                      rec_id: int = Path(description="ID of record to search"),
+                      if_none_match: str | None = Header(default=None),
                       db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     '''
     Retrieves contacts by ID for a specific user.
     
     Args:
+        response: response to set ETag header in
         rec_id: ID of record to search
+        if_none_match: ETag of the contact client already has. Optional
         current_user: The user to retrieve ontacts for.
         db: async db session Default=Depends(get_db)
     Returns:
-        obj: 'Record' | None: Contact with given ID or None.
+        obj: 'Record' | None: Contact with given ID, or empty 304 response if it is not modified.
+    Raises:
+        HTTPException: If contact is not found
     '''
     result = await rep_contacts.get_contact(user=current_user, record_id=rec_id, db=db)
     if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail='Record ID not found')
-    return result
+    return not_modified(response, [result], if_none_match) or result
 
 
 @router.post("/", response_model=RecordResponseSchema, status_code=status.HTTP_201_CREATED, dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
-async def create_contact(body: RecordSchema, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def create_contact(body: RecordSchema, response: Response, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     '''
     Creates new contact for a specific user.
 
     Args:    
         body: data of new contact record
+        response: response to set ETag header in
         current_user: The user to retrieve ontacts for.
         db: async db session Default=Depends(get_db)
     Returns:
         obj: 'Record' | None: Contact with ID or None.
     '''
     result = await rep_contacts.create_contact(user=current_user, body=body, db=db)
+    response.headers['ETag'] = make_etag([result])
     return result
 
 
 @router.put("/{rec_id}", response_model=RecordResponseSchema, dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
 async def update_contact(body: RecordUpdateSchema, 
+                         response: Response,
                          rec_id: int = Path(description="ID of record to change"), 
+                         if_match: str | None = Header(default=None),
                          db: AsyncSession = Depends(get_db), 
                          current_user: User = Depends(auth_service.get_current_user)):
     '''
     Updates contact for a specific user.
+    With If-Match header contact is updated only if it was not modified since client received given ETag.
 
     Args:    
         body: updated data of the contact record
+        response: response to set ETag header in
         rec_id: ID of record to change
+        if_match: ETag of the contact version being changed. Optional
         current_user: The user to retrieve ontacts for.
         db: async db session Default=Depends(get_db)
     Returns:
         obj: 'Record' | None: Contact with ID or None.
+    Raises:
+        HTTPException: If contact is not found or was modified
     '''
+    if if_match is not None:
+        # row stays locked until update is committed
+        current = await rep_contacts.get_contact_for_update(user=current_user, record_id=rec_id, db=db)
+        if current is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail='Record ID not found')
+        if not etag_matches(if_match, make_etag([current]), weak=False):
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED, detail=messages.CONTACT_MODIFIED)
     result = await rep_contacts.update_contact(user=current_user, record_id=rec_id, body=body, db=db)
+    if result is not None:
+        response.headers['ETag'] = make_etag([result])
     return result
 
 
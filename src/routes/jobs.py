@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, status, Depends
+from redis.exceptions import RedisError
+
+from src.database.schemas import JobQueueStatsSchema
+from src.services.auth import auth_service
+from src.services.jobs import job_queue
+from src.conf.config import route_rst
+from src.conf import messages
+
+router = APIRouter(prefix='/jobs', tags=['jobs'])
+
+
+@router.get('/stats', response_model=JobQueueStatsSchema, dependencies=[Depends(route_rst.rate_limiter), Depends(auth_service.get_current_user)],
+            description=route_rst.restict_descr)
+async def get_stats():
+    '''
+    state of background job queue: depth, lag of the oldest job, retries and dead jobs, for authenticated users only
+
+    Returns:
+        obj: 'dict': stats of the queue
+    Raises:
+        HTTPException: If user is not authenticated or Redis is not available
+    '''
+    try:
+        return await job_queue.stats()
+    except RedisError as err:
+        print(err)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=messages.JOB_QUEUE_UNAVAILABLE)
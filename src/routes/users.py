@@ -1,8 +1,9 @@
-import cloudinary.uploader
-from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Request, UploadFile, File
+import base64
+
+from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Request, Response, UploadFile, File
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
-import cloudinary
 
 from src.database.db import get_db
 from src.database.schemas import UserSchema, UserResponseSchema, TokenSchema, UserDBSchema, EmailSchema
@@ -10,12 +11,37 @@ from src.database.models import User
 from src.repository import users as rep_users
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.avatars import avatar_service
+from src.services.jobs import job_queue, JOB_SEND_EMAIL, JOB_AVATAR
 from src.conf.config import route_rst, config
 from src.conf import messages
 
 router = APIRouter(prefix='/auth', tags=['auth'])
 get_refresh_token = HTTPBearer()
 
+
+async def queue_email(background_task: BackgroundTasks, email: str, username: str, host: str) -> None:
+    '''
+    Sends confirmation e-mail through job queue if JOB_QUEUE is on, or in background task of the response.
+    Background task is used as well if Redis is not available.
+
+    Args:
+        background_task: background tasks of the response
+        email: user's e-mail
+        username: user name
+        host: domain adress where application deployed
+    Returns:
+        None
+    '''
+    if config.JOB_QUEUE:
+        try:
+            await job_queue.enqueue(JOB_SEND_EMAIL, email=email, username=username, host=host)
+            return
+        except RedisError as err:
+            print(err)
+    background_task.add_task(send_email, email=email, username=username, host=host)
+
+
 @router.post("/signup", response_model=UserResponseSchema, status_code=status.HTTP_201_CREATED, 
              dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
 async def create_user(body: UserSchema, background_task: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
@@ -32,16 +58,19 @@ async def create_user(body: UserSchema, background_task: BackgroundTasks, reques
     Raises:
         HTTPException: If user already exists
     '''
-    user = await rep_users.get_user_by_email(email=body.email, db=db)
-    if user:
+    # cheap check saves password hashing on the limited hash pool for repeated signups,
+    # INSERT ... ON CONFLICT still catches concurrent signups with the same e-mail
+    if await rep_users.email_exists(body.email, db=db):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.USER_ALREADY_EXISTS)
     record = UserDBSchema(
         username=body.username,
         email=body.email,
-        pwd_hash=auth_service.get_pasword_hash(body.password)
+        pwd_hash=await auth_service.get_pasword_hash(body.password)
     )
     user = await rep_users.create_user(record, db=db)
-    background_task.add_task(send_email, email=body.email, username=body.username, host=str(request.base_url))
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.USER_ALREADY_EXISTS)
+    await queue_email(background_task, email=body.email, username=body.username, host=str(request.base_url))
     return user
 
 
@@ -65,17 +94,22 @@ async def login_user(body: OAuth2PasswordRequestForm =Depends(), db: AsyncSessio
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail=messages.EMAIL_NOT_CONFIRMED)
-    if not auth_service.verify_password(body.password, user.pwd_hash):
+    valid, new_hash = await auth_service.verify_and_update_password(body.password, user.pwd_hash)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail=messages.PASSWORD_INVALID)
-    
+
     response = TokenSchema(
         access_token=await auth_service.create_access_token(data={'sub': user.email}),
         refresh_token=await auth_service.create_refresh_token(data={'sub': user.email})
         )
 
-    refreshed_user = await rep_users.update_user_token(user=user, token=response.refresh_token, db=db)
-    if refreshed_user.refresh_token != response.refresh_token:
+    if new_hash:
+        # upgraded password hash is stored by the same UPDATE as the token
+        refreshed_user = await rep_users.update_user(user, db, refresh_token=response.refresh_token, pwd_hash=new_hash)
+    else:
+        refreshed_user = await rep_users.update_user_token(user=user, token=response.refresh_token, db=db)
+    if refreshed_user is None or refreshed_user.refresh_token != response.refresh_token:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=messages.REFRESH_TOKEN_INVALID)
     
     return response
@@ -140,8 +174,7 @@ async def send_in_background(body: EmailSchema, background_task: BackgroundTasks
     if user.confirmed:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail='E-mail already confirmed')
-    background_task.add_task(send_email, email=user.email,
-                        username=user.username, host=str(request.base_url))
+    await queue_email(background_task, email=user.email, username=user.username, host=str(request.base_url))
     return {'message': 'email has been sent'}
 
 
@@ -172,25 +205,32 @@ async def confirm_email(token: str, db: AsyncSession = Depends(get_db)):
 
 
 @router.patch("/upload_avatar/", response_model=UserResponseSchema, dependencies=[Depends(route_rst.rate_limiter)], description=route_rst.restict_descr)
-async def upload_avatar(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+async def upload_avatar(response: Response, file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
     '''
-    upload user's avatar to Cloudinary
+    upload user's avatar: image is resized to AVATAR_SIZE square and stored in avatar storage.
+    If JOB_QUEUE is on, image is processed by worker and response 202 holds current avatar
 
     Args:
+        response: end-point response
         file: avatar file
         current_user: db record of current user, Depends(auth_service.get_current_user)
         db: async db session, Default=Depends(get_db)
     Returns:
         :return (User): db record of current user
+    Raises:
+        HTTPException: If file is too large or is not an image
     '''
-    cloudinary.config(
-        cloud_name=config.CLOUDINARY_NAME,
-        api_key=config.CLOUDINARY_API_KEY,
-        api_secret=config.CLOUDINARY_API_SECRET,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'user:{current_user.email}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'user:{current_user.email}').build_url(width=250, height=250, crop='fill', version=r.get('version'))
+    data = await avatar_service.read(file)
+    if config.JOB_QUEUE:
+        try:
+            await job_queue.enqueue(JOB_AVATAR, email=current_user.email, data=base64.b64encode(data).decode())
+            response.status_code = status.HTTP_202_ACCEPTED
+            return current_user
+        except RedisError as err:
+            print(err)
+    try:
+        src_url = await avatar_service.store(f'user:{current_user.email}', data)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.AVATAR_INVALID)
     user = await rep_users.update_user_avatar(user=current_user, url=src_url, db=db)
     return user
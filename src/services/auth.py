@@ -1,27 +1,58 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Callable
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import math
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-import pickle
-from src.database.db import get_db, rds_cache
+from src.database.db import get_db
+from src.database.models import User
 from src.repository import users as rep_users
+from src.services.cache import user_cache, SingleFlight
 from src.conf.config import config
+from src.conf import messages
 
 class Auth():
     '''
     Class to proccess user authentification
     '''
 
-    pwd_context = CryptContext(schemes=['bcrypt'])
+    pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+    # bcrypt releases GIL, so hashing runs in threads without blocking event loop
+    hash_executor = ThreadPoolExecutor(max_workers=config.PWD_HASH_WORKERS, thread_name_prefix='pwd-hash')
+    hash_pending = 0
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
     SECRET_KEY = config.SECRET_JWT
     ALGORITHM = config.ALGORITHM_JWT
-    cache = rds_cache
+    cache = user_cache
+    flight = SingleFlight()
 
-    def verify_password(self, plaine_pwd: str, hashed_pwd: str) -> bool:
+    async def run_hashing(self, func: Callable, *args):
+        '''
+        run password hashing function in thread pool
+
+        Args:
+            func: function to run
+            args: arguments of the function
+        Returns:
+            result of the function
+        Raises:
+            HTTPException: If too many hashing tasks are already queued
+        '''
+        if self.hash_pending >= config.PWD_HASH_WORKERS + config.PWD_HASH_QUEUE:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=messages.SERVER_BUSY, headers={'Retry-After': '1'})
+        Auth.hash_pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.hash_executor, func, *args)
+        finally:
+            Auth.hash_pending -= 1
+
+    async def verify_password(self, plaine_pwd: str, hashed_pwd: str) -> bool:
         '''
         verify password
 
@@ -32,9 +63,21 @@ class Auth():
             bool: True if success False othervise
         '''
 
-        return self.pwd_context.verify(plaine_pwd, hashed_pwd)
+        return await self.run_hashing(self.pwd_context.verify, plaine_pwd, hashed_pwd)
+
+    async def verify_and_update_password(self, plaine_pwd: str, hashed_pwd: str) -> tuple[bool, str | None]:
+        '''
+        verify password and rehash it if stored hash uses weaker cost or deprecated scheme
+
+        Args:
+            plaine_pwd: readable password 'as is'
+            hashed_pwd: hashed password to compare with
+        Returns:
+            'tuple': True if success False othervise, and new hash to store or None
+        '''
+        return await self.run_hashing(self.pwd_context.verify_and_update, plaine_pwd, hashed_pwd)
 
-    def get_pasword_hash(self, password: str) -> str:
+    async def get_pasword_hash(self, password: str) -> str:
         '''
         make hash of the plain password
 
@@ -43,7 +86,49 @@ class Auth():
         Returns:
             'str': hashed password
         '''
-        return self.pwd_context.hash(password)
+        return await self.run_hashing(self.pwd_context.hash, password)
+
+    @staticmethod
+    def calibrate_rounds(measured_ms: float, measured_rounds: int, target_ms: float) -> int:
+        '''
+        calculate bcrypt cost for target hashing time, every next round doubles the time
+
+        Args:
+            measured_ms: hashing time measured with measured_rounds
+            measured_rounds: bcrypt cost used for measurement
+            target_ms: desired hashing time
+        Returns:
+            'int': bcrypt cost within PWD_MIN_ROUNDS..PWD_MAX_ROUNDS
+        '''
+        rounds = measured_rounds + round(math.log2(target_ms / max(measured_ms, 0.001)))
+        return min(max(rounds, config.PWD_MIN_ROUNDS), config.PWD_MAX_ROUNDS)
+
+    async def calibrate_hashing(self, target_ms: float = config.PWD_HASH_TARGET_MS, measured_rounds: int = 8) -> int:
+        '''
+        measure bcrypt speed and set cost of new hashes to reach target hashing time,
+        stored hashes with lower cost are upgraded on login
+
+        Args:
+            target_ms: desired hashing time
+            measured_rounds: bcrypt cost used for measurement
+        Returns:
+            'int': bcrypt cost of new hashes
+        '''
+        probe = CryptContext(schemes=['bcrypt'], bcrypt__rounds=measured_rounds)
+
+        def measure():
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                probe.hash('calibration')
+                timings.append((time.perf_counter() - start) * 1000)
+            return min(timings)
+
+        measured_ms = await self.run_hashing(measure)
+        rounds = self.calibrate_rounds(measured_ms, measured_rounds, target_ms)
+        Auth.pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto',
+                                        bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+        return rounds
 
     async def create_access_token(self, data: dict, expires_delta: Optional[int] = 15) -> str:
         '''
@@ -131,7 +216,8 @@ class Auth():
             token: access token. Default = Depends(oauth2_scheme)
             db: async db session. Default = Depends(get_db)
         Returns:
-            obj: 'User' | None: user db record
+            obj: 'User' | None: user db record, or detached 'User' built from cache or from the record
+            loaded by concurrent request
         Raises:
             HTTPException: If Invalid scope of the token or invalid token
         '''
@@ -153,15 +239,20 @@ class Auth():
         except JWTError:
             raise credential_exception
         
-        user = await self.cache.get(f'user:{email}')
-        if user is None:
+        cached = await self.cache.get(email)
+        if cached is not None:
+            return User(**cached)
+
+        async def load():
             user = await rep_users.get_user_by_email(email=email, db=db)
             if user is None:
-                raise credential_exception
-            await self.cache.set(f'user:{email}', pickle.dumps(user))
-            await self.cache.expire(f'user:{email}', 900)
-        else:
-            user = pickle.loads(user)
-        return user
+                return None, None
+            return user, await self.cache.set(email, user)
+
+        (user, cached), shared = await self.flight.do(f'user:{email}', load)
+        if user is None:
+            raise credential_exception
+        # record of another request's session is not used outside of it
+        return User(**cached) if shared else user
 
 auth_service = Auth()
\ No newline at end of file
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.conf.config import config, Settings
+from src.conf import messages
+
+
+def process_avatar(data: bytes, size: int, quality: int = 85) -> bytes:
+    '''
+    Decodes image, crops it to square thumbnail and encodes as JPEG.
+    CPU bound, runs in worker pool.
+
+    Args:
+        data: uploaded image
+        size: side of the thumbnail in pixels
+        quality: JPEG quality
+    Returns:
+        'bytes': JPEG image
+    Raises:
+        ValueError: If data is not a supported image
+    '''
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG is decoded at reduced scale, close to thumbnail size
+            image.draft('RGB', (size, size))
+            image = ImageOps.exif_transpose(image)
+            thumbnail = ImageOps.fit(image.convert('RGB'), (size, size), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as err:
+        raise ValueError(str(err)) from err
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def is_image(data: bytes) -> bool:
+    '''
+    Checks header of image file, image is not decoded.
+
+    Args:
+        data: uploaded file
+    Returns:
+        'bool': True if Pillow recognizes format of the file and image is not too large to decode
+    '''
+    try:
+        with Image.open(io.BytesIO(data)):
+            return True
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return False
+
+
+class AvatarStorage(ABC):
+    '''
+    Storage backend of processed avatars
+    '''
+
+    @abstractmethod
+    async def save(self, key: str, data: bytes) -> str:
+        '''
+        Stores avatar, replacing previous one with the same key.
+
+        Args:
+            key: avatar ID, e.g. 'user:<e-mail>'
+            data: JPEG image
+        Returns:
+            'str': URL of stored avatar, changes with every upload
+        '''
+
+    async def close(self) -> None:
+        pass
+
+
+class CloudinaryStorage(AvatarStorage):
+    '''
+    Cloudinary upload API over reusable async HTTP connection
+    '''
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, client: httpx.AsyncClient | None = None):
+        self.url = f'https://api.cloudinary.com/v1_1/{cloud_name}/image/upload'
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.client = client or httpx.AsyncClient(timeout=30)
+
+    def sign(self, params: dict) -> str:
+        '''
+        Signs upload parameters as Cloudinary API requires.
+
+        Args:
+            params: upload parameters except file and api_key
+        Returns:
+            'str': SHA-1 signature
+        '''
+        payload = '&'.join(f'{name}={params[name]}' for name in sorted(params))
+        return hashlib.sha1((payload + self.api_secret).encode()).hexdigest()
+
+    async def save(self, key: str, data: bytes) -> str:
+        params = {'public_id': key, 'overwrite': 'true', 'invalidate': 'true', 'timestamp': str(int(time.time()))}
+        response = await self.client.post(
+            self.url,
+            data={**params, 'api_key': self.api_key, 'signature': self.sign(params)},
+            files={'file': ('avatar.jpg', data, 'image/jpeg')})
+        response.raise_for_status()
+        return response.json()['secure_url']
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class LocalStorage(AvatarStorage):
+    '''
+    Avatars stored as files in local directory and served by the application
+    '''
+
+    def __init__(self, directory: str, base_url: str):
+        self.directory = Path(directory)
+        self.base_url = base_url.rstrip('/')
+
+    def write(self, name: str, data: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self.directory / f'.{name}.{os.getpid()}'
+        temporary.write_bytes(data)
+        os.replace(temporary, self.directory / name)
+
+    async def save(self, key: str, data: bytes) -> str:
+        name = hashlib.sha1(key.encode()).hexdigest() + '.jpg'
+        await asyncio.to_thread(self.write, name, data)
+        # version in query string busts caches of previous avatar
+        return f'{self.base_url}/{name}?v={hashlib.sha1(data).hexdigest()[:12]}'
+
+
+def make_storage(settings: Settings) -> AvatarStorage:
+    '''
+    Creates avatar storage backend selected by AVATAR_STORAGE
+
+    Args:
+        settings: application settings
+    Returns:
+        obj: 'AvatarStorage'
+    '''
+    if settings.AVATAR_STORAGE == 'local':
+        return LocalStorage(settings.AVATAR_LOCAL_DIR, settings.AVATAR_BASE_URL)
+    return CloudinaryStorage(settings.CLOUDINARY_NAME, settings.CLOUDINARY_API_KEY, settings.CLOUDINARY_API_SECRET)
+
+
+class AvatarService():
+    '''
+    Avatar pipeline: image is resized in worker pool, then stored without blocking event loop
+    '''
+
+    def __init__(self, storage: AvatarStorage, size: int, max_bytes: int, workers: int):
+        '''
+        Args:
+            storage: storage backend
+            size: side of avatar in pixels
+            max_bytes: max size of uploaded image
+            workers: threads resizing images, Pillow releases GIL while decoding and resizing
+        '''
+        self.storage = storage
+        self.size = size
+        self.max_bytes = max_bytes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='avatar')
+
+    async def read(self, file: UploadFile) -> bytes:
+        '''
+        Reads uploaded image and checks it.
+
+        Args:
+            file: uploaded image
+        Returns:
+            'bytes': content of the file
+        Raises:
+            HTTPException: If file is too large or is not an image
+        '''
+        data = await file.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=messages.AVATAR_TOO_LARGE)
+        if not is_image(data):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.AVATAR_INVALID)
+        return data
+
+    async def store(self, key: str, data: bytes) -> str:
+        '''
+        Resizes image and stores it.
+
+        Args:
+            key: avatar ID, e.g. 'user:<e-mail>'
+            data: content of image file
+        Returns:
+            'str': URL of stored avatar
+        Raises:
+            ValueError: If data is not a valid image
+        '''
+        thumbnail = await asyncio.get_running_loop().run_in_executor(self.executor, process_avatar, data, self.size)
+        return await self.storage.save(key, thumbnail)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+avatar_service = AvatarService(make_storage(config), size=config.AVATAR_SIZE,
+                               max_bytes=config.AVATAR_MAX_BYTES, workers=config.AVATAR_WORKERS)
@@ -0,0 +1,348 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.database.db import rds_cache
+from src.database.schemas import UserCacheSchema
+from src.conf.config import config
+
+
+class SingleFlight():
+    '''
+    Coalesces concurrent calls with the same key: the first caller runs the fetch,
+    callers arriving while it is in flight wait for the same result.
+    '''
+
+    def __init__(self):
+        self.calls: dict[str, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fetch: Callable[[], Awaitable]) -> tuple[object, bool]:
+        '''
+        Runs fetch once for all concurrent callers with the same key.
+        If the caller running fetch is cancelled, waiting callers are not:
+        one of them runs its own fetch.
+
+        Args:
+            key: key of the call
+            fetch: coroutine function to run
+        Returns:
+            'tuple': result of fetch and True if it was shared from another caller
+        Raises:
+            Exception: raised by fetch, for every waiting caller
+        '''
+        while (future := self.calls.get(key)) is not None:
+            self.coalesced += 1
+            # unlike awaiting the future, wait() raises CancelledError only if this caller is cancelled
+            await asyncio.wait((future,))
+            if not future.cancelled():
+                return future.result(), True
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.executed += 1
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            # mark exception as retrieved if there were no waiting callers
+            future.exception()
+            raise
+        finally:
+            del self.calls[key]
+        future.set_result(result)
+        return result, False
+
+    def stats(self) -> dict:
+        return {'executed': self.executed, 'coalesced': self.coalesced}
+
+
+class ReadThroughCache():
+    '''
+    Per-user Redis cache of query results.
+
+    Cached values are stored under keys which include per-user generation counter,
+    every write bumps the counter, so pages cached before the write are never served again
+    and expire by TTL. Concurrent misses of the same key share one database query.
+    Redis failures are not fatal: query goes to database.
+    '''
+
+    def __init__(self, redis: Redis, schema: type[BaseModel], prefix: str, ttl: int):
+        '''
+        Args:
+            redis: async redis client
+            schema: pydantic schema to encode cached objects with
+            prefix: prefix of cache keys
+            ttl: time to live of cached values in seconds, 0 disables cache
+        '''
+        self.redis = redis
+        self.schema = schema
+        self.prefix = prefix
+        self.ttl = ttl
+        self.flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def generation_key(self, user_id: int) -> str:
+        return f'{self.prefix}:{user_id}:gen'
+
+    def key(self, user_id: int, generation: int, operation: str, params: dict) -> str:
+        '''
+        Builds cache key from normalized query parameters.
+
+        Args:
+            user_id: ID of the user who owns the data
+            generation: current generation of user's data
+            operation: name of cached query
+            params: query parameters
+        Returns:
+            'str': cache key
+        '''
+        normalized = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()[:20]
+        return f'{self.prefix}:{user_id}:{generation}:{operation}:{digest}'
+
+    async def generation(self, user_id: int) -> int:
+        '''
+        Reads generation of user's data.
+
+        Args:
+            user_id: ID of the user
+        Returns:
+            'int': generation counter, 0 if user's data was never changed
+        '''
+        value = await self.redis.get(self.generation_key(user_id))
+        return int(value or 0)
+
+    def encode(self, value, schema: type[BaseModel] | None = None) -> str:
+        schema = schema or self.schema
+        if isinstance(value, (list, tuple)):
+            return json.dumps([schema.model_validate(item).model_dump(mode='json') for item in value])
+        if value is None:
+            return 'null'
+        return json.dumps(schema.model_validate(value).model_dump(mode='json'))
+
+    def decode(self, raw: str, schema: type[BaseModel] | None = None):
+        schema = schema or self.schema
+        value = json.loads(raw)
+        if isinstance(value, list):
+            return [schema.model_validate(item) for item in value]
+        if value is None:
+            return None
+        return schema.model_validate(value)
+
+    async def cached(self, user_id: int, operation: str, params: dict, fetch: Callable[[], Awaitable],
+                     schema: type[BaseModel] | None = None):
+        '''
+        Returns cached result of the query or fetches and caches it.
+
+        Args:
+            user_id: ID of the user who owns the data
+            operation: name of cached query
+            params: query parameters
+            fetch: coroutine function to query database on cache miss
+            schema: schema of the result if it differs from cache schema, e.g. for column projections. Optional
+        Returns:
+            result of fetch or cached result decoded into schema instances
+        '''
+        if not self.enabled:
+            return await fetch()
+        try:
+            key = self.key(user_id, await self.generation(user_id), operation, params)
+            raw = await self.redis.get(key)
+        except RedisError:
+            self.errors += 1
+            return await fetch()
+        if raw is not None:
+            self.hits += 1
+            return self.decode(raw, schema)
+
+        self.misses += 1
+
+        async def fetch_and_store():
+            result = await fetch()
+            try:
+                await self.redis.set(key, self.encode(result, schema), ex=self.ttl)
+            except RedisError:
+                self.errors += 1
+            return result
+
+        result, _ = await self.flight.do(key, fetch_and_store)
+        return result
+
+    async def invalidate(self, user_id: int) -> None:
+        '''
+        Bumps generation of user's data, must be called after changes are committed.
+
+        Args:
+            user_id: ID of the user who owns the data
+        Returns:
+            None
+        '''
+        if not self.enabled:
+            return
+        try:
+            await self.redis.incr(self.generation_key(user_id))
+        except RedisError:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors, **self.flight.stats()}
+
+
+class UserCache():
+    '''
+    Two-tier cache of authenticated users: in-process LRU (L1) in front of Redis (L2).
+
+    Users are stored as UserCacheSchema JSON (no password hash and tokens).
+    Invalidation deletes L2 entry and is published over Redis pub/sub,
+    so every worker drops its L1 entry.
+    '''
+    channel = 'user-cache:invalidate'
+
+    def __init__(self, redis: Redis, ttl: int, local_ttl: int, local_size: int):
+        '''
+        Args:
+            redis: async redis client
+            ttl: time to live of Redis entries in seconds, 0 disables cache
+            local_ttl: time to live of in-process entries in seconds
+            local_size: max number of in-process entries
+        '''
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.local: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.local_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f'users:{email}'
+
+    def remember(self, email: str, data: dict) -> None:
+        self.local[email] = (time.monotonic() + self.local_ttl, data)
+        self.local.move_to_end(email)
+        while len(self.local) > self.local_size:
+            self.local.popitem(last=False)
+
+    async def get(self, email: str) -> dict | None:
+        '''
+        Finds cached user.
+
+        Args:
+            email: user's e-mail
+        Returns:
+            'dict' | None: UserCacheSchema fields of the user
+        '''
+        if not self.enabled:
+            return None
+        entry = self.local.get(email)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.local.move_to_end(email)
+                self.local_hits += 1
+                return entry[1]
+            del self.local[email]
+        try:
+            raw = await self.redis.get(self.key(email))
+        except RedisError:
+            self.errors += 1
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        data = UserCacheSchema.model_validate_json(raw).model_dump()
+        self.remember(email, data)
+        return data
+
+    async def set(self, email: str, user) -> dict:
+        '''
+        Caches user in both tiers.
+
+        Args:
+            email: user's e-mail
+            user: 'User' db record
+        Returns:
+            'dict': cached fields of the user
+        '''
+        data = UserCacheSchema.model_validate(user)
+        if self.enabled:
+            try:
+                await self.redis.set(self.key(email), data.model_dump_json(), ex=self.ttl)
+            except RedisError:
+                self.errors += 1
+            self.remember(email, data.model_dump())
+        return data.model_dump()
+
+    async def invalidate(self, email: str) -> None:
+        '''
+        Drops cached user in all workers, must be called after changes are committed.
+
+        Args:
+            email: user's e-mail
+        Returns:
+            None
+        '''
+        self.local.pop(email, None)
+        if not self.enabled:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                await pipe.delete(self.key(email)).publish(self.channel, email).execute()
+        except RedisError:
+            self.errors += 1
+
+    async def listen(self) -> None:
+        '''
+        Evicts in-process entries invalidated by other workers, runs until cancelled.
+        While Redis is unavailable it reconnects with exponential backoff.
+
+        Returns:
+            None
+        '''
+        delay = 1
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.local.pop(message['data'], None)
+            except RedisError:
+                self.errors += 1
+            # invalidations could be missed while disconnected
+            self.local.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def stats(self) -> dict:
+        return {'local_hits': self.local_hits, 'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+
+user_cache = UserCache(rds_cache, ttl=config.USER_CACHE_TTL,
+                       local_ttl=config.USER_CACHE_LOCAL_TTL, local_size=config.USER_CACHE_LOCAL_SIZE)
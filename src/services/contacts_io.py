@@ -0,0 +1,295 @@
+import codecs
+import csv
+import io
+import json
+import re
+from typing import AsyncIterator
+
+RECORD_FIELDS = ('first_name', 'last_name', 'email', 'birthday', 'notes')
+EXPORT_FIELDS = ('id',) + RECORD_FIELDS
+# contact fields take a few hundred characters, longer lines and records are not buffered
+MAX_LINE_LENGTH = 16 * 1024
+MAX_RECORD_LINES = 50
+LINE_TOO_LONG = 'Line is too long'
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_length: int = MAX_LINE_LENGTH) -> AsyncIterator[str | None]:
+    '''
+    Splits stream of byte chunks into text lines without reading the whole stream.
+    Line longer than max_length is dropped and None is yielded in its place,
+    so at most max_length characters (plus one chunk) are buffered.
+
+    Args:
+        chunks: byte chunks, e.g. request.stream()
+        max_length: max number of characters of a line
+    Yields:
+        'str' | None: line without line break or None for a too long line
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    tail = ''
+    # rest of a too long line is dropped up to the next line break
+    skipping = False
+    async for chunk in chunks:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split('\n')
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield line.rstrip('\r') if len(line) <= max_length else None
+        if len(tail) > max_length:
+            if not skipping:
+                yield None
+            skipping, tail = True, ''
+    tail += decoder.decode(b'', final=True)
+    if tail and not skipping:
+        yield tail.rstrip('\r') if len(tail) <= max_length else None
+
+
+def normalize(row: dict) -> dict:
+    '''
+    Keeps only contact fields, missing and empty values become None.
+
+    Args:
+        row: parsed row
+    Returns:
+        'dict': contact data to validate with RecordSchema
+    '''
+    return {field: row.get(field) or None for field in RECORD_FIELDS}
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    '''
+    Parses newline delimited JSON, one contact object per line.
+
+    Args:
+        lines: text lines
+    Yields:
+        'tuple': row number and contact data or error message
+    '''
+    row = 0
+    async for line in lines:
+        if line is None:
+            row += 1
+            yield row, LINE_TOO_LONG
+            continue
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            data = json.loads(line)
+        except ValueError as err:
+            yield row, f'Invalid JSON: {err}'
+            continue
+        if not isinstance(data, dict):
+            yield row, 'Invalid JSON: object expected'
+            continue
+        yield row, normalize(data)
+
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    '''
+    Parses CSV with header line. Quoted values may span several lines, up to MAX_RECORD_LINES
+    lines and MAX_LINE_LENGTH characters, a longer record is reported as unterminated
+    and parsing continues with the next line.
+
+    Args:
+        lines: text lines
+    Yields:
+        'tuple': row number and contact data or error message
+    '''
+    header = None
+    row = 0
+    pending: list[str] = []
+    size = 0
+    # odd number of quotes so far, parity is updated line by line ("" keeps it)
+    quoted = False
+    async for line in lines:
+        if line is None:
+            pending, size, quoted = [], 0, False
+            row += 1
+            yield row, LINE_TOO_LONG
+            continue
+        pending.append(line)
+        size += len(line)
+        quoted ^= line.count('"') % 2 == 1
+        if quoted:
+            if len(pending) < MAX_RECORD_LINES and size <= MAX_LINE_LENGTH:
+                continue
+            pending, size, quoted = [], 0, False
+            row += 1
+            yield row, 'Unterminated quoted value'
+            continue
+        record = '\n'.join(pending)
+        pending, size = [], 0
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f'Expected {len(header)} values, got {len(values)}'
+            continue
+        yield row, normalize(dict(zip(header, values)))
+    if pending:
+        yield row + 1, 'Unterminated quoted value'
+
+
+def vcard_unescape(value: str) -> str:
+    '''
+    Unescapes vCard text value (\\n, \\, \\; \\\\).
+
+    Args:
+        value: raw property value
+    Returns:
+        'str': text value
+    '''
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def vcard_escape(value: str) -> str:
+    '''
+    Escapes text for vCard property value.
+
+    Args:
+        value: text value
+    Returns:
+        'str': escaped value
+    '''
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace(',', '\\,').replace(';', '\\;')
+
+
+def vcard_to_record(card: dict) -> dict:
+    '''
+    Maps vCard properties to contact fields.
+
+    Args:
+        card: vCard property name to raw value
+    Returns:
+        'dict': contact data
+    '''
+    last_name, first_name = None, None
+    if 'N' in card:
+        parts = card['N'].split(';')
+        last_name = vcard_unescape(parts[0])
+        first_name = vcard_unescape(parts[1]) if len(parts) > 1 else None
+    if not first_name and 'FN' in card:
+        first_name = vcard_unescape(card['FN'])
+    birthday = card.get('BDAY')
+    if birthday and len(birthday) == 8 and birthday.isdigit():
+        birthday = f'{birthday[:4]}-{birthday[4:6]}-{birthday[6:]}'
+    return normalize({
+        'first_name': first_name,
+        'last_name': last_name,
+        'email': card.get('EMAIL'),
+        'birthday': birthday,
+        'notes': vcard_unescape(card['NOTE']) if 'NOTE' in card else None,
+    })
+
+
+async def parse_vcard(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    '''
+    Parses vCard 3.0/4.0 stream, one contact per BEGIN:VCARD ... END:VCARD block.
+
+    Args:
+        lines: text lines
+    Yields:
+        'tuple': row (card) number and contact data or error message
+    '''
+    row = 0
+    card = None
+    last = None
+    async for line in lines:
+        if line is None:
+            # card with a too long line is skipped
+            row += 1
+            yield row, LINE_TOO_LONG
+            card, last = None, None
+            continue
+        if line[:1] in (' ', '\t') and card is not None and last:
+            # folded line continues previous property
+            card[last] += line[1:]
+            if len(card[last]) > MAX_LINE_LENGTH:
+                row += 1
+                yield row, LINE_TOO_LONG
+                card, last = None, None
+            continue
+        if not line.strip():
+            continue
+        name, _, value = line.partition(':')
+        # property parameters (EMAIL;TYPE=home) are not used
+        name = name.split(';')[0].upper()
+        if name == 'BEGIN' and value.upper() == 'VCARD':
+            card, last = {}, None
+        elif name == 'END' and value.upper() == 'VCARD' and card is not None:
+            row += 1
+            yield row, vcard_to_record(card)
+            card, last = None, None
+        elif card is not None and name not in card:
+            card[name], last = value, name
+        else:
+            last = None
+    if card is not None:
+        yield row + 1, 'Unterminated vCard'
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ndjson': parse_ndjson,
+    'vcard': parse_vcard,
+}
+
+
+def record_to_dict(record) -> dict:
+    '''
+    Converts contact to JSON compatible dict of exported fields.
+
+    Args:
+        record: contact with EXPORT_FIELDS attributes
+    Returns:
+        'dict': exported contact data
+    '''
+    data = {field: getattr(record, field) for field in EXPORT_FIELDS}
+    if data['birthday'] is not None:
+        data['birthday'] = data['birthday'].isoformat()
+    return data
+
+
+def to_ndjson(records) -> str:
+    return ''.join(json.dumps(record_to_dict(record), ensure_ascii=False) + '\n' for record in records)
+
+
+def to_csv(records) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([record_to_dict(record)[field] for field in EXPORT_FIELDS] for record in records)
+    return buffer.getvalue()
+
+
+def to_vcard(records) -> str:
+    cards = []
+    for record in records:
+        data = record_to_dict(record)
+        first_name, last_name = data['first_name'] or '', data['last_name'] or ''
+        lines = ['BEGIN:VCARD', 'VERSION:3.0',
+                 f'N:{vcard_escape(last_name)};{vcard_escape(first_name)};;;',
+                 f'FN:{vcard_escape(" ".join(filter(None, (first_name, last_name))))}']
+        if data['email']:
+            lines.append(f'EMAIL:{data["email"]}')
+        if data['birthday']:
+            lines.append(f'BDAY:{data["birthday"]}')
+        if data['notes']:
+            lines.append(f'NOTE:{vcard_escape(data["notes"])}')
+        lines.append('END:VCARD')
+        cards.append('\r\n'.join(lines) + '\r\n')
+    return ''.join(cards)
+
+
+# format: (media type, file header, serializer of a chunk of contacts)
+EXPORTERS = {
+    'csv': ('text/csv', ','.join(EXPORT_FIELDS) + '\r\n', to_csv),
+    'ndjson': ('application/x-ndjson', '', to_ndjson),
+    'vcard': ('text/vcard', '', to_vcard),
+}
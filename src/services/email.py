@@ -1,46 +1,207 @@
+import asyncio
+import contextlib
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
-from src.conf.config import config
+
+from aiosmtplib import SMTP, SMTPException, SMTPServerDisconnected
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from src.conf.config import config, Settings
 from src.services.auth import auth_service
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_FROM,
-    MAIL_PORT=config.MAIL_PORT,
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME=config.MAIL_FROM_NAME,
-    MAIL_STARTTLS=config.MAIL_STARTTLS,
-    MAIL_SSL_TLS=config.MAIL_SSL_TLS,
-    USE_CREDENTIALS=config.USE_CREDENTIALS,
-    VALIDATE_CERTS=config.VALIDATE_CERTS,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
-
-async def send_email(email: str, username:str, host:str) -> None:
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+class MailSender():
     '''
-    Constructs and send e-mail confirmation letter
+    Long-lived e-mail sender.
+
+    Messages are put in a queue and sent by a fixed number of workers, every worker keeps
+    its own SMTP connection open and sends queued messages in batches over it.
+    Idle connections are closed after MAIL_IDLE_TIMEOUT and reopened on demand.
+    Templates are compiled once, when the sender is created.
+    '''
+
+    def __init__(self, settings: Settings, template_folder: Path = TEMPLATE_FOLDER):
+        '''
+        Args:
+            settings: application settings with MAIL_* parameters
+            template_folder: folder of Jinja templates
+        '''
+        self.settings = settings
+        self.env = Environment(loader=FileSystemLoader(template_folder), autoescape=select_autoescape(),
+                               enable_async=False, cache_size=-1)
+        self.templates = {name: self.env.get_template(name) for name in self.env.list_templates()}
+        self.queue: asyncio.Queue[tuple[EmailMessage, asyncio.Future]] | None = None
+        self.workers: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+
+    def render(self, template_name: str, **context) -> str:
+        return self.templates[template_name].render(**context)
+
+    def message(self, recipient: str, subject: str, template_name: str, **context) -> EmailMessage:
+        '''
+        Builds HTML message from cached template.
+
+        Args:
+            recipient: e-mail of the recipient
+            subject: subject of the message
+            template_name: name of template file
+            context: template variables
+        Returns:
+            obj: 'EmailMessage'
+        '''
+        message = EmailMessage()
+        message['From'] = formataddr((self.settings.MAIL_FROM_NAME, self.settings.MAIL_FROM))
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.set_content(self.render(template_name, **context), subtype='html')
+        return message
+
+    def start(self) -> None:
+        '''
+        Starts workers in running event loop, does nothing if they are running.
+        Workers which stopped are replaced, queued messages are kept.
+
+        Returns:
+            None
+        '''
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        if len(self.workers) >= self.settings.MAIL_POOL_SIZE:
+            return
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.workers += [asyncio.create_task(self.work()) for _ in range(self.settings.MAIL_POOL_SIZE - len(self.workers))]
+
+    async def send(self, message: EmailMessage) -> asyncio.Future:
+        '''
+        Queues message for sending.
+
+        Args:
+            message: message to send
+        Returns:
+            'Future': resolved when message is sent, holds SMTP error if sending failed
+        '''
+        self.start()
+        delivery = asyncio.get_running_loop().create_future()
+        await self.queue.put((message, delivery))
+        return delivery
+
+    def connection(self) -> SMTP:
+        settings = self.settings
+        return SMTP(hostname=settings.MAIL_SERVER, port=settings.MAIL_PORT, use_tls=settings.MAIL_SSL_TLS,
+                    start_tls=settings.MAIL_STARTTLS, validate_certs=settings.VALIDATE_CERTS, timeout=30)
+
+    async def connect(self, smtp: SMTP) -> None:
+        await smtp.connect()
+        if self.settings.USE_CREDENTIALS:
+            await smtp.login(self.settings.MAIL_USERNAME, self.settings.MAIL_PASSWORD)
+        self.connections += 1
+
+    async def deliver(self, smtp: SMTP, message: EmailMessage) -> None:
+        '''
+        Sends message over worker's connection, connection is reopened once if server closed it.
+
+        Args:
+            smtp: worker's connection
+            message: message to send
+        Returns:
+            None
+        '''
+        for attempt in (1, 2):
+            try:
+                if not smtp.is_connected:
+                    await self.connect(smtp)
+                await smtp.send_message(message)
+                self.sent += 1
+                return
+            except SMTPServerDisconnected:
+                smtp.close()
+                if attempt == 2:
+                    raise
+
+    async def work(self) -> None:
+        '''
+        Worker sending batches of queued messages over one connection, runs until cancelled.
+
+        Returns:
+            None
+        '''
+        smtp = self.connection()
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), self.settings.MAIL_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    if smtp.is_connected:
+                        with contextlib.suppress(SMTPException, OSError):
+                            await smtp.quit()
+                    continue
+                batch = [item]
+                while len(batch) < self.settings.MAIL_BATCH_SIZE and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                for message, delivery in batch:
+                    try:
+                        await self.deliver(smtp, message)
+                        if not delivery.done():
+                            delivery.set_result(None)
+                    except Exception as err:
+                        # any error of one message, e.g. malformed address, must not stop the worker
+                        self.failed += 1
+                        smtp.close()
+                        print(err)
+                        if not delivery.done():
+                            delivery.set_exception(err)
+                            # mark exception as retrieved if nobody waits for delivery
+                            delivery.exception()
+                    finally:
+                        self.queue.task_done()
+        finally:
+            if smtp.is_connected:
+                smtp.close()
+
+    async def close(self, timeout: float = 10) -> None:
+        '''
+        Sends queued messages and stops workers.
+
+        Args:
+            timeout: seconds to wait for queued messages
+        Returns:
+            None
+        '''
+        if not self.workers:
+            return
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.queue.join(), timeout)
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.queue = None
+
+    def stats(self) -> dict:
+        return {'sent': self.sent, 'failed': self.failed, 'connections': self.connections,
+                'queued': self.queue.qsize() if self.queue else 0}
+
+
+mail_sender = MailSender(config)
+
+
+async def send_email(email: str, username:str, host:str) -> asyncio.Future:
+    '''
+    Constructs e-mail confirmation letter and queues it for sending
 
     Args:
         email: user's e-mail
         username: user name
         host: domain adress where application deployed. Example: http://example.com:80
     Returns:
-        None
-    Raises:
-        ConnectionErrors: If connection fails
+        'Future': resolved when letter is sent
     '''
-    try:
-        email_token = await auth_service.create_email_token({'sub':email})
-        message = MessageSchema(
-            recipients=[email], 
-            subject='Confirm your e-mail', 
-            template_body={'fullname': username, 'host': host, 'token': email_token}, subtype=MessageType.html
-            )
-        
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name='email_confirmation.html')
-    except ConnectionErrors as err:
-        print(err)
-
+    email_token = await auth_service.create_email_token({'sub':email})
+    message = mail_sender.message(email, 'Confirm your e-mail', 'email_confirmation.html',
+                                  fullname=username, host=host, token=email_token)
+    return await mail_sender.send(message)
@@ -0,0 +1,46 @@
+import hashlib
+from typing import Iterable
+
+
+def make_etag(records: Iterable, variant: str = '') -> str:
+    '''
+    Builds strong entity tag of contacts from their IDs and modification times,
+    so it is computed without serializing the contacts.
+
+    Args:
+        records: contacts with id and updated_at attributes
+        variant: representation of the contacts, e.g. list of projected fields. Optional
+    Returns:
+        'str': quoted entity tag
+    '''
+    digest = hashlib.blake2b(variant.encode(), digest_size=12)
+    for record in records:
+        updated_at = record.updated_at.isoformat() if record.updated_at else ''
+        digest.update(f'{record.id}:{updated_at};'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(header: str | None, etag: str, weak: bool = True) -> bool:
+    '''
+    Checks whether entity tag is listed in If-None-Match or If-Match header.
+
+    Args:
+        header: header value, e.g. '"abc", W/"def"' or '*'
+        etag: current entity tag
+        weak: use weak comparison (If-None-Match), strong comparison ignores weak tags (If-Match)
+    Returns:
+        'bool': True if header matches the entity tag
+    '''
+    if header is None:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
@@ -0,0 +1,81 @@
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Sequence
+
+import orjson
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+from src.database.schemas import RecordResponseSchema, record_projection_schema
+
+RECORD_FIELDS = tuple(RecordResponseSchema.model_fields)
+records_adapter = TypeAdapter(list[RecordResponseSchema])
+
+
+@lru_cache(maxsize=128)
+def fields_getter(fields: tuple[str, ...]) -> Callable[[Any], tuple]:
+    getter = attrgetter(*fields)
+    return getter if len(fields) > 1 else lambda record: (getter(record),)
+
+
+@lru_cache(maxsize=128)
+def projection_adapter(fields: tuple[str, ...]) -> TypeAdapter:
+    '''
+    TypeAdapter validating and dumping contacts trimmed to given fields.
+
+    Args:
+        fields: names of RecordResponseSchema fields
+    Returns:
+        obj: 'TypeAdapter' of list of record_projection_schema(fields)
+    '''
+    return TypeAdapter(list[record_projection_schema(fields)])
+
+
+def dump_records(records: Sequence, fields: tuple[str, ...] | None = None) -> bytes:
+    '''
+    Serializes contacts to JSON array of RecordResponseSchema objects without validation.
+
+    Contacts read from our database already match the schema, so ORM records and rows are
+    dumped from their attributes with orjson, and cached RecordResponseSchema
+    instances are dumped by pydantic TypeAdapter in one call.
+
+    Args:
+        records: 'Record' db records, rows or schema instances
+        fields: dump only these fields. Optional
+    Returns:
+        'bytes': JSON array
+    '''
+    if fields is None and records and isinstance(records[0], RecordResponseSchema):
+        return records_adapter.dump_json(records)
+    fields = fields or RECORD_FIELDS
+    get_fields = fields_getter(fields)
+    return orjson.dumps([dict(zip(fields, get_fields(record))) for record in records],
+                        option=orjson.OPT_UTC_Z)
+
+
+def validate_records(records: Sequence, fields: tuple[str, ...]) -> bytes:
+    '''
+    Validates contacts with trimmed schema and serializes them, as response_model does.
+
+    Args:
+        records: 'Record' db records, rows or schema instances
+        fields: fields of trimmed schema
+    Returns:
+        'bytes': JSON array
+    '''
+    adapter = projection_adapter(fields)
+    return adapter.dump_json(adapter.validate_python(records, from_attributes=True))
+
+
+class RecordsJSONResponse(Response):
+    '''
+    JSON response with list of contacts serialized by dump_records
+    '''
+    media_type = 'application/json'
+
+    def __init__(self, content: Any, fields: tuple[str, ...] | None = None, **kwargs):
+        self.fields = fields
+        super().__init__(content, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return dump_records(content, self.fields)
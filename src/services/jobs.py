@@ -0,0 +1,222 @@
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from src.database.db import rds_cache
+from src.conf.config import config
+
+JOB_SEND_EMAIL = 'send_email'
+JOB_AVATAR = 'avatar'
+
+# moves due retries from sorted set back to the stream in one step
+PROMOTE_SCRIPT = '''
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    local job = cjson.decode(member)
+    redis.call('XADD', KEYS[2], '*', 'job', job.job, 'payload', job.payload, 'attempt', job.attempt)
+    redis.call('ZREM', KEYS[1], member)
+end
+return #due
+'''
+
+
+class JobError(Exception):
+    '''
+    Job failure which can't be fixed by retry, job is moved to dead-letter stream at once.
+    '''
+
+
+class JobQueue():
+    '''
+    Durable queue of background jobs in Redis Stream, read by worker processes in consumer group.
+
+    Job is removed from the stream when handler finishes. Failed job is retried with
+    exponential backoff: it waits in sorted set '<stream>:delayed' until it is due and is added
+    to the stream again. After JOB_MAX_ATTEMPTS failures job goes to '<stream>:dead' stream.
+    Jobs of crashed workers are claimed by other workers after JOB_CLAIM_IDLE seconds.
+    '''
+
+    def __init__(self, redis: Redis, stream: str, max_attempts: int, backoff_base: float, backoff_max: float,
+                 claim_idle: float, group: str = 'workers'):
+        '''
+        Args:
+            redis: async redis client, decoding responses
+            stream: name of the stream
+            max_attempts: attempts to run job before it goes to dead-letter stream
+            backoff_base: delay in seconds before the first retry, doubled for every next one
+            backoff_max: max delay before retry in seconds
+            claim_idle: seconds after which job read by other worker is considered lost
+            group: name of consumer group of workers
+        '''
+        self.redis = redis
+        self.stream = stream
+        self.delayed = f'{stream}:delayed'
+        self.dead = f'{stream}:dead'
+        self.group = group
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.claim_idle = claim_idle
+        self.handlers: dict[str, Callable[..., Awaitable]] = {}
+        self.promote_script = redis.register_script(PROMOTE_SCRIPT)
+        self.group_ready = False
+        self.claimed_at = 0.0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def handler(self, name: str) -> Callable:
+        '''
+        Decorator registering coroutine function as handler of jobs with given name.
+
+        Args:
+            name: name of the job
+        Returns:
+            'Callable': decorator
+        '''
+        def register(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+            self.handlers[name] = func
+            return func
+        return register
+
+    async def enqueue(self, name: str, **payload) -> str:
+        '''
+        Adds job to the queue.
+
+        Args:
+            name: name of the job
+            payload: JSON serializable keyword arguments of the handler
+        Returns:
+            'str': ID of stream entry
+        Raises:
+            RedisError: If Redis is not available
+        '''
+        return await self.redis.xadd(self.stream, {'job': name, 'payload': json.dumps(payload), 'attempt': 0})
+
+    async def ensure_group(self) -> None:
+        if self.group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as err:
+            if 'BUSYGROUP' not in str(err):
+                raise
+        self.group_ready = True
+
+    def backoff(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt)
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict]]:
+        '''
+        Returns jobs for consumer: due retries are moved to the stream,
+        jobs of lost workers are claimed, then new jobs are read.
+
+        Args:
+            consumer: name of the worker
+            count: max number of jobs
+            block_ms: milliseconds to wait for new jobs
+        Returns:
+            'list': stream entries (ID, fields)
+        '''
+        await self.promote_script(keys=[self.delayed, self.stream], args=[time.time(), count])
+        now = time.monotonic()
+        if now - self.claimed_at >= self.claim_idle / 2:
+            self.claimed_at = now
+            claimed = await self.redis.xautoclaim(self.stream, self.group, consumer, int(self.claim_idle * 1000),
+                                                  start_id='0-0', count=count)
+            entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+            if entries:
+                return entries
+        response = await self.redis.xreadgroup(self.group, consumer, {self.stream: '>'}, count=count, block=block_ms)
+        return response[0][1] if response else []
+
+    async def process(self, entry_id: str, fields: dict) -> None:
+        '''
+        Runs handler of the job, reschedules or buries the job if handler fails.
+
+        Args:
+            entry_id: ID of stream entry
+            fields: fields of stream entry
+        Returns:
+            None
+        '''
+        attempt = int(fields.get('attempt', 0))
+        try:
+            handler = self.handlers.get(fields.get('job'))
+            if handler is None:
+                raise JobError(f'Unknown job {fields.get("job")!r}')
+            await handler(**json.loads(fields['payload']))
+        except Exception as err:
+            print(f'Job {entry_id} {fields.get("job")} failed: {err!r}')
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if isinstance(err, JobError) or attempt + 1 >= self.max_attempts:
+                    self.failed += 1
+                    pipe.xadd(self.dead, {**fields, 'error': repr(err), 'failed_id': entry_id})
+                else:
+                    self.retried += 1
+                    job = json.dumps({'id': entry_id, 'job': fields['job'], 'payload': fields['payload'],
+                                      'attempt': attempt + 1})
+                    pipe.zadd(self.delayed, {job: time.time() + self.backoff(attempt)})
+                pipe.xack(self.stream, self.group, entry_id)
+                pipe.xdel(self.stream, entry_id)
+                await pipe.execute()
+            return
+        self.processed += 1
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def run(self, consumer: str, concurrency: int, stop: asyncio.Event, block_ms: int = 1000) -> None:
+        '''
+        Processes jobs until stop is set, up to concurrency jobs run at once.
+
+        Args:
+            consumer: unique name of the worker
+            concurrency: max number of jobs processed at once
+            stop: event to stop the worker
+            block_ms: milliseconds to wait for new jobs
+        Returns:
+            None
+        '''
+        while not stop.is_set():
+            try:
+                await self.ensure_group()
+                entries = await self.read(consumer, concurrency, block_ms)
+                await asyncio.gather(*(self.process(entry_id, fields) for entry_id, fields in entries))
+            except RedisError as err:
+                print(err)
+                await asyncio.sleep(1)
+
+    async def stats(self) -> dict:
+        '''
+        Returns state of the queue.
+        depth - jobs in the stream, pending - jobs being processed by workers,
+        lag_seconds - age of the oldest job in the stream.
+
+        Returns:
+            'dict': depth, pending, delayed, dead, lag_seconds and counters of this process
+        '''
+        await self.ensure_group()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xlen(self.stream)
+            pipe.xpending(self.stream, self.group)
+            pipe.zcard(self.delayed)
+            pipe.xlen(self.dead)
+            pipe.xrange(self.stream, count=1)
+            depth, pending, delayed, dead, oldest = await pipe.execute()
+        lag = 0.0
+        if oldest:
+            lag = max(0.0, time.time() - int(oldest[0][0].split('-')[0]) / 1000)
+        return {'depth': depth, 'pending': pending['pending'], 'delayed': delayed, 'dead': dead,
+                'lag_seconds': round(lag, 3), 'processed': self.processed, 'retried': self.retried,
+                'failed': self.failed}
+
+
+job_queue = JobQueue(rds_cache, config.JOB_STREAM, max_attempts=config.JOB_MAX_ATTEMPTS,
+                     backoff_base=config.JOB_BACKOFF_BASE, backoff_max=config.JOB_BACKOFF_MAX,
+                     claim_idle=config.JOB_CLAIM_IDLE)
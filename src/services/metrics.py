@@ -0,0 +1,308 @@
+import bisect
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable
+
+from redis.asyncio import Redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import route_rst
+from src.database.db import sessionmanager
+from src.repository.contacts import contacts_cache
+from src.services.cache import user_cache
+from src.services.email import mail_sender
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_pairs(names: tuple[str, ...], values: tuple) -> str:
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter():
+    '''
+    Monotonic counter with labels
+    '''
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, values: tuple = (), amount: float = 1) -> None:
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        for values, value in self.values.items():
+            lines.append(f'{self.name}{{{label_pairs(self.labels, values)}}} {number(value)}' if values
+                         else f'{self.name} {number(value)}')
+        return lines
+
+
+class Histogram():
+    '''
+    Histogram with labels, observation costs one bisect over the buckets
+    '''
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> observations per bucket (last one is +Inf), sum of observed values
+        self.series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, values: tuple, amount: float) -> None:
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, amount)] += 1
+        series[1][0] += amount
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for values, (counts, total) in self.series.items():
+            labels = label_pairs(self.labels, values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {number(total[0])}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+@dataclass(slots=True)
+class RequestStats():
+    '''
+    DB and Redis usage of one request
+    '''
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    redis_calls: int = 0
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar('current_request', default=None)
+
+
+class Metrics():
+    '''
+    In-process metrics in Prometheus text format.
+
+    Requests are measured by MetricsMiddleware, queries by SQLAlchemy cursor events,
+    Redis calls by wrapped client. Usage of the current request is kept in context variable,
+    so queries and Redis calls are attributed to the route which made them.
+    Stats of caches, rate limiter and pool are read from their stats() when metrics are scraped.
+    '''
+
+    def __init__(self):
+        self.requests = Histogram('http_request_duration_seconds', 'Request latency by route.',
+                                  ('method', 'route', 'status'), DURATION_BUCKETS)
+        self.request_queries = Histogram('http_request_db_queries', 'DB queries per request.', ('route',), COUNT_BUCKETS)
+        self.request_db_time = Histogram('http_request_db_seconds', 'DB time per request.', ('route',), DURATION_BUCKETS)
+        self.request_redis = Histogram('http_request_redis_calls', 'Redis round trips per request.', ('route',), COUNT_BUCKETS)
+        self.queries = Counter('db_queries_total', 'DB queries.')
+        self.query_time = Counter('db_query_seconds_total', 'Time of DB queries.')
+        self.redis_calls = Counter('redis_calls_total', 'Redis round trips.')
+        self.collectors: list[Callable[[], list[str]]] = []
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        self.requests.observe((method, route, status), seconds)
+        self.request_queries.observe((route,), stats.db_queries)
+        self.request_db_time.observe((route,), stats.db_seconds)
+        self.request_redis.observe((route,), stats.redis_calls)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.observe_query(time.perf_counter() - conn.info['metrics_query_start'].pop())
+
+    def handle_error(self, context) -> None:
+        # after_cursor_execute is not called for failed statements, start time must not stay on pooled connection
+        conn = context.connection
+        starts = conn.info.get('metrics_query_start') if conn is not None else None
+        if starts:
+            self.observe_query(time.perf_counter() - starts.pop())
+
+    def observe_query(self, seconds: float) -> None:
+        self.queries.inc()
+        self.query_time.inc(amount=seconds)
+        stats = current_request.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += seconds
+
+    def instrument_db(self, target=Engine) -> None:
+        '''
+        Counts queries of all engines, or of given engine.
+
+        Args:
+            target: Engine class or sync engine
+        Returns:
+            None
+        '''
+        event.listen(target, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(target, 'after_cursor_execute', self.after_cursor_execute)
+        event.listen(target, 'handle_error', self.handle_error)
+
+    def count_redis(self) -> None:
+        self.redis_calls.inc()
+        stats = current_request.get()
+        if stats is not None:
+            stats.redis_calls += 1
+
+    def instrument_redis(self, client: Redis) -> None:
+        '''
+        Counts round trips of Redis client: commands and executed pipelines.
+
+        Args:
+            client: async redis client
+        Returns:
+            None
+        '''
+        execute_command = client.execute_command
+        pipeline = client.pipeline
+
+        async def counted_execute_command(*args, **options):
+            self.count_redis()
+            return await execute_command(*args, **options)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def counted_execute(*execute_args, **execute_kwargs):
+                self.count_redis()
+                return await execute(*execute_args, **execute_kwargs)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        client.execute_command = counted_execute_command
+        client.pipeline = counted_pipeline
+
+    def register(self, collector: Callable[[], list[str]]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.requests, self.request_queries, self.request_db_time, self.request_redis,
+                       self.queries, self.query_time, self.redis_calls):
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+def stats_metrics(prefix: str, stats: dict, counters: tuple[str, ...] = (), description: str = '') -> list[str]:
+    '''
+    Converts stats() dict of a component into metrics: keys listed in counters become
+    '<prefix>_<key>_total' counters, other numeric keys '<prefix>_<key>' gauges.
+
+    Args:
+        prefix: prefix of metric names
+        stats: stats of the component
+        counters: keys of monotonic values
+        description: help text of the metrics
+    Returns:
+        'list': lines of Prometheus text format
+    '''
+    lines = []
+    for key, value in stats.items():
+        if not isinstance(value, (int, float)):
+            continue
+        kind = 'counter' if key in counters else 'gauge'
+        name = f'{prefix}_{key}_total' if key in counters else f'{prefix}_{key}'
+        lines.extend((f'# HELP {name} {description or prefix.replace("_", " ").capitalize()}: {key}.',
+                      f'# TYPE {name} {kind}', f'{name} {number(value)}'))
+    return lines
+
+
+def gauge(name: str, description: str, value: float) -> list[str]:
+    return [f'# HELP {name} {description}', f'# TYPE {name} gauge', f'{name} {number(value)}']
+
+
+def hit_ratio(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def app_metrics() -> list[str]:
+    '''
+    Metrics of application components read from their stats()
+
+    Returns:
+        'list': lines of Prometheus text format
+    '''
+    users = user_cache.stats()
+    contacts = contacts_cache.stats()
+    return [
+        *stats_metrics('user_cache', users, counters=('local_hits', 'hits', 'misses', 'errors'), description='User cache'),
+        *gauge('user_cache_hit_ratio', 'Share of authenticated users served from cache.',
+               hit_ratio(users['local_hits'] + users['hits'], users['misses'])),
+        *stats_metrics('contacts_cache', contacts, counters=('hits', 'misses', 'errors', 'executed', 'coalesced'),
+                       description='Contacts cache'),
+        *gauge('contacts_cache_hit_ratio', 'Share of contact queries served from cache.',
+               hit_ratio(contacts['hits'], contacts['misses'])),
+        *stats_metrics('rate_limiter', route_rst.rate_limiter.stats(), counters=('allowed', 'rejected', 'errors'),
+                       description='Rate limiter'),
+        *stats_metrics('db_pool', sessionmanager.pool_stats(), counters=('checkouts', 'timeouts'), description='DB pool'),
+        *stats_metrics('db_sessions', sessionmanager.session_stats(), counters=('sessions', 'opened', 'released'),
+                       description='Request DB sessions'),
+        *stats_metrics('mail', mail_sender.stats(), counters=('sent', 'failed', 'connections'), description='Mail sender'),
+    ]
+
+
+class MetricsMiddleware():
+    '''
+    ASGI middleware measuring latency of requests by route template, e.g. '/api/contacts/{rec_id}',
+    and DB and Redis usage of every request.
+    Latency is measured up to the last chunk of response body, background tasks are not included.
+    '''
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        start = time.perf_counter()
+        finished = None
+
+        async def send_wrapper(message):
+            nonlocal status, finished
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+                finished = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            route = scope.get('route')
+            # unmatched paths are not used as labels, they would make unbounded number of series
+            path = getattr(route, 'path', None) or 'unmatched'
+            self.metrics.observe_request(scope['method'], path, status, (finished or time.perf_counter()) - start, stats)
+
+
+metrics = Metrics()
@@ -0,0 +1,143 @@
+import functools
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import config
+
+# the same statement executed this many times in one call is reported as N+1
+REPEATED_THRESHOLD = 3
+
+
+class QueryBudgetExceeded(Exception):
+    '''
+    Call made more queries than its budget or repeated the same query (N+1)
+    '''
+
+
+@dataclass
+class QueryLog():
+    '''
+    SQL statements executed while the log was capturing
+    '''
+    statements: list[str] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = REPEATED_THRESHOLD) -> dict[str, int]:
+        '''
+        Statements executed at least threshold times, typical sign of N+1 queries:
+        statement text is the same for every iteration, only parameters differ.
+
+        Args:
+            threshold: min number of executions
+        Returns:
+            'dict': statement -> number of executions
+        '''
+        return {statement: count for statement, count in Counter(self.statements).items() if count >= threshold}
+
+    def report(self) -> str:
+        return '\n'.join(f'  {number}. {" ".join(statement.split())}' for number, statement in enumerate(self.statements, 1))
+
+
+# logs capturing queries of the current task and logs capturing queries of all tasks and threads
+task_logs: ContextVar[tuple[QueryLog, ...]] = ContextVar('query_logs', default=())
+global_logs: list[QueryLog] = []
+
+
+def record_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    for log in task_logs.get():
+        log.statements.append(statement)
+    for log in global_logs:
+        log.statements.append(statement)
+
+
+@contextmanager
+def capture_queries(all_tasks: bool = False) -> Iterator[QueryLog]:
+    '''
+    Records statements executed by all engines inside the block.
+
+    Args:
+        all_tasks: record queries of all tasks and threads, e.g. of application served by TestClient,
+            by default only queries of the current task (and tasks started from it) are recorded
+    Returns:
+        obj: 'QueryLog': log filled while the block runs
+    '''
+    if not event.contains(Engine, 'before_cursor_execute', record_statement):
+        event.listen(Engine, 'before_cursor_execute', record_statement)
+    log = QueryLog()
+    if all_tasks:
+        global_logs.append(log)
+        try:
+            yield log
+        finally:
+            global_logs.remove(log)
+    else:
+        token = task_logs.set((*task_logs.get(), log))
+        try:
+            yield log
+        finally:
+            task_logs.reset(token)
+
+
+def check_budget(log: QueryLog, name: str, max_queries: int, allow_repeated: bool = False, mode: str = 'raise') -> None:
+    '''
+    Reports queries over budget and repeated queries.
+
+    Args:
+        log: queries of the call
+        name: name of the call for the report
+        max_queries: max number of queries
+        allow_repeated: don't report repeated queries
+        mode: 'raise' or 'warn'
+    Returns:
+        None
+    Raises:
+        QueryBudgetExceeded: If mode is 'raise' and budget is exceeded or queries are repeated
+    '''
+    problems = []
+    if log.count > max_queries:
+        problems.append(f'{name} made {log.count} queries, budget is {max_queries}')
+    if not allow_repeated:
+        for statement, count in log.repeated().items():
+            problems.append(f'{name} repeated query {count} times (N+1?): {" ".join(statement.split())[:120]}')
+    if not problems:
+        return
+    message = '\n'.join(problems) + '\n' + log.report()
+    if mode == 'raise':
+        raise QueryBudgetExceeded(message)
+    print(message)
+
+
+def query_budget(max_queries: int, allow_repeated: bool = False) -> Callable:
+    '''
+    Decorator of async repository functions setting max number of queries of one call.
+    Checked only if QUERY_BUDGET_MODE is 'warn' or 'raise', with 'off' the call is not wrapped in capture.
+
+    Args:
+        max_queries: max number of queries of one call
+        allow_repeated: the function makes the same query many times by design, e.g. per item of a batch
+    Returns:
+        'Callable': decorator
+    '''
+    def decorator(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            mode = config.QUERY_BUDGET_MODE
+            if mode == 'off':
+                return await func(*args, **kwargs)
+            with capture_queries() as log:
+                result = await func(*args, **kwargs)
+            check_budget(log, func.__qualname__, max_queries, allow_repeated, mode)
+            return result
+
+        wrapper.max_queries = max_queries
+        return wrapper
+    return decorator
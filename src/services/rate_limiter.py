@@ -0,0 +1,242 @@
+import asyncio
+import contextlib
+import hashlib
+import time
+from typing import Callable, NamedTuple
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+class RatePolicy(NamedTuple):
+    times: int
+    seconds: int
+
+    @classmethod
+    def parse(cls, value: str) -> 'RatePolicy':
+        '''
+        Parses policy from 'times/seconds' string, e.g. '2/5'.
+
+        Args:
+            value: policy string
+        Returns:
+            obj: 'RatePolicy'
+        '''
+        times, seconds = value.split('/')
+        return cls(int(times), int(seconds))
+
+    def __str__(self) -> str:
+        return f'No more than {self.times} requests per {self.seconds} seconds.'
+
+
+class TokenBucket():
+    '''
+    Token bucket refilled by policy.times tokens per policy.seconds, capacity is policy.times.
+    '''
+    __slots__ = ('policy', 'tokens', 'updated', 'pending')
+
+    def __init__(self, policy: RatePolicy):
+        self.policy = policy
+        self.tokens = float(policy.times)
+        self.updated = time.monotonic()
+        # requests allowed locally and not reported to Redis yet
+        self.pending = 0
+
+    def refill(self, now: float) -> None:
+        rate = self.policy.times / self.policy.seconds
+        self.tokens = min(self.policy.times, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        '''
+        Takes one token.
+
+        Args:
+            now: current monotonic time
+        Returns:
+            'float': 0 if token was taken, otherwise seconds until next token
+        '''
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.pending += 1
+            return 0
+        return (1 - self.tokens) * self.policy.seconds / self.policy.times
+
+
+class HybridRateLimiter():
+    '''
+    Rate limiter which decides from in-process token buckets and periodically
+    reconciles them with fixed window counters in Redis shared by all workers.
+
+    Every sync interval request counts of all workers are added up in Redis in one pipeline,
+    and local buckets are drained by the requests made in other workers,
+    so limits stay roughly correct across workers without Redis round-trip per request.
+    '''
+
+    def __init__(self, policy: Callable[[str, str], RatePolicy], secret: str, algorithm: str,
+                 sync_interval: float = 1.0, prefix: str = 'rate'):
+        '''
+        Args:
+            policy: function returning policy for route and identity
+            secret: key to verify access tokens which identify users
+            algorithm: algorithm of access tokens
+            sync_interval: seconds between synchronizations with Redis
+            prefix: prefix of Redis keys
+        '''
+        self.policy = policy
+        self.secret = secret
+        self.algorithm = algorithm
+        self.sync_interval = sync_interval
+        self.prefix = prefix
+        self.redis: Redis | None = None
+        self.enabled = True
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}
+        self.task: asyncio.Task | None = None
+        self.allowed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def identify(self, request: Request) -> str:
+        '''
+        Identifies client: user e-mail from valid access token, client IP otherwise.
+
+        Args:
+            request: HTTP request
+        Returns:
+            'str': client identity
+        '''
+        authorization = request.headers.get('Authorization', '')
+        scheme, _, token = authorization.partition(' ')
+        if scheme.lower() == 'bearer' and token:
+            try:
+                payload = jwt.decode(token, key=self.secret, algorithms=[self.algorithm])
+                if payload.get('sub'):
+                    return f"user:{payload['sub']}"
+            except JWTError:
+                pass
+        return f'ip:{request.client.host if request.client else "unknown"}'
+
+    def hit(self, route: str, identity: str) -> float:
+        '''
+        Registers request in local bucket.
+
+        Args:
+            route: route of the request
+            identity: client identity
+        Returns:
+            'float': 0 if request is allowed, otherwise seconds to retry after
+        '''
+        key = (route, identity)
+        policy = self.policy(route, identity)
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket.policy != policy:
+            bucket = self.buckets[key] = TokenBucket(policy)
+        retry_after = bucket.take(time.monotonic())
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    async def __call__(self, request: Request) -> None:
+        '''
+        FastAPI dependency limiting requests to the route.
+
+        Args:
+            request: HTTP request
+        Returns:
+            None
+        Raises:
+            HTTPException: If rate limit is exceeded
+        '''
+        if not self.enabled:
+            return
+        route = request.scope.get('route')
+        route = f'{request.method} {route.path if route else request.url.path}'
+        retry_after = self.hit(route, self.identify(request))
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Too Many Requests',
+                                headers={'Retry-After': str(max(1, round(retry_after)))})
+
+    def redis_key(self, route: str, identity: str, policy: RatePolicy, now: float) -> str:
+        digest = hashlib.sha1(f'{route}|{identity}'.encode()).hexdigest()[:20]
+        return f'{self.prefix}:{digest}:{int(now // policy.seconds)}'
+
+    async def sync(self) -> None:
+        '''
+        Adds up locally allowed requests in Redis and drains local buckets
+        by requests allowed in other workers. Idle full buckets are dropped.
+
+        Returns:
+            None
+        '''
+        now = time.monotonic()
+        wall = time.time()
+        reported = []
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.pending:
+                reported.append((key, bucket, bucket.pending))
+                bucket.pending = 0
+            elif bucket.tokens >= bucket.policy.times:
+                del self.buckets[key]
+        if not reported or self.redis is None:
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for (route, identity), bucket, count in reported:
+                    redis_key = self.redis_key(route, identity, bucket.policy, wall)
+                    pipe.incrby(redis_key, count)
+                    pipe.expire(redis_key, bucket.policy.seconds * 2)
+                results = await pipe.execute()
+        except RedisError:
+            self.errors += 1
+            return
+
+        for (_, bucket, _), total in zip(reported, results[::2]):
+            # requests of all workers in current window
+            bucket.tokens = min(bucket.tokens, max(0, bucket.policy.times - total))
+
+    async def run(self) -> None:
+        '''
+        Synchronizes with Redis every sync interval, runs until cancelled.
+
+        Returns:
+            None
+        '''
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def init(self, redis: Redis) -> None:
+        '''
+        Connects limiter to Redis and starts synchronization.
+
+        Args:
+            redis: async redis client
+        Returns:
+            None
+        '''
+        self.redis = redis
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        '''
+        Stops synchronization and reports remaining requests.
+
+        Returns:
+            None
+        '''
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        await self.sync()
+
+    def stats(self) -> dict:
+        return {'allowed': self.allowed, 'rejected': self.rejected, 'errors': self.errors, 'buckets': len(self.buckets)}
@@ -0,0 +1,81 @@
+'''
+Worker process of background jobs: confirmation e-mails and avatars.
+
+Usage:
+    python -m src.worker --concurrency 10
+'''
+import argparse
+import asyncio
+import base64
+import os
+import signal
+import socket
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.repository import users as rep_users
+from src.services.avatars import avatar_service
+from src.services.email import mail_sender, send_email
+from src.services.jobs import job_queue, JobError, JOB_SEND_EMAIL, JOB_AVATAR
+
+
+@job_queue.handler(JOB_SEND_EMAIL)
+async def send_email_job(email: str, username: str, host: str) -> None:
+    '''
+    Sends e-mail confirmation letter, SMTP errors make the job retried
+
+    Args:
+        email: user's e-mail
+        username: user name
+        host: domain adress where application deployed
+    Returns:
+        None
+    '''
+    delivery = await send_email(email=email, username=username, host=host)
+    await delivery
+
+
+@job_queue.handler(JOB_AVATAR)
+async def avatar_job(email: str, data: str) -> None:
+    '''
+    Resizes and stores user's avatar, then stores its URL in db
+
+    Args:
+        email: user's e-mail
+        data: base64 encoded image
+    Returns:
+        None
+    Raises:
+        JobError: If image is invalid or user does not exist
+    '''
+    try:
+        url = await avatar_service.store(f'user:{email}', base64.b64decode(data))
+    except ValueError as err:
+        raise JobError(str(err)) from err
+    async with sessionmanager.session() as db:
+        user = await rep_users.get_user_by_email(email=email, db=db)
+        if user is None:
+            raise JobError(f'User {email} not found')
+        await rep_users.update_user_avatar(user=user, url=url, db=db)
+
+
+async def main(consumer: str, concurrency: int) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    mail_sender.start()
+    try:
+        await job_queue.run(consumer, concurrency, stop)
+    finally:
+        await mail_sender.close()
+        await avatar_service.close()
+        await sessionmanager.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--consumer', default=f'{socket.gethostname()}-{os.getpid()}', help='unique name of the worker')
+    parser.add_argument('--concurrency', type=int, default=config.JOB_CONCURRENCY, help='jobs processed at once')
+    args = parser.parse_args()
+    asyncio.run(main(args.consumer, args.concurrency))
@@ -1,5 +1,6 @@
 import sys
 import os
+import contextlib
 import pytest
 import asyncio
 import pytest_asyncio
@@ -16,9 +17,17 @@ from sqlalchemy.pool import StaticPool
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
 
 from src.database.models import Base
-from src.database.db import get_db
+from src.database.db import LazySession, get_db, sessionmanager
+from src.conf.config import config
+from src.services.queries import capture_queries, check_budget
+
+# /metrics is registered when main is imported
+config.METRICS_ENABLED = True
 from main import app
 
+# repository functions fail tests if they exceed their @query_budget
+config.QUERY_BUDGET_MODE = 'raise'
+
 # SQLALCHEMY_DB_URL = 'sqlite:///./test.db'
 # test_engine = create_engine(SQLALCHEMY_DB_URL, connect_args={'check_same_thread': False})
 # TestingSessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=test_engine)
@@ -55,27 +64,43 @@ def init_db():
 def client():
 
     async def mock_get_db():
-        session = TestingSessionLocal()
+        session = LazySession(TestingSessionLocal)
         try:
             yield session
         finally:
             await session.close()
         
     app.dependency_overrides[get_db] = mock_get_db
+    # streaming end-points open sessions themselves
+    original_sessionmaker = sessionmanager._sessionmaker
+    sessionmanager._sessionmaker = TestingSessionLocal
 
     yield TestClient(app=app)
 
+    sessionmanager._sessionmaker = original_sessionmaker
+
 @pytest.fixture(scope='function')
 def mock_redis(monkeypatch):
     monkeypatch.setattr(
-        "fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        "src.conf.config.route_rst.rate_limiter.enabled", False)
     monkeypatch.setattr(
-        "fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
-    monkeypatch.setattr(
-        "fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        "src.conf.config.route_rst.rate_limiter.redis", AsyncMock())
 
 
 @pytest.fixture(scope='module')
 def user():
     return {'username': 'test_user', 'email': 'user@test.com', 'password': 'secret78'}
 
+
+@pytest.fixture(scope='function')
+def max_queries():
+    '''
+    Query budget of end-point: with max_queries(2): client.get(...)
+    fails if the block made more than 2 queries or repeated a query (N+1).
+    '''
+    @contextlib.contextmanager
+    def budget(count: int, allow_repeated: bool = False):
+        with capture_queries(all_tasks=True) as log:
+            yield log
+        check_budget(log, 'request', count, allow_repeated)
+    return budget
@@ -0,0 +1,342 @@
+import asyncio
+import json
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock
+from pytest import MonkeyPatch
+import pytest
+
+from src.routes.contacts import NEXT_CURSOR_HEADER
+from src.services.auth import auth_service
+from src.repository.contacts import contacts_cache
+from src.conf import messages
+
+contacts = [
+    {'first_name': 'Austin', 'last_name': 'Butler', 'email': 'austin@example.com',
+     'birthday': '1991-08-17', 'notes': 'Feyd-Rautha'},
+    {'first_name': 'Timothee', 'last_name': 'Chalamet', 'email': 'chalamet@example.com',
+     'birthday': '1995-12-27', 'notes': 'Paul'},
+    {'first_name': 'Rebecca', 'last_name': 'Ferguson', 'email': 'ferguson@example.com',
+     'birthday': '1983-10-19', 'notes': 'Jessica 100%'},
+    {'first_name': 'Zendaya', 'last_name': 'Coleman', 'email': 'zendaya@example.com',
+     'birthday': '1996-09-01', 'notes': 'Chani'},
+]
+
+
+@pytest.fixture(scope='module')
+def token(client: TestClient, user):
+    async def create_email_token():
+        return await auth_service.create_email_token({'sub': user.get('email')})
+
+    with MonkeyPatch.context() as mp:
+        mp.setattr('src.conf.config.route_rst.rate_limiter.enabled', False)
+        mp.setattr('src.routes.users.send_email', MagicMock())
+        client.post('api/auth/signup', json=user)
+        client.get(f'api/auth/confirm_email/{asyncio.run(create_email_token())}')
+        responce = client.post('api/auth/login', data={'username': user.get('email'), 'password': user.get('password')})
+    return responce.json()['access_token']
+
+
+@pytest.fixture(scope='function')
+def auth(token, monkeypatch: MonkeyPatch, mock_redis):
+    mock_cache = AsyncMock()
+    mock_cache.get.return_value = None
+    monkeypatch.setattr(auth_service, 'cache', mock_cache)
+    monkeypatch.setattr(contacts_cache, 'ttl', 0)
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_create_contacts(client: TestClient, auth):
+    for contact in contacts:
+        responce = client.post('api/contacts/', json=contact, headers=auth)
+        assert responce.status_code == 201, responce.text
+        assert responce.json()['first_name'] == contact['first_name']
+
+
+def test_get_contacts_cursor(client: TestClient, auth):
+    responce = client.get('api/contacts/', params={'limit': 3}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    first_page = responce.json()
+    assert [c['first_name'] for c in first_page] == ['Austin', 'Timothee', 'Rebecca']
+    cursor = responce.headers[NEXT_CURSOR_HEADER]
+
+    responce = client.get('api/contacts/', params={'limit': 3, 'cursor': cursor}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [c['first_name'] for c in responce.json()] == ['Zendaya']
+    assert NEXT_CURSOR_HEADER not in responce.headers
+
+
+def test_get_contacts_invalid_cursor(client: TestClient, auth):
+    responce = client.get('api/contacts/', params={'cursor': '!!!'}, headers=auth)
+    assert responce.status_code == 400, responce.text
+    assert responce.json()['detail'] == messages.CURSOR_INVALID
+
+
+def test_query_case_insensitive(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'last_name': 'FERG'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [c['first_name'] for c in responce.json()] == ['Rebecca']
+
+
+def test_query_wildcards_are_literal(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'notes': '%'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [c['first_name'] for c in responce.json()] == ['Rebecca']
+
+    responce = client.get('api/contacts/query', params={'first_name': "' OR 1=1 --"}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.json() == []
+
+
+def test_query_ranked(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'email': 'c', 'ranked': True}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    # prefix match goes first, then other substring matches by ID
+    assert [c['first_name'] for c in responce.json()] == ['Timothee', 'Austin', 'Rebecca', 'Zendaya']
+
+
+def test_query_ranked_with_cursor(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'email': 'c', 'ranked': True, 'cursor': 'eyJpZCI6MX0'}, headers=auth)
+    assert responce.status_code == 400, responce.text
+    assert responce.json()['detail'] == messages.CURSOR_WITH_RANKED
+
+
+def test_query_birthday_range(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'birthday_from': '2026-08-01', 'birthday_to': '2026-09-30'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [c['first_name'] for c in responce.json()] == ['Austin', 'Zendaya']
+
+
+def test_query_birthday_range_new_year(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'birthday_from': '2026-12-20', 'birthday_to': '2027-01-05'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [c['first_name'] for c in responce.json()] == ['Timothee']
+
+
+def test_query_birthday_range_invalid(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'birthday_from': '2026-12-20'}, headers=auth)
+    assert responce.status_code == 400, responce.text
+    assert responce.json()['detail'] == messages.BIRTHDAY_RANGE_INVALID
+
+
+def test_query_days_to_birthday_negative(client: TestClient, auth):
+    # negative window must not be taken for a window over New Year
+    responce = client.get('api/contacts/query', params={'days_to_birthday': -5}, headers=auth)
+    assert responce.status_code == 422, responce.text
+
+
+def test_import_csv(client: TestClient, auth):
+    body = ('first_name,last_name,email,birthday,notes\r\n'
+            'Javier,Bardem,bardem@example.com,1969-03-01,"Stilgar, ""the naib"""\r\n'
+            'Jo,,not-an-email,,\r\n'
+            'Florence,Pugh,,1996-01-03,"Irulan\nprincess"\r\n')
+    responce = client.post('api/contacts/import', params={'format': 'csv', 'chunk_size': 2},
+                           content=body.encode(), headers={**auth, 'Content-Type': 'text/csv'})
+    assert responce.status_code == 200, responce.text
+    lines = [json.loads(line) for line in responce.text.splitlines()]
+    assert [line['row'] for line in lines if 'row' in line] == [2]
+    assert lines[-1] == {'processed': 3, 'imported': 2, 'failed': 1, 'done': True}
+
+    responce = client.get('api/contacts/query', params={'notes': 'naib'}, headers=auth)
+    assert [c['notes'] for c in responce.json()] == ['Stilgar, "the naib"']
+
+
+def test_import_vcard(client: TestClient, auth):
+    body = ('BEGIN:VCARD\nVERSION:3.0\nN:Skarsgard;Stellan;;;\nFN:Stellan Skarsgard\n'
+            'EMAIL;TYPE=work:baron@example.com\nBDAY:19510613\nNOTE:Baron\\, Harkonnen\nEND:VCARD\n')
+    responce = client.post('api/contacts/import', params={'format': 'vcard'},
+                           content=body.encode(), headers={**auth, 'Content-Type': 'text/vcard'})
+    assert responce.status_code == 200, responce.text
+    assert json.loads(responce.text.splitlines()[-1])['imported'] == 1
+
+    responce = client.get('api/contacts/query', params={'email': 'baron'}, headers=auth)
+    contact, = responce.json()
+    assert (contact['first_name'], contact['last_name'], contact['birthday'], contact['notes']) == \
+        ('Stellan', 'Skarsgard', '1951-06-13', 'Baron, Harkonnen')
+
+
+def test_export_ndjson(client: TestClient, auth):
+    responce = client.get('api/contacts/export', headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.headers['content-type'] == 'application/x-ndjson'
+    exported = [json.loads(line) for line in responce.text.splitlines()]
+    assert [c['first_name'] for c in exported] == ['Austin', 'Timothee', 'Rebecca', 'Zendaya', 'Javier', 'Florence', 'Stellan']
+    assert exported[0] == {'id': 1, **contacts[0]}
+
+
+def test_export_csv_import_roundtrip(client: TestClient, auth):
+    responce = client.get('api/contacts/export', params={'format': 'csv'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.text.startswith('id,first_name,last_name,email,birthday,notes\r\n')
+
+    responce = client.get('api/contacts/export', params={'format': 'vcard'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.text.count('BEGIN:VCARD') == 7
+
+    responce = client.post('api/contacts/import', params={'format': 'vcard'},
+                           content=responce.content, headers={**auth, 'Content-Type': 'text/vcard'})
+    assert json.loads(responce.text.splitlines()[-1]) == {'processed': 7, 'imported': 7, 'failed': 0, 'done': True}
+
+
+def test_update_contact(client: TestClient, auth):
+    contact = {**contacts[1], 'birthday': '1995-06-15', 'notes': 'Muad\'Dib'}
+    responce = client.put('api/contacts/2', json=contact, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.json()['notes'] == 'Muad\'Dib'
+
+    responce = client.get('api/contacts/query', params={'birthday_from': '2027-06-15', 'birthday_to': '2027-06-15'}, headers=auth)
+    assert [c['id'] for c in responce.json()] == [2]
+
+
+def test_delete_contact(client: TestClient, auth):
+    responce = client.delete('api/contacts/2', headers=auth)
+    assert responce.status_code == 204, responce.text
+
+    responce = client.get('api/contacts/2', headers=auth)
+    assert responce.status_code == 404, responce.text
+
+
+def test_get_contacts_batch(client: TestClient, auth):
+    responce = client.get('api/contacts/batch', params={'ids': [3, 1000, 1, 3]}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [c['first_name'] for c in responce.json()] == ['Rebecca', 'Austin']
+
+    responce = client.get('api/contacts/batch', params={'ids': list(range(1, 200))}, headers=auth)
+    assert responce.status_code == 422, responce.text
+
+
+def test_update_contacts_batch(client: TestClient, auth):
+    body = [{'id': 1, 'notes': 'Na-Baron'}, {'id': 3, 'birthday': '1983-06-15', 'last_name': None}, {'id': 1000, 'notes': 'none'}]
+    responce = client.patch('api/contacts/batch', json=body, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert [(c['id'], c['first_name'], c['last_name'], c['notes']) for c in responce.json()] == \
+        [(1, 'Austin', 'Butler', 'Na-Baron'), (3, 'Rebecca', None, 'Jessica 100%')]
+
+    responce = client.get('api/contacts/query', params={'birthday_from': '2027-06-15', 'birthday_to': '2027-06-15'}, headers=auth)
+    assert 3 in [c['id'] for c in responce.json()]
+
+    responce = client.patch('api/contacts/batch', json=[{'id': 1, 'first_name': None}], headers=auth)
+    assert responce.status_code == 422, responce.text
+
+
+def test_delete_contacts_batch(client: TestClient, auth):
+    responce = client.delete('api/contacts/batch', params={'ids': [3, 1000]}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.json() == [{'id': 3, 'deleted': True}, {'id': 1000, 'deleted': False}]
+
+    responce = client.get('api/contacts/batch', params={'ids': [1, 3]}, headers=auth)
+    assert [c['id'] for c in responce.json()] == [1]
+
+
+def test_get_contact_etag(client: TestClient, auth):
+    responce = client.get('api/contacts/1', headers=auth)
+    assert responce.status_code == 200, responce.text
+    etag = responce.headers['ETag']
+
+    responce = client.get('api/contacts/1', headers={**auth, 'If-None-Match': etag})
+    assert responce.status_code == 304, responce.text
+    assert responce.content == b''
+    assert responce.headers['ETag'] == etag
+
+    responce = client.get('api/contacts/', params={'limit': 2}, headers=auth)
+    page_etag = responce.headers['ETag']
+    responce = client.get('api/contacts/', params={'limit': 2}, headers={**auth, 'If-None-Match': page_etag})
+    assert responce.status_code == 304, responce.text
+    assert NEXT_CURSOR_HEADER in responce.headers
+
+
+def test_update_contact_if_match(client: TestClient, auth):
+    etag = client.get('api/contacts/1', headers=auth).headers['ETag']
+    page_etag = client.get('api/contacts/', params={'limit': 2}, headers=auth).headers['ETag']
+
+    responce = client.put('api/contacts/1', json=contacts[0], headers={**auth, 'If-Match': etag})
+    assert responce.status_code == 200, responce.text
+    new_etag = responce.headers['ETag']
+    assert new_etag != etag
+
+    responce = client.put('api/contacts/1', json=contacts[0], headers={**auth, 'If-Match': etag})
+    assert responce.status_code == 412, responce.text
+    assert responce.json()['detail'] == messages.CONTACT_MODIFIED
+
+    responce = client.get('api/contacts/1', headers={**auth, 'If-None-Match': etag})
+    assert responce.status_code == 200, responce.text
+    assert responce.headers['ETag'] == new_etag
+    responce = client.get('api/contacts/', params={'limit': 2}, headers={**auth, 'If-None-Match': page_etag})
+    assert responce.status_code == 200, responce.text
+
+    responce = client.put('api/contacts/1000', json=contacts[0], headers={**auth, 'If-Match': '*'})
+    assert responce.status_code == 404, responce.text
+
+
+def test_get_contacts_fast_json(client: TestClient, auth, monkeypatch: MonkeyPatch):
+    expected = client.get('api/contacts/', params={'limit': 3}, headers=auth)
+
+    monkeypatch.setattr('src.routes.contacts.config.FAST_JSON', True)
+    responce = client.get('api/contacts/', params={'limit': 3}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.headers['content-type'] == 'application/json'
+    assert responce.json() == expected.json()
+    assert responce.headers['ETag'] == expected.headers['ETag']
+    assert responce.headers[NEXT_CURSOR_HEADER] == expected.headers[NEXT_CURSOR_HEADER]
+
+
+def test_get_contacts_fields(client: TestClient, auth, monkeypatch: MonkeyPatch):
+    full = client.get('api/contacts/', params={'limit': 2}, headers=auth)
+
+    responce = client.get('api/contacts/', params={'limit': 2, 'fields': 'last_name, first_name'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.json() == [{'id': c['id'], 'first_name': c['first_name'], 'last_name': c['last_name']} for c in full.json()]
+    assert responce.headers[NEXT_CURSOR_HEADER] == full.headers[NEXT_CURSOR_HEADER]
+    assert responce.headers['ETag'] != full.headers['ETag']
+    etag = responce.headers['ETag']
+
+    responce = client.get('api/contacts/', params={'limit': 2, 'fields': 'first_name,last_name'}, headers={**auth, 'If-None-Match': etag})
+    assert responce.status_code == 304, responce.text
+
+    monkeypatch.setattr('src.routes.contacts.config.FAST_JSON', True)
+    responce = client.get('api/contacts/', params={'limit': 2, 'fields': 'first_name,last_name'}, headers=auth)
+    assert responce.json() == [{'id': c['id'], 'first_name': c['first_name'], 'last_name': c['last_name']} for c in full.json()]
+
+
+def test_query_fields(client: TestClient, auth):
+    responce = client.get('api/contacts/query', params={'first_name': 'zen', 'fields': 'birthday'}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.json()[0] == {'id': 4, 'birthday': '1996-09-01'}
+
+    responce = client.get('api/contacts/query', params={'first_name': 'zen', 'fields': 'pwd_hash'}, headers=auth)
+    assert responce.status_code == 400, responce.text
+    assert responce.json()['detail'] == messages.FIELDS_INVALID
+
+
+def test_get_contacts_core_reads(client: TestClient, auth, monkeypatch: MonkeyPatch):
+    expected = client.get('api/contacts/', params={'limit': 3}, headers=auth)
+    expected_query = client.get('api/contacts/query', params={'last_name': 'er'}, headers=auth)
+
+    monkeypatch.setattr('src.repository.contacts.config.CONTACTS_CORE_READS', True)
+    responce = client.get('api/contacts/', params={'limit': 3}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    assert responce.json() == expected.json()
+    assert responce.headers['ETag'] == expected.headers['ETag']
+
+    responce = client.get('api/contacts/query', params={'last_name': 'er'}, headers=auth)
+    assert responce.json() == expected_query.json()
+
+
+def test_query_budgets(client: TestClient, auth, max_queries):
+    # one query authenticates the user (user cache is empty), one serves the request
+    with max_queries(2):
+        responce = client.get('api/contacts/', params={'limit': 50}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    with max_queries(2):
+        responce = client.get('api/contacts/query', params={'first_name': 'a', 'limit': 50}, headers=auth)
+    assert responce.status_code == 200, responce.text
+    with max_queries(2):
+        created = client.post('api/contacts/', json=contacts[0], headers=auth).json()
+    with max_queries(2):
+        responce = client.get(f'api/contacts/{created["id"]}', headers=auth)
+    assert responce.status_code == 200, responce.text
+    with max_queries(2):
+        responce = client.put(f'api/contacts/{created["id"]}', json=contacts[1], headers=auth)
+    assert responce.status_code == 200, responce.text
+    with max_queries(2):
+        responce = client.delete(f'api/contacts/{created["id"]}', headers=auth)
+    assert responce.status_code == 204, responce.text
@@ -8,10 +8,35 @@ import main
 
 def test_root(monkeypatch: MonkeyPatch, mock_redis):
     # as a result of replacement of depricated @app.on_event('startup')
-    # monkeypatch.setattr("fastapi_limiter.FastAPILimiter.init", AsyncMock())
+    monkeypatch.setattr("src.conf.config.route_rst.rate_limiter.init", AsyncMock())
+    monkeypatch.setattr("src.conf.config.route_rst.rate_limiter.close", AsyncMock())
+    monkeypatch.setattr("src.services.cache.user_cache.listen", AsyncMock())
 
     with TestClient(main.app) as client:
         responce = client.get('/')
         assert responce.status_code == 200
         assert responce.json() == {'message': 'Contacts application'}
 
+
+
+def test_metrics(client: TestClient, mock_redis):
+    client.get('/api/contacts/healthchecker')
+
+    responce = client.get('/metrics')
+
+    assert responce.status_code == 200
+    assert responce.headers['content-type'].startswith('text/plain; version=0.0.4')
+    body = responce.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/contacts/healthchecker",status="200"} ' in body
+    assert 'http_request_db_queries_bucket{route="/api/contacts/healthchecker",le="1"} ' in body
+    assert '# TYPE user_cache_hit_ratio gauge' in body
+    assert '# TYPE rate_limiter_rejected_total counter' in body
+
+
+def test_metrics_token(client: TestClient, monkeypatch: MonkeyPatch, mock_redis):
+    monkeypatch.setattr('main.config.METRICS_TOKEN', 'scraper-token')
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    responce = client.get('/metrics', headers={'Authorization': 'Bearer scraper-token'})
+    assert responce.status_code == 200, responce.text
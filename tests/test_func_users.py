@@ -1,4 +1,6 @@
 import asyncio
+import io
+from PIL import Image
 from logging import raiseExceptions
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock, MagicMock
@@ -6,6 +8,7 @@ from pytest import MonkeyPatch
 
 from src.conf import messages
 from src.services.auth import auth_service
+from src.services.avatars import LocalStorage
 
 # from src.routes.users import get_refresh_token, refresh_token
 
@@ -13,7 +16,7 @@ test_refresh_token = None
 
 def test_create_user_new(client: TestClient, user, monkeypatch: MonkeyPatch, mock_redis):
     mock_send_email = MagicMock()
-    monkeypatch.setattr("src.services.email.send_email", mock_send_email)
+    monkeypatch.setattr("src.routes.users.send_email", mock_send_email)
     responce = client.post("api/auth/signup", json=user)
 
     assert responce.status_code == 201, responce.text
@@ -24,12 +27,16 @@ def test_create_user_new(client: TestClient, user, monkeypatch: MonkeyPatch, moc
 
 def test_create_user_exist(client: TestClient, user, monkeypatch: MonkeyPatch, mock_redis):
     mock_send_email = MagicMock()
-    monkeypatch.setattr("src.services.email.send_email", mock_send_email)
+    monkeypatch.setattr("src.routes.users.send_email", mock_send_email)
+    mock_hash = AsyncMock()
+    monkeypatch.setattr("src.routes.users.auth_service.get_pasword_hash", mock_hash)
     responce = client.post("api/auth/signup", json=user)
 
     assert responce.status_code == 409, responce.text
     data = responce.json()
     assert data['detail'] == messages.USER_ALREADY_EXISTS
+    # password of existing e-mail is not hashed
+    mock_hash.assert_not_awaited()
 
 
 def test_login_user_wrong_email(client: TestClient, user, mock_redis):
@@ -126,3 +133,78 @@ def test_login_token_fail(client: TestClient, user, monkeypatch: MonkeyPatch, mo
     assert responce.status_code == 500, responce.text
     data = responce.json()
     assert data['detail'] == messages.REFRESH_TOKEN_INVALID
+
+def test_upload_avatar(client: TestClient, user, monkeypatch: MonkeyPatch, mock_redis, tmp_path):
+    mock_cache = AsyncMock()
+    mock_cache.get.return_value = None
+    monkeypatch.setattr('src.services.auth.auth_service.cache', mock_cache)
+    monkeypatch.setattr('src.routes.users.avatar_service.storage', LocalStorage(str(tmp_path), '/avatars'))
+    form_body = {'username': user.get('email'), 'password': user.get('password')}
+    token = client.post("api/auth/login", data=form_body).json()['access_token']
+    image = io.BytesIO()
+    Image.new('RGB', (600, 300)).save(image, format='PNG')
+
+    responce = client.patch('api/auth/upload_avatar/', files={'file': ('avatar.png', image.getvalue(), 'image/png')},
+                            headers={'Authorization': f'Bearer {token}'})
+
+    assert responce.status_code == 200, responce.text
+    assert responce.json()['avatar'].startswith('/avatars/')
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_upload_avatar_job_queue(client: TestClient, user, monkeypatch: MonkeyPatch, mock_redis):
+    mock_cache = AsyncMock()
+    mock_cache.get.return_value = None
+    monkeypatch.setattr('src.services.auth.auth_service.cache', mock_cache)
+    monkeypatch.setattr('src.routes.users.config.JOB_QUEUE', True)
+    mock_enqueue = AsyncMock()
+    monkeypatch.setattr('src.routes.users.job_queue.enqueue', mock_enqueue)
+    form_body = {'username': user.get('email'), 'password': user.get('password')}
+    token = client.post("api/auth/login", data=form_body).json()['access_token']
+    image = io.BytesIO()
+    Image.new('RGB', (600, 300)).save(image, format='PNG')
+
+    responce = client.patch('api/auth/upload_avatar/', files={'file': ('avatar.png', image.getvalue(), 'image/png')},
+                            headers={'Authorization': f'Bearer {token}'})
+
+    assert responce.status_code == 202, responce.text
+    assert mock_enqueue.await_args.args == ('avatar',)
+    assert mock_enqueue.await_args.kwargs['email'] == user.get('email')
+
+
+def test_resend_email_job_queue(client: TestClient, monkeypatch: MonkeyPatch, mock_redis):
+    monkeypatch.setattr('src.routes.users.config.JOB_QUEUE', True)
+    mock_send_email = MagicMock()
+    monkeypatch.setattr('src.routes.users.send_email', mock_send_email)
+    mock_enqueue = AsyncMock()
+    monkeypatch.setattr('src.routes.users.job_queue.enqueue', mock_enqueue)
+    client.post('api/auth/signup', json={'username': 'queued', 'email': 'queued@test.com', 'password': 'secret78'})
+
+    responce = client.post('api/auth/resend_email', json={'email': 'queued@test.com'})
+
+    assert responce.status_code == 200, responce.text
+    assert mock_enqueue.await_count == 2
+    assert mock_enqueue.await_args.kwargs['email'] == 'queued@test.com'
+    mock_send_email.assert_not_called()
+
+
+def test_job_stats(client: TestClient, user, monkeypatch: MonkeyPatch, mock_redis):
+    mock_cache = AsyncMock()
+    mock_cache.get.return_value = None
+    monkeypatch.setattr('src.services.auth.auth_service.cache', mock_cache)
+    stats = {'depth': 1, 'pending': 0, 'delayed': 0, 'dead': 0, 'lag_seconds': 0.5,
+             'processed': 0, 'retried': 0, 'failed': 0}
+    monkeypatch.setattr('src.routes.jobs.job_queue.stats', AsyncMock(return_value=stats))
+    form_body = {'username': user.get('email'), 'password': user.get('password')}
+    token = client.post("api/auth/login", data=form_body).json()['access_token']
+
+    responce = client.get('api/jobs/stats', headers={'Authorization': f'Bearer {token}'})
+
+    assert responce.status_code == 200, responce.text
+    assert responce.json() == stats
+
+
+def test_job_stats_anonymous(client: TestClient, mock_redis):
+    responce = client.get('api/jobs/stats')
+
+    assert responce.status_code == 401, responce.text
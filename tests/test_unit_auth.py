@@ -0,0 +1,49 @@
+import unittest, sys, os
+from unittest.mock import patch
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.services.auth import Auth, auth_service
+from src.conf.config import config
+
+
+class TestAsyncAuthPasswords(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        context_patcher = patch.object(Auth, 'pwd_context', CryptContext(schemes=['bcrypt'], deprecated='auto',
+                                                                         bcrypt__default_rounds=5, bcrypt__min_rounds=5))
+        context_patcher.start()
+        self.addCleanup(context_patcher.stop)
+
+    async def test_hash_verify(self):
+        pwd_hash = await auth_service.get_pasword_hash('secret78')
+
+        self.assertTrue(await auth_service.verify_password('secret78', pwd_hash))
+        self.assertFalse(await auth_service.verify_password('wrong', pwd_hash))
+
+    async def test_verify_and_update_weak_hash(self):
+        weak_hash = CryptContext(schemes=['bcrypt'], bcrypt__rounds=4).hash('secret78')
+
+        valid, new_hash = await auth_service.verify_and_update_password('secret78', weak_hash)
+
+        self.assertTrue(valid)
+        self.assertIn('$05$', new_hash)
+        self.assertEqual(await auth_service.verify_and_update_password('secret78', new_hash), (True, None))
+
+    async def test_queue_full(self):
+        with patch.object(Auth, 'hash_pending', config.PWD_HASH_WORKERS + config.PWD_HASH_QUEUE):
+            with self.assertRaises(HTTPException) as err:
+                await auth_service.get_pasword_hash('secret78')
+
+        self.assertEqual(err.exception.status_code, 503)
+
+    def test_calibrate_rounds(self):
+        self.assertEqual(Auth.calibrate_rounds(measured_ms=16, measured_rounds=8, target_ms=250), 12)
+        self.assertEqual(Auth.calibrate_rounds(measured_ms=16, measured_rounds=8, target_ms=1), config.PWD_MIN_ROUNDS)
+        self.assertEqual(Auth.calibrate_rounds(measured_ms=0, measured_rounds=8, target_ms=250), config.PWD_MAX_ROUNDS)
+
+if __name__ == '__main__':
+    
+    unittest.main()
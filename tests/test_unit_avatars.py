@@ -0,0 +1,127 @@
+import unittest, sys, os, io, tempfile, hashlib, struct, zlib
+from unittest.mock import AsyncMock, MagicMock
+import httpx
+from fastapi import HTTPException
+from PIL import Image
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.services.avatars import is_image, process_avatar, CloudinaryStorage, LocalStorage, AvatarService
+
+
+def make_image(width: int, height: int, format: str = 'PNG') -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color=(200, 10, 10)).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def make_bomb(width: int = 20000, height: int = 20000) -> bytes:
+    '''
+    PNG header of a huge 1-bit image, only the header is read to detect decompression bomb
+    '''
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b''))
+
+
+class TestProcessAvatar(unittest.TestCase):
+
+    def test_thumbnail(self):
+        result = process_avatar(make_image(800, 400), size=250)
+
+        with Image.open(io.BytesIO(result)) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (250, 250))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            process_avatar(b'not an image', size=250)
+
+
+class TestAsyncAvatarStorage(unittest.IsolatedAsyncioTestCase):
+
+    async def test_local_storage(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = LocalStorage(directory, '/avatars/')
+
+            first = await storage.save('user:john@mail.com', b'first')
+            second = await storage.save('user:john@mail.com', b'second')
+
+            name = hashlib.sha1(b'user:john@mail.com').hexdigest() + '.jpg'
+            self.assertTrue(first.startswith(f'/avatars/{name}?v='))
+            self.assertNotEqual(first, second)
+            self.assertEqual(os.listdir(directory), [name])
+
+    async def test_cloudinary_storage(self):
+        requests = []
+
+        def handler(request: httpx.Request):
+            requests.append(request)
+            return httpx.Response(200, json={'secure_url': 'https://res.cloudinary.com/demo/image/upload/v1/user:john'})
+
+        storage = CloudinaryStorage('demo', 'key', 'secret', client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+        url = await storage.save('user:john@mail.com', b'jpeg')
+        await storage.close()
+
+        self.assertEqual(url, 'https://res.cloudinary.com/demo/image/upload/v1/user:john')
+        self.assertEqual(str(requests[0].url), 'https://api.cloudinary.com/v1_1/demo/image/upload')
+        body = requests[0].content
+        self.assertIn(b'name="public_id"\r\n\r\nuser:john@mail.com', body)
+        self.assertIn(b'name="api_key"\r\n\r\nkey', body)
+        self.assertEqual(storage.sign({'timestamp': '1', 'public_id': 'x'}), hashlib.sha1(b'public_id=x&timestamp=1secret').hexdigest())
+
+
+class TestAsyncAvatarService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.storage = AsyncMock()
+        self.storage.save.return_value = '/avatars/1.jpg'
+        self.service = AvatarService(self.storage, size=64, max_bytes=100_000, workers=1)
+
+    async def test_store(self):
+        result = await self.service.store('user:john@mail.com', make_image(100, 200, 'JPEG'))
+
+        self.assertEqual(result, '/avatars/1.jpg')
+        key, data = self.storage.save.call_args.args
+        self.assertEqual(key, 'user:john@mail.com')
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (64, 64))
+
+    async def test_store_invalid(self):
+        # header is recognized, image data is broken
+        with self.assertRaises(ValueError):
+            await self.service.store('user:john@mail.com', make_image(100, 200)[:60])
+        self.storage.save.assert_not_called()
+
+    async def test_read(self):
+        file = AsyncMock()
+        file.read.return_value = make_image(100, 200, 'JPEG')
+
+        self.assertEqual(await self.service.read(file), file.read.return_value)
+        file.read.assert_awaited_once_with(100_001)
+
+    async def test_read_invalid(self):
+        file = AsyncMock()
+        file.read.return_value = b'not an image'
+        with self.assertRaises(HTTPException) as err:
+            await self.service.read(file)
+        self.assertEqual(err.exception.status_code, 400)
+
+        file.read.return_value = b'0' * 100_001
+        with self.assertRaises(HTTPException) as err:
+            await self.service.read(file)
+        self.assertEqual(err.exception.status_code, 413)
+
+    async def test_read_decompression_bomb(self):
+        file = AsyncMock()
+        file.read.return_value = make_bomb()
+        self.assertFalse(is_image(file.read.return_value))
+
+        with self.assertRaises(HTTPException) as err:
+            await self.service.read(file)
+        self.assertEqual(err.exception.status_code, 400)
+
+if __name__ == '__main__':
+    
+    unittest.main()
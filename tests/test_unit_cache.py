@@ -0,0 +1,220 @@
+import unittest, sys, os, asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from redis.exceptions import ConnectionError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.database.models import Record, User
+from src.database.schemas import RecordResponseSchema, record_projection_schema
+from src.services.cache import ReadThroughCache, UserCache, SingleFlight
+
+
+class TestAsyncReadThroughCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.storage = {}
+
+        async def get(key):
+            return self.storage.get(key)
+
+        async def set(key, value, ex=None):
+            self.storage[key] = value
+
+        async def incr(key):
+            self.storage[key] = str(int(self.storage.get(key, 0)) + 1)
+
+        self.redis = AsyncMock()
+        self.redis.get.side_effect = get
+        self.redis.set.side_effect = set
+        self.redis.incr.side_effect = incr
+        self.cache = ReadThroughCache(self.redis, schema=RecordResponseSchema, prefix='contacts', ttl=60)
+        self.record = Record(id=1, first_name='Austin', last_name='Butler', email='austin@example.com',
+                             birthday='1991-08-17', notes='Feyd', created_at=datetime(2024, 4, 1), user_id=1)
+        self.fetch = AsyncMock(return_value=[self.record])
+
+    async def test_miss_then_hit(self):
+        first = await self.cache.cached(1, 'list', {'limit': 10, 'offset': 0}, self.fetch)
+        second = await self.cache.cached(1, 'list', {'offset': 0, 'limit': 10}, self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(first, [self.record])
+        self.assertEqual(second[0].email, 'austin@example.com')
+        self.assertEqual(str(second[0].birthday), '1991-08-17')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'errors': 0, 'executed': 1, 'coalesced': 0})
+
+    async def test_projection_schema(self):
+        schema = record_projection_schema(('id', 'first_name', 'updated_at'))
+        await self.cache.cached(1, 'list', {'fields': 'first_name'}, self.fetch, schema=schema)
+        result = await self.cache.cached(1, 'list', {'fields': 'first_name'}, self.fetch, schema=schema)
+
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(result[0].model_dump(), {'id': 1, 'first_name': 'Austin', 'updated_at': None})
+
+    async def test_invalidate(self):
+        await self.cache.cached(1, 'list', {'limit': 10}, self.fetch)
+        await self.cache.invalidate(1)
+        await self.cache.cached(1, 'list', {'limit': 10}, self.fetch)
+        # other users are not affected
+        await self.cache.invalidate(2)
+        await self.cache.cached(1, 'list', {'limit': 10}, self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    async def test_redis_error(self):
+        self.redis.get.side_effect = ConnectionError()
+
+        result = await self.cache.cached(1, 'get', {'id': 1}, self.fetch)
+
+        self.assertEqual(result, [self.record])
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 0, 'errors': 1, 'executed': 0, 'coalesced': 0})
+
+    async def test_disabled(self):
+        self.cache.ttl = 0
+
+        await self.cache.cached(1, 'get', {'id': 1}, self.fetch)
+        await self.cache.invalidate(1)
+
+        self.redis.get.assert_not_called()
+        self.redis.incr.assert_not_called()
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_coalesce(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+        fetch_calls = []
+
+        async def fetch():
+            fetch_calls.append(1)
+            await release.wait()
+            return 'result'
+
+        calls = [asyncio.create_task(flight.do('key', fetch)) for _ in range(3)]
+        other = asyncio.create_task(flight.do('other', fetch))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*calls, other)
+
+        self.assertEqual(len(fetch_calls), 2)
+        self.assertEqual(results, [('result', False), ('result', True), ('result', True), ('result', False)])
+        self.assertEqual(flight.stats(), {'executed': 2, 'coalesced': 2})
+        self.assertEqual(flight.calls, {})
+
+    async def test_error(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            raise ValueError('db error')
+
+        calls = [asyncio.create_task(flight.do('key', fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flight.calls, {})
+
+    async def test_leader_cancelled(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+        fetch_calls = []
+
+        async def fetch():
+            fetch_calls.append(1)
+            await release.wait()
+            return 'result'
+
+        leader = asyncio.create_task(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        # follower runs its own fetch instead of failing with leader's cancellation
+        self.assertEqual(await follower, ('result', False))
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(len(fetch_calls), 2)
+        self.assertEqual(flight.calls, {})
+
+    async def test_follower_cancelled(self):
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return 'result'
+
+        leader = asyncio.create_task(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do('key', fetch))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await leader, ('result', False))
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+
+
+class TestAsyncUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.redis.get.return_value = None
+        self.cache = UserCache(self.redis, ttl=900, local_ttl=30, local_size=2)
+        self.user = User(id=1, username='John', email='john@mail.com', pwd_hash='secret',
+                         refresh_token='token', confirmed=True)
+
+    async def test_set_get_local(self):
+        await self.cache.set(self.user.email, self.user)
+        result = await self.cache.get(self.user.email)
+
+        key, raw = self.redis.set.call_args.args
+        self.assertEqual(key, 'users:john@mail.com')
+        self.assertEqual(self.redis.set.call_args.kwargs, {'ex': 900})
+        self.assertNotIn('secret', raw)
+        self.assertNotIn('token', raw)
+        self.redis.get.assert_not_called()
+        self.assertEqual(result, {'id': 1, 'username': 'John', 'email': 'john@mail.com', 'avatar': None, 'confirmed': True})
+
+    async def test_get_redis(self):
+        self.redis.get.return_value = '{"id":1,"username":"John","email":"john@mail.com","avatar":null,"confirmed":true}'
+
+        first = await self.cache.get(self.user.email)
+        second = await self.cache.get(self.user.email)
+
+        self.assertEqual(self.redis.get.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats(), {'local_hits': 1, 'hits': 1, 'misses': 0, 'errors': 0})
+
+    async def test_local_lru(self):
+        for email in ('a@mail.com', 'b@mail.com', 'c@mail.com'):
+            self.cache.remember(email, {'email': email})
+
+        self.assertEqual(list(self.cache.local), ['b@mail.com', 'c@mail.com'])
+
+    async def test_invalidate(self):
+        pipe = MagicMock()
+        pipe.delete.return_value.publish.return_value.execute = AsyncMock()
+        self.redis.pipeline = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = pipe
+        await self.cache.set(self.user.email, self.user)
+
+        await self.cache.invalidate(self.user.email)
+
+        self.assertNotIn(self.user.email, self.cache.local)
+        pipe.delete.assert_called_once_with('users:john@mail.com')
+        pipe.delete.return_value.publish.assert_called_once_with(UserCache.channel, 'john@mail.com')
+
+if __name__ == '__main__':
+    
+    unittest.main()
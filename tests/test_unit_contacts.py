@@ -1,13 +1,14 @@
 import unittest, sys, os
-from datetime import datetime
-from unittest.mock import MagicMock, AsyncMock
+from datetime import datetime, date
+from sqlalchemy.dialects import postgresql
+from unittest.mock import MagicMock, AsyncMock, patch
 from sqlalchemy.ext.asyncio import AsyncSession
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
 
-from src.database.models import Record, User
-from src.database.schemas import RecordSchema, RecordUpdateSchema
-from src.repository.contacts import get_contact, get_contacts, get_contacts_query, create_contact, update_contact, delete_contact
+from src.database.models import Record, RecordRow, User, birthday_key
+from src.database.schemas import RecordSchema, RecordUpdateSchema, RecordPatchSchema
+from src.repository.contacts import get_contact, get_contacts, get_contacts_query, create_contact, update_contact, delete_contact, encode_cursor, decode_cursor, birthday_window, get_contacts_by_ids, update_contacts, delete_contacts
 
 class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
     @classmethod
@@ -59,19 +60,29 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         # self.session = MagicMock(spec=Session)
         self.local_session = AsyncMock(spec=AsyncSession)
         self.local_session.execute.return_value = self.moked_db_responce
+        cache_patcher = patch('src.repository.contacts.contacts_cache.ttl', 0)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
 
         
     # @unittest.skip('not implemented')
     async def test_create_contact(self):
         new_user = RecordSchema(**self.new_contact)
+        self.moked_db_responce.scalar_one_or_none.return_value = Record(id=4, user_id=self.user.id, **new_user.model_dump())
         result = await create_contact(user=self.user, body=new_user, db=self.local_session)
         
-        self.assertEqual(self.local_session.add.call_count, 1)
+        self.assertEqual(self.local_session.execute.call_count, 1)
         self.assertEqual(self.local_session.commit.call_count, 1)
-        self.assertEqual(self.local_session.refresh.call_count, 1)
+        self.assertEqual(self.local_session.refresh.call_count, 0)
         self.assertIsInstance(result, Record)
         self.assertEqual(result.user_id, self.user.id)
 
+        stmt = self.local_session.execute.call_args.args[0]
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        self.assertIn('RETURNING', str(stmt.compile(dialect=postgresql.dialect())))
+        self.assertEqual(params['user_id'], self.user.id)
+        self.assertEqual(params['birthday_md'], 1110)
+
     # @unittest.skip('not implemented')
     async def test_get_contact_exist(self):
         record_id = 1
@@ -109,16 +120,28 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(
             self.moked_db_responce.scalar_one_or_none.call_count, 1)
         self.assertEqual(self.local_session.commit.call_count, 1)
-        self.assertEqual(self.local_session.refresh.call_count, 1)
+        self.assertEqual(self.local_session.refresh.call_count, 0)
+        self.assertEqual(result, self.fake_db_contacts[record_id-1])
 
-        self.assertIsInstance(result, Record)
-        self.assertEqual(result.id, record_id)
-        self.assertEqual(result.first_name, record_update.first_name)
-        self.assertEqual(result.last_name, record_update.last_name)
-        self.assertEqual(result.email, record_update.email)
-        self.assertEqual(result.birthday, record_update.birthday)
-        self.assertEqual(result.notes, record_update.notes)
-        self.assertNotEqual(result.updated_at, self.created_date, msg='updated_at should change')
+        stmt = self.local_session.execute.call_args.args[0]
+        compiled = stmt.compile(dialect=postgresql.dialect())
+        self.assertTrue(str(compiled).startswith('UPDATE records SET'))
+        self.assertIn('RETURNING', str(compiled))
+        self.assertNotEqual(compiled.params['updated_at'], self.created_date, msg='updated_at should change')
+        self.assertEqual(compiled.params['first_name'], record_update.first_name)
+        self.assertEqual(compiled.params['birthday'], record_update.birthday)
+        self.assertEqual(compiled.params['birthday_md'], 1110)
+        self.assertEqual(compiled.params['id_1'], record_id)
+        self.assertEqual(compiled.params['user_id_1'], self.user.id)
+
+    async def test_update_contact_not_exist(self):
+        self.moked_db_responce.scalar_one_or_none.return_value = None
+
+        result = await update_contact(user=self.user, record_id=10, body=RecordUpdateSchema(**self.new_contact), db=self.local_session)
+
+        self.assertEqual(self.local_session.execute.call_count, 1)
+        self.assertEqual(self.local_session.commit.call_count, 0)
+        self.assertIsNone(result)
 
     # @unittest.skip('not implemented')
     async def test_get_contacts(self):
@@ -132,6 +155,43 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
             self.moked_db_responce.scalars().all.call_count, 1)
         self.assertEqual(result, self.fake_db_contacts)
 
+    # @unittest.skip('not implemented')
+    async def test_get_contacts_after_cursor(self):
+        self.moked_db_responce.scalars().all.return_value = self.fake_db_contacts[1:]
+
+        result = await get_contacts(user=self.user, limit=10, offset=0, db=self.local_session, after_id=1)
+
+        stmt = self.local_session.execute.call_args.args[0]
+        compiled = str(stmt)
+        self.assertIn('records.id >', compiled)
+        self.assertIn('ORDER BY records.id', compiled)
+        self.assertEqual(result, self.fake_db_contacts[1:])
+
+    def test_cursor_roundtrip(self):
+        self.assertEqual(decode_cursor(encode_cursor(12345)), 12345)
+
+    def test_cursor_invalid(self):
+        for cursor in ('', 'not-a-cursor', encode_cursor(1)[:-2], 'eyJpZCI6ICJ4In0'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_birthday_key(self):
+        self.assertEqual(birthday_key(date(1980, 12, 31)), 1231)
+        self.assertEqual(birthday_key('1996-02-29'), 229)
+        self.assertIsNone(birthday_key(None))
+        self.assertEqual(self.fake_db_contacts[0].birthday_md, 408)
+
+    def test_birthday_window(self):
+        def compile(clause):
+            return str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+        self.assertEqual(compile(birthday_window(date(2026, 3, 1), date(2026, 3, 30))),
+                         'records.birthday_md BETWEEN 301 AND 330')
+        self.assertEqual(compile(birthday_window(date(2026, 12, 25), date(2027, 1, 7))),
+                         'records.birthday_md >= 1225 OR records.birthday_md <= 107')
+        self.assertEqual(compile(birthday_window(date(2026, 3, 1), date(2027, 3, 1))),
+                         'records.birthday_md IS NOT NULL')
+
     # @unittest.skip('not implemented')
     async def test_get_contacts_query(self):
         record_id = 1
@@ -162,8 +222,10 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(self.local_session.execute.call_count, 1)
         self.assertEqual(
             self.moked_db_responce.scalar_one_or_none.call_count, 1)
-        self.assertEqual(self.local_session.delete.call_count, 1)
+        self.assertEqual(self.local_session.delete.call_count, 0)
         self.assertEqual(self.local_session.commit.call_count, 1)
+        stmt = self.local_session.execute.call_args.args[0]
+        self.assertTrue(str(stmt.compile(dialect=postgresql.dialect())).startswith('DELETE FROM records'))
         self.assertEqual(result, self.fake_db_contacts[
             record_id-1])
     
@@ -180,6 +242,50 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(self.local_session.commit.call_count, 0)
         self.assertIsNone(result)
 
+    async def test_get_contacts_core_reads(self):
+        row = (1, 'Austin', 'Buttler', 'austin@example.com', date(1990, 4, 8), 'Feyd', self.created_date, None)
+        self.moked_db_responce.tuples.return_value = [row]
+
+        with patch('src.repository.contacts.config.CONTACTS_CORE_READS', True):
+            result = await get_contacts(user=self.user, limit=10, offset=0, db=self.local_session)
+
+        self.assertEqual(result, [RecordRow(*row)])
+        stmt = str(self.local_session.execute.call_args.args[0])
+        self.assertNotIn('JOIN', stmt)
+        self.assertNotIn('user_id,', stmt)
+
+    async def test_get_contacts_by_ids(self):
+        self.moked_db_responce.scalars().all.return_value = self.fake_db_contacts[:2]
+
+        result = await get_contacts_by_ids(user=self.user, record_ids=[2, 10, 1, 2], db=self.local_session)
+
+        self.assertEqual(self.local_session.execute.call_count, 1)
+        self.assertEqual(result, [self.fake_db_contacts[1], self.fake_db_contacts[0]])
+        compiled = self.local_session.execute.call_args.args[0].compile(dialect=postgresql.dialect())
+        self.assertIn([2, 10, 1], compiled.params.values())
+
+    async def test_update_contacts(self):
+        self.moked_db_responce.scalar_one_or_none.side_effect = [self.fake_db_contacts[0], None]
+        patches = [RecordPatchSchema(id=1, notes='Baron'), RecordPatchSchema(id=2), RecordPatchSchema(id=10, notes='none')]
+
+        result = await update_contacts(user=self.user, patches=patches, db=self.local_session)
+
+        # patch without fields is skipped
+        self.assertEqual(self.local_session.execute.call_count, 2)
+        self.assertEqual(self.local_session.commit.call_count, 1)
+        self.assertEqual(result, [self.fake_db_contacts[0]])
+        compiled = self.local_session.execute.call_args_list[0].args[0].compile(dialect=postgresql.dialect())
+        self.assertIn('SET notes=%(notes)s, updated_at=%(updated_at)s', str(compiled))
+
+    async def test_delete_contacts(self):
+        self.moked_db_responce.scalars().all.return_value = [1]
+
+        result = await delete_contacts(user=self.user, record_ids=[1, 10], db=self.local_session)
+
+        self.assertEqual(self.local_session.execute.call_count, 1)
+        self.assertEqual(self.local_session.commit.call_count, 1)
+        self.assertEqual(result, [{'id': 1, 'deleted': True}, {'id': 10, 'deleted': False}])
+
 if __name__ == '__main__':
     
     unittest.main()
\ No newline at end of file
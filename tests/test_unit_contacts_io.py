@@ -0,0 +1,70 @@
+import unittest, sys, os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.services.contacts_io import LINE_TOO_LONG, MAX_RECORD_LINES, iter_lines, parse_ndjson, parse_csv, parse_vcard
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class TestAsyncContactsIO(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iter_lines_split_chunks(self):
+        # line breaks and multibyte characters split between chunks
+        data = 'Андрій\r\nJohn\nlast'.encode()
+        result = await collect(iter_lines(stream(data[:3], data[3:13], data[13:])))
+
+        self.assertEqual(result, ['Андрій', 'John', 'last'])
+
+    async def test_parse_ndjson(self):
+        lines = stream('{"first_name": "John", "email": "", "extra": 1}', '', '[1]', '{broken')
+        result = await collect(parse_ndjson(lines))
+
+        self.assertEqual(result[0], (1, {'first_name': 'John', 'last_name': None, 'email': None, 'birthday': None, 'notes': None}))
+        self.assertEqual(result[1], (2, 'Invalid JSON: object expected'))
+        self.assertEqual(result[2][0], 3)
+        self.assertTrue(result[2][1].startswith('Invalid JSON'))
+
+    async def test_parse_csv_wrong_columns(self):
+        lines = stream('First_Name,Last_Name', 'John,Doe', 'Jane', 'Jim,"Un')
+        result = await collect(parse_csv(lines))
+
+        self.assertEqual(result[0][1]['last_name'], 'Doe')
+        self.assertEqual(result[1], (2, 'Expected 2 values, got 1'))
+        self.assertEqual(result[2], (3, 'Unterminated quoted value'))
+
+    async def test_iter_lines_too_long(self):
+        # line without break is dropped once it exceeds the limit, not buffered to the end
+        result = await collect(iter_lines(stream(b'short\n', b'x' * 6, b'x' * 6, b'x\nnext\n', b'y' * 20), max_length=10))
+
+        self.assertEqual(result, ['short', None, 'next', None])
+
+    async def test_parse_csv_stray_quote(self):
+        lines = ['first_name,notes', 'John,"stray'] + [f'Jane{number},note' for number in range(MAX_RECORD_LINES + 10)]
+        result = await collect(parse_csv(stream(*lines)))
+
+        # record with stray quote ends after MAX_RECORD_LINES lines, later rows are parsed again
+        self.assertEqual(result[0], (1, 'Unterminated quoted value'))
+        self.assertEqual(len(result), 12)
+        self.assertEqual(result[1], (2, {'first_name': f'Jane{MAX_RECORD_LINES - 1}', 'last_name': None, 'email': None,
+                                         'birthday': None, 'notes': 'note'}))
+
+    async def test_parse_too_long_line(self):
+        result = await collect(parse_csv(stream('first_name', None, 'John')))
+        self.assertEqual(result, [(1, LINE_TOO_LONG), (2, {'first_name': 'John', 'last_name': None, 'email': None,
+                                                            'birthday': None, 'notes': None})])
+
+        result = await collect(parse_vcard(stream('BEGIN:VCARD', None, 'END:VCARD', 'BEGIN:VCARD', 'FN:John', 'END:VCARD')))
+        self.assertEqual(result[0], (1, LINE_TOO_LONG))
+        self.assertEqual(result[1][1]['first_name'], 'John')
+
+if __name__ == '__main__':
+    
+    unittest.main()
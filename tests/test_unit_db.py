@@ -0,0 +1,133 @@
+import unittest, sys, os, tempfile
+from sqlalchemy import exc, insert, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.conf.config import config
+from src.database.db import InstrumentedPool, LazySession, engine_options
+from src.database.models import Base, User
+
+
+class TestAsyncPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f'sqlite+aiosqlite:///{self.folder.name}/pool.db', poolclass=InstrumentedPool,
+                                          pool_size=1, max_overflow=0, pool_timeout=0.1)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.folder.cleanup()
+
+    async def test_stats(self):
+        async with self.engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+            stats = self.engine.pool.stats()
+            self.assertEqual(stats['checked_out'], 1)
+            self.assertEqual(stats['saturation'], 1)
+
+            with self.assertRaises(exc.TimeoutError):
+                async with self.engine.connect():
+                    pass
+
+        stats = self.engine.pool.stats()
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['wait_max_ms'], 100)
+
+    def test_engine_options(self):
+        settings = config.model_copy(update={'DB_PGBOUNCER': False})
+        options = engine_options('postgresql+asyncpg://u:p@localhost/db', settings)
+        self.assertIs(options['poolclass'], InstrumentedPool)
+        self.assertEqual(options['pool_size'], settings.DB_POOL_SIZE)
+        self.assertEqual(options['connect_args']['statement_cache_size'], settings.DB_STATEMENT_CACHE_SIZE)
+
+        settings = config.model_copy(update={'DB_PGBOUNCER': True})
+        options = engine_options('postgresql+asyncpg://u:p@localhost/db', settings)
+        self.assertEqual(options['connect_args']['statement_cache_size'], 0)
+        self.assertEqual(options['connect_args']['prepared_statement_cache_size'], 0)
+        name_func = options['connect_args']['prepared_statement_name_func']
+        self.assertNotEqual(name_func(), name_func())
+
+        self.assertNotIn('poolclass', engine_options('sqlite+aiosqlite:///:memory:', settings))
+
+
+class TestLazySession(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f'sqlite+aiosqlite:///{self.folder.name}/lazy.db', poolclass=InstrumentedPool,
+                                          pool_size=1, max_overflow=0, pool_timeout=0.1)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(User).values(username='user', email='user@example.com', pwd_hash='hash'))
+        self.sessionmaker = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+        self.stats = {'sessions': 0, 'opened': 0, 'released': 0}
+        self.checkouts = self.engine.pool.stats()['checkouts']
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.folder.cleanup()
+
+    async def test_unused(self):
+        session = LazySession(self.sessionmaker, stats=self.stats)
+        await session.rollback()
+        await session.close()
+
+        self.assertFalse(session.opened)
+        self.assertEqual(self.stats, {'sessions': 1, 'opened': 0, 'released': 0})
+        self.assertEqual(self.engine.pool.stats()['checkouts'], self.checkouts)
+
+    async def test_release_after_read(self):
+        session = LazySession(self.sessionmaker, stats=self.stats)
+        user = (await session.execute(select(User))).scalar_one()
+
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 0)
+        self.assertEqual(self.stats['released'], 1)
+        # loaded object is not expired by release
+        self.assertEqual(user.username, 'user')
+        self.assertEqual(await session.scalar(select(User.email)), 'user@example.com')
+        await session.close()
+        self.assertEqual(self.stats['released'], 2)
+
+    async def test_write_holds_connection(self):
+        session = LazySession(self.sessionmaker, stats=self.stats)
+        await session.execute(text("UPDATE users SET username = 'changed'"))
+        await session.execute(select(User))
+
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 1)
+        self.assertEqual(self.stats['released'], 0)
+        await session.commit()
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 0)
+
+        self.assertEqual(await session.scalar(select(User.username)), 'changed')
+        self.assertEqual(self.stats['released'], 1)
+        await session.close()
+
+    async def test_locks_and_pending_hold_connection(self):
+        session = LazySession(self.sessionmaker, stats=self.stats)
+        await session.execute(select(User).with_for_update())
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 1)
+        await session.rollback()
+
+        session.add(User(username='new', email='new@example.com', pwd_hash='hash'))
+        await session.execute(select(User))
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 1)
+        await session.rollback()
+
+        self.assertEqual(self.stats['released'], 0)
+        await session.close()
+
+    async def test_release_disabled(self):
+        session = LazySession(self.sessionmaker, release_after_read=False, stats=self.stats)
+        await session.execute(select(User))
+
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 1)
+        await session.close()
+        self.assertEqual(self.engine.pool.stats()['checked_out'], 0)
+
+if __name__ == '__main__':
+    
+    unittest.main()
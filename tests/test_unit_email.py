@@ -0,0 +1,160 @@
+import unittest, sys, os, asyncio, socket
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiosmtplib import SMTPServerDisconnected
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.conf.config import config
+from src.services.email import MailSender
+
+
+def mail_settings(**values):
+    return config.model_copy(update={'MAIL_POOL_SIZE': 1, 'MAIL_BATCH_SIZE': 10, 'MAIL_IDLE_TIMEOUT': 5,
+                                     'USE_CREDENTIALS': False, **values})
+
+
+def smtp_mock():
+    smtp = MagicMock()
+    smtp.is_connected = False
+
+    async def connect():
+        smtp.is_connected = True
+
+    def close():
+        smtp.is_connected = False
+
+    smtp.connect = AsyncMock(side_effect=connect)
+    smtp.close = MagicMock(side_effect=close)
+    smtp.send_message = AsyncMock()
+    smtp.quit = AsyncMock(side_effect=close)
+    return smtp
+
+
+class TestMailSender(unittest.TestCase):
+
+    def test_render(self):
+        sender = MailSender(mail_settings())
+
+        body = sender.render('email_confirmation.html', fullname='<John>', host='http://test/', token='abc')
+
+        self.assertIn('http://test/api/auth/confirm_email/abc', body)
+        self.assertIn('&lt;John&gt;', body)
+
+    def test_message(self):
+        sender = MailSender(mail_settings())
+
+        message = sender.message('john@mail.com', 'Subject', 'email_confirmation.html',
+                                 fullname='John', host='http://test/', token='abc')
+
+        self.assertEqual(message['To'], 'john@mail.com')
+        self.assertEqual(message['Subject'], 'Subject')
+        self.assertEqual(message.get_content_type(), 'text/html')
+
+
+class TestAsyncMailSender(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.sender = MailSender(mail_settings())
+        self.smtp = smtp_mock()
+        self.patcher = patch('src.services.email.SMTP', return_value=self.smtp)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    async def test_batch_one_connection(self):
+        for number in range(25):
+            await self.sender.send(MagicMock(name=f'message {number}'))
+        await self.sender.close()
+
+        self.smtp.connect.assert_awaited_once()
+        self.assertEqual(self.smtp.send_message.await_count, 25)
+        self.assertEqual(self.sender.stats(), {'sent': 25, 'failed': 0, 'connections': 1, 'queued': 0})
+
+    async def test_reconnect(self):
+        self.smtp.send_message.side_effect = [SMTPServerDisconnected('closed'), None]
+
+        await self.sender.send(MagicMock())
+        await self.sender.close()
+
+        self.assertEqual(self.smtp.connect.await_count, 2)
+        self.assertEqual(self.sender.stats()['sent'], 1)
+
+    async def test_failed(self):
+        self.smtp.send_message.side_effect = SMTPServerDisconnected('closed')
+
+        await self.sender.send(MagicMock())
+        await self.sender.close()
+
+        self.assertEqual(self.sender.stats()['failed'], 1)
+
+    async def test_other_error(self):
+        # error outside of SMTP errors fails the message, worker keeps sending
+        self.smtp.send_message.side_effect = [ValueError('malformed address'), None]
+
+        first = await self.sender.send(MagicMock())
+        second = await self.sender.send(MagicMock())
+
+        with self.assertRaises(ValueError):
+            await asyncio.wait_for(first, 1)
+        self.assertIsNone(await asyncio.wait_for(second, 1))
+        self.assertFalse(any(worker.done() for worker in self.sender.workers))
+        await self.sender.close()
+        self.assertEqual(self.sender.stats(), {'sent': 1, 'failed': 1, 'connections': 2, 'queued': 0})
+
+    async def test_restart_stopped_worker(self):
+        self.sender.start()
+        worker = self.sender.workers[0]
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+        delivery = await self.sender.send(MagicMock())
+
+        self.assertIsNone(await asyncio.wait_for(delivery, 1))
+        self.assertIsNot(self.sender.workers[0], worker)
+        await self.sender.close()
+
+    async def test_idle_disconnect(self):
+        self.sender.settings = mail_settings(MAIL_IDLE_TIMEOUT=0.01)
+
+        await self.sender.send(MagicMock())
+        await self.sender.queue.join()
+        await asyncio.sleep(0.05)
+
+        self.smtp.quit.assert_awaited()
+        self.assertFalse(self.smtp.is_connected)
+        await self.sender.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestAsyncMailSenderSMTP(unittest.IsolatedAsyncioTestCase):
+
+    async def test_local_server(self):
+        handler = Sink()
+        handler.handle_DATA = AsyncMock(return_value='250 OK')
+        controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+        controller.start()
+        try:
+            sender = MailSender(mail_settings(MAIL_SERVER='127.0.0.1', MAIL_PORT=controller.port,
+                                              MAIL_SSL_TLS=False, MAIL_STARTTLS=False, MAIL_POOL_SIZE=2))
+            for number in range(10):
+                await sender.send(sender.message(f'user{number}@mail.com', 'Subject', 'email_confirmation.html',
+                                                 fullname='John', host='http://test/', token='abc'))
+            await sender.close()
+        finally:
+            controller.stop()
+
+        self.assertEqual(handler.handle_DATA.await_count, 10)
+        self.assertEqual(sender.stats()['sent'], 10)
+        self.assertLessEqual(sender.stats()['connections'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest, sys, os
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.database.models import Record
+from src.services.etag import make_etag, etag_matches
+
+
+class TestEtag(unittest.TestCase):
+
+    def setUp(self):
+        self.record = Record(id=1, first_name='Austin', updated_at=datetime(2024, 4, 8, 10, 0, 0))
+
+    def test_make_etag(self):
+        etag = make_etag([self.record])
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(etag, make_etag([Record(id=1, first_name='Paul', updated_at=datetime(2024, 4, 8, 10, 0, 0))]))
+        self.assertNotEqual(etag, make_etag([Record(id=1, updated_at=datetime(2024, 4, 8, 10, 0, 1))]))
+        self.assertNotEqual(etag, make_etag([Record(id=2, updated_at=datetime(2024, 4, 8, 10, 0, 0))]))
+        self.assertNotEqual(make_etag([]), make_etag([self.record]))
+
+    def test_etag_matches(self):
+        etag = make_etag([self.record])
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(f'"other", W/{etag}', etag))
+        self.assertFalse(etag_matches(f'W/{etag}', etag, weak=False))
+        self.assertTrue(etag_matches('*', etag, weak=False))
+        self.assertFalse(etag_matches('"other"', etag))
+        self.assertFalse(etag_matches(None, etag))
+
+if __name__ == '__main__':
+    
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest, sys, os, json
+from datetime import datetime, date, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.database.models import Record
+from src.database.schemas import RecordResponseSchema
+from src.services.fast_json import dump_records, records_adapter
+
+
+class TestFastJson(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            Record(id=1, first_name='Austin', last_name='Butler', email='austin@example.com', birthday=date(1991, 8, 17),
+                   notes='Feyd', created_at=datetime(2024, 4, 8, 10, 0, 0), updated_at=datetime(2024, 4, 8, 10, 0, 0, 123456)),
+            Record(id=2, first_name='Timothee', last_name=None, email=None, birthday=None,
+                   notes=None, created_at=datetime(2024, 4, 8, 10, 0, 0, tzinfo=timezone.utc), updated_at=None),
+        ]
+
+    def test_dump_records(self):
+        # same output as response_model serialization
+        expected = records_adapter.dump_json(records_adapter.validate_python(self.records, from_attributes=True))
+
+        self.assertEqual(json.loads(dump_records(self.records)), json.loads(expected))
+
+    def test_dump_schema_records(self):
+        records = [RecordResponseSchema.model_validate(record) for record in self.records]
+
+        self.assertEqual(json.loads(dump_records(records)), json.loads(dump_records(self.records)))
+        self.assertEqual(dump_records([]), b'[]')
+
+if __name__ == '__main__':
+    
+    unittest.main()
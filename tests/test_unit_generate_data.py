@@ -0,0 +1,40 @@
+import unittest, sys, os
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from benchmarks.generate_data import COLUMNS, contacts_per_user, rows, user_contacts
+from src.database.models import birthday_key
+
+
+class TestGenerateData(unittest.TestCase):
+
+    def test_contacts_per_user(self):
+        counts = contacts_per_user(100, 100000, seed=1)
+
+        self.assertEqual(len(counts), 100)
+        self.assertEqual(sum(counts), 100000)
+        # heavy tail: top 10% of accounts hold much more than 10% of contacts
+        self.assertGreater(sum(sorted(counts)[-10:]), 30000)
+
+    def test_deterministic(self):
+        now = datetime(2024, 1, 1)
+        first = list(rows(7, [1, 2], [50, 30], now))
+
+        self.assertEqual(first, list(rows(7, [1, 2], [50, 30], now)))
+        self.assertNotEqual(first, list(rows(8, [1, 2], [50, 30], now)))
+        # user's contacts do not depend on other users
+        self.assertEqual(first[50:], list(user_contacts(7, 1, 2, 30, now)))
+
+    def test_rows_fit_model(self):
+        for row in user_contacts(1, 0, 1, 2000, datetime(2024, 1, 1)):
+            contact = dict(zip(COLUMNS, row))
+            self.assertLessEqual(len(contact['first_name']), 30)
+            self.assertLessEqual(len(contact['last_name'] or ''), 30)
+            self.assertLessEqual(len(contact['email'] or ''), 30)
+            self.assertEqual(contact['birthday_md'], birthday_key(contact['birthday']))
+            self.assertEqual(contact['user_id'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
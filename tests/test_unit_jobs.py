@@ -0,0 +1,131 @@
+import unittest, sys, os, json, time, asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from redis.exceptions import ResponseError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.services.jobs import JobQueue, JobError
+
+
+class TestAsyncJobQueue(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock()
+        self.redis = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = self.pipe
+        self.redis.register_script.return_value = AsyncMock(return_value=0)
+        self.redis.xadd = AsyncMock(return_value='1-0')
+        self.redis.xgroup_create = AsyncMock()
+        self.redis.xautoclaim = AsyncMock(return_value=['0-0', [], []])
+        self.redis.xreadgroup = AsyncMock(return_value=[])
+        self.queue = JobQueue(self.redis, 'jobs', max_attempts=3, backoff_base=2, backoff_max=5, claim_idle=60)
+        self.handler = AsyncMock()
+        self.queue.handler('job')(self.handler)
+
+    def entry(self, attempt: int = 0) -> dict:
+        return {'job': 'job', 'payload': json.dumps({'email': 'john@mail.com'}), 'attempt': str(attempt)}
+
+    async def test_enqueue(self):
+        entry_id = await self.queue.enqueue('job', email='john@mail.com')
+
+        self.assertEqual(entry_id, '1-0')
+        self.redis.xadd.assert_awaited_once_with('jobs', {'job': 'job', 'payload': '{"email": "john@mail.com"}', 'attempt': 0})
+
+    async def test_process(self):
+        await self.queue.process('1-0', self.entry())
+
+        self.handler.assert_awaited_once_with(email='john@mail.com')
+        self.pipe.xack.assert_called_once_with('jobs', 'workers', '1-0')
+        self.pipe.xdel.assert_called_once_with('jobs', '1-0')
+        self.assertEqual(self.queue.processed, 1)
+
+    async def test_retry(self):
+        self.handler.side_effect = ConnectionError('smtp')
+
+        await self.queue.process('1-0', self.entry(attempt=1))
+
+        job, due = next(iter(self.pipe.zadd.call_args.args[1].items()))
+        self.assertEqual(self.pipe.zadd.call_args.args[0], 'jobs:delayed')
+        self.assertEqual(json.loads(job)['attempt'], 2)
+        self.assertAlmostEqual(due, time.time() + 4, delta=1)
+        self.pipe.xack.assert_called_once()
+        self.pipe.xadd.assert_not_called()
+        self.assertEqual(self.queue.retried, 1)
+
+    async def test_backoff(self):
+        self.assertEqual([self.queue.backoff(attempt) for attempt in range(4)], [2, 4, 5, 5])
+
+    async def test_dead_letter_after_attempts(self):
+        self.handler.side_effect = ConnectionError('smtp')
+
+        await self.queue.process('1-0', self.entry(attempt=2))
+
+        self.assertEqual(self.pipe.xadd.call_args.args[0], 'jobs:dead')
+        self.assertEqual(self.pipe.xadd.call_args.args[1]['failed_id'], '1-0')
+        self.pipe.zadd.assert_not_called()
+        self.assertEqual(self.queue.failed, 1)
+
+    async def test_dead_letter_job_error(self):
+        self.handler.side_effect = JobError('invalid image')
+
+        await self.queue.process('1-0', self.entry())
+
+        self.assertEqual(self.pipe.xadd.call_args.args[0], 'jobs:dead')
+
+    async def test_unknown_job(self):
+        await self.queue.process('1-0', {'job': 'unknown', 'payload': '{}', 'attempt': '0'})
+
+        self.assertEqual(self.pipe.xadd.call_args.args[0], 'jobs:dead')
+
+    async def test_read_claims_lost_jobs(self):
+        self.redis.xautoclaim.return_value = ['0-0', [('1-0', self.entry()), ('2-0', None)], []]
+
+        entries = await self.queue.read('worker', 10, 100)
+
+        self.assertEqual(entries, [('1-0', self.entry())])
+        self.redis.xreadgroup.assert_not_awaited()
+        self.queue.promote_script.assert_awaited_once()
+
+    async def test_read_new_jobs(self):
+        self.redis.xreadgroup.return_value = [['jobs', [('1-0', self.entry())]]]
+
+        entries = await self.queue.read('worker', 10, 100)
+
+        self.assertEqual(entries, [('1-0', self.entry())])
+        # lost jobs are claimed once per half of claim_idle
+        await self.queue.read('worker', 10, 100)
+        self.redis.xautoclaim.assert_awaited_once()
+
+    async def test_ensure_group_exists(self):
+        self.redis.xgroup_create.side_effect = ResponseError('BUSYGROUP Consumer Group name already exists')
+
+        await self.queue.ensure_group()
+        await self.queue.ensure_group()
+
+        self.redis.xgroup_create.assert_awaited_once()
+
+    async def test_stats(self):
+        oldest = f'{int((time.time() - 10) * 1000)}-0'
+        self.pipe.execute.return_value = [3, {'pending': 1}, 2, 1, [(oldest, self.entry())]]
+
+        stats = await self.queue.stats()
+
+        self.assertEqual(stats['depth'], 3)
+        self.assertEqual(stats['pending'], 1)
+        self.assertEqual(stats['delayed'], 2)
+        self.assertEqual(stats['dead'], 1)
+        self.assertAlmostEqual(stats['lag_seconds'], 10, delta=1)
+
+    async def test_run(self):
+        stop = asyncio.Event()
+        self.redis.xreadgroup.return_value = [['jobs', [('1-0', self.entry())]]]
+        self.handler.side_effect = lambda **payload: stop.set()
+
+        await asyncio.wait_for(self.queue.run('worker', 10, stop), 1)
+
+        self.handler.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
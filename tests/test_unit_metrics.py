@@ -0,0 +1,118 @@
+import unittest, sys, os
+import fakeredis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.services.metrics import Counter, Histogram, Metrics, MetricsMiddleware, RequestStats, current_request, stats_metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram('latency', 'Latency.', ('route',), (0.1, 1))
+        histogram.observe(('/a',), 0.05)
+        histogram.observe(('/a',), 0.1)
+        histogram.observe(('/a',), 5)
+
+        self.assertEqual(histogram.render(), [
+            '# HELP latency Latency.', '# TYPE latency histogram',
+            'latency_bucket{route="/a",le="0.1"} 2', 'latency_bucket{route="/a",le="1"} 2',
+            'latency_bucket{route="/a",le="+Inf"} 3', 'latency_sum{route="/a"} 5.15', 'latency_count{route="/a"} 3'])
+
+    def test_counter_escaping(self):
+        counter = Counter('errors_total', 'Errors.', ('message',))
+        counter.inc(('say "hi"\n',), 2)
+
+        self.assertEqual(counter.render()[-1], 'errors_total{message="say \\"hi\\"\\n"} 2')
+
+    def test_stats_metrics(self):
+        lines = stats_metrics('cache', {'hits': 3, 'size': 10, 'name': 'x'}, counters=('hits',))
+
+        self.assertIn('# TYPE cache_hits_total counter', lines)
+        self.assertIn('cache_hits_total 3', lines)
+        self.assertIn('# TYPE cache_size gauge', lines)
+        self.assertFalse(any('name' in line for line in lines))
+
+    def test_middleware(self):
+        metrics = Metrics()
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+        @app.get('/items/{item_id}')
+        async def get_item(item_id: int):
+            current_request.get().db_queries += 2
+            return {'id': item_id}
+
+        client = TestClient(app)
+        client.get('/items/1')
+        client.get('/items/2')
+        client.get('/unknown/path')
+
+        body = metrics.render()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1', body)
+        self.assertIn('http_request_db_queries_bucket{route="/items/{item_id}",le="2"} 2', body)
+
+
+class TestAsyncMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_db_queries(self):
+        metrics = Metrics()
+        engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+        metrics.instrument_db(engine.sync_engine)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+                await conn.execute(text('SELECT 2'))
+        finally:
+            current_request.reset(token)
+            await engine.dispose()
+
+        # app metrics may count the same queries when all engines are instrumented
+        self.assertEqual(metrics.queries.values[()], 2)
+        self.assertGreaterEqual(stats.db_queries, 2)
+        self.assertGreater(stats.db_seconds, 0)
+
+    async def test_db_query_error(self):
+        metrics = Metrics()
+        engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+        metrics.instrument_db(engine.sync_engine)
+        try:
+            async with engine.connect() as conn:
+                with self.assertRaises(exc.OperationalError):
+                    await conn.execute(text('SELECT * FROM missing'))
+                # start time of failed query does not stay on the connection
+                self.assertEqual(conn.sync_connection.info['metrics_query_start'], [])
+                await conn.execute(text('SELECT 1'))
+        finally:
+            await engine.dispose()
+
+        self.assertEqual(metrics.queries.values[()], 2)
+
+    async def test_redis_calls(self):
+        metrics = Metrics()
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        metrics.instrument_redis(client)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            await client.set('key', 1)
+            await client.get('key')
+            async with client.pipeline(transaction=False) as pipe:
+                await pipe.incr('key').incr('key').execute()
+        finally:
+            current_request.reset(token)
+
+        self.assertEqual(stats.redis_calls, 3)
+        self.assertEqual(await client.get('key'), '3')
+        self.assertEqual(metrics.redis_calls.values[()], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
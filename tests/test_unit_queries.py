@@ -0,0 +1,85 @@
+import unittest, sys, os
+from unittest.mock import patch
+from sqlalchemy import select, text
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.database.models import Base, Record, User
+from src.services.queries import QueryBudgetExceeded, QueryLog, capture_queries, check_budget, query_budget
+
+
+class TestQueryLog(unittest.TestCase):
+
+    def test_repeated(self):
+        log = QueryLog(['SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 1'])
+
+        self.assertEqual(log.count, 4)
+        self.assertEqual(log.repeated(), {'SELECT 1': 3})
+
+    def test_check_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            check_budget(QueryLog(['SELECT 1', 'SELECT 2']), 'call', 1)
+        with self.assertRaises(QueryBudgetExceeded):
+            check_budget(QueryLog(['SELECT 1'] * 3), 'call', 5)
+        check_budget(QueryLog(['SELECT 1'] * 3), 'call', 5, allow_repeated=True)
+
+    def test_check_budget_warn(self):
+        with patch('builtins.print') as mock_print:
+            check_budget(QueryLog(['SELECT 1', 'SELECT 2']), 'call', 1, mode='warn')
+
+        self.assertIn('call made 2 queries, budget is 1', mock_print.call_args.args[0])
+
+
+class TestAsyncQueries(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.sessionmaker() as db:
+            user = User(username='john', email='john@mail.com', pwd_hash='x')
+            db.add_all([user, Record(first_name='Ann', user=user), Record(first_name='Bob', user=user)])
+            await db.commit()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_capture_queries(self):
+        with capture_queries() as outer:
+            async with self.engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+                with capture_queries() as inner:
+                    await conn.execute(text('SELECT 2'))
+
+        self.assertEqual(outer.statements, ['SELECT 1', 'SELECT 2'])
+        self.assertEqual(inner.statements, ['SELECT 2'])
+
+    async def test_relationships_raise(self):
+        async with self.sessionmaker() as db:
+            records = (await db.execute(select(Record))).scalars().all()
+
+            with self.assertRaises(InvalidRequestError):
+                records[0].user
+
+    async def test_query_budget(self):
+        @query_budget(1)
+        async def n_plus_one(db):
+            for rec_id in (1, 2, 1):
+                await db.get(Record, rec_id, populate_existing=True)
+
+        async with self.sessionmaker() as db:
+            with patch('src.services.queries.config.QUERY_BUDGET_MODE', 'raise'):
+                with self.assertRaises(QueryBudgetExceeded) as err:
+                    await n_plus_one(db)
+            with patch('src.services.queries.config.QUERY_BUDGET_MODE', 'off'):
+                await n_plus_one(db)
+
+        self.assertIn('n_plus_one made 3 queries', str(err.exception))
+        self.assertIn('N+1', str(err.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest, sys, os
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+from src.services.rate_limiter import HybridRateLimiter, RatePolicy
+from src.conf.config import route_rst
+
+
+class TestAsyncRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.policy = RatePolicy(2, 5)
+        self.limiter = HybridRateLimiter(lambda route, identity: self.policy, secret='secret', algorithm='HS256')
+        self.request = MagicMock()
+        self.request.method = 'GET'
+        self.request.scope = {'route': MagicMock(path='/api/contacts/')}
+        self.request.headers = {}
+        self.request.client.host = '127.0.0.1'
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock(return_value=[1, True])
+        self.redis = MagicMock()
+        self.redis.pipeline.return_value.__aenter__.return_value = self.pipe
+
+    async def test_local_limit(self):
+        await self.limiter(self.request)
+        await self.limiter(self.request)
+        with self.assertRaises(HTTPException) as err:
+            await self.limiter(self.request)
+
+        self.assertEqual(err.exception.status_code, 429)
+        self.assertIn('Retry-After', err.exception.headers)
+        self.assertEqual(self.limiter.stats(), {'allowed': 2, 'rejected': 1, 'errors': 0, 'buckets': 1})
+
+    async def test_sync_other_workers(self):
+        # this worker made 1 request, other workers 1 more
+        self.pipe.execute.return_value = [2, True]
+        self.limiter.redis = self.redis
+
+        await self.limiter(self.request)
+        await self.limiter.sync()
+
+        self.pipe.incrby.assert_called_once()
+        self.assertEqual(self.pipe.incrby.call_args.args[1], 1)
+        with self.assertRaises(HTTPException):
+            await self.limiter(self.request)
+
+    async def test_sync_idle(self):
+        self.limiter.redis = self.redis
+        await self.limiter(self.request)
+        await self.limiter.sync()
+        self.limiter.buckets[('GET /api/contacts/', 'ip:127.0.0.1')].tokens = 2
+
+        await self.limiter.sync()
+
+        self.assertEqual(self.limiter.buckets, {})
+
+    def test_policy(self):
+        with patch.dict(route_rst.route_policies, {'POST /api/auth/login': RatePolicy(5, 60)}), \
+                patch.dict(route_rst.user_policies, {'vip@mail.com': RatePolicy(100, 1)}):
+            self.assertEqual(route_rst.policy('POST /api/auth/login', 'ip:127.0.0.1'), RatePolicy(5, 60))
+            self.assertEqual(route_rst.policy('POST /api/auth/login', 'user:vip@mail.com'), RatePolicy(100, 1))
+            self.assertEqual(route_rst.policy('GET /api/contacts/', 'user:john@mail.com'), route_rst.default_policy)
+        self.assertEqual(RatePolicy.parse('2/5'), RatePolicy(2, 5))
+
+if __name__ == '__main__':
+    
+    unittest.main()
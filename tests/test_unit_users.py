@@ -1,12 +1,13 @@
 import unittest, sys, os
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import sqlite
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
 
 from src.database.models import User
 from src.database.schemas import UserDBSchema
-from src.repository.users import get_user_by_email, create_user, user_email_confirmation, update_user_avatar, update_user_token
+from src.repository.users import get_user_by_email, email_exists, create_user, user_email_confirmation, update_user_avatar, update_user_token
 
 class TestAsyncUsers(unittest.IsolatedAsyncioTestCase):
     @classmethod
@@ -35,6 +36,9 @@ class TestAsyncUsers(unittest.IsolatedAsyncioTestCase):
         # self.session = MagicMock(spec=Session)
         self.local_session = AsyncMock(spec=AsyncSession)
         self.local_session.execute.return_value = self.moked_db_responce
+        cache_patcher = patch('src.repository.users.user_cache.ttl', 0)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
 
         
     # @unittest.skip('not implemented')
@@ -62,6 +66,14 @@ class TestAsyncUsers(unittest.IsolatedAsyncioTestCase):
 
         self.assertIsNone(result)
 
+    async def test_email_exists(self):
+        self.local_session.scalar.return_value = 1
+        self.assertTrue(await email_exists(email=self.user_valid.email, db=self.local_session))
+
+        self.local_session.scalar.return_value = None
+        self.assertFalse(await email_exists(email=self.user_invalid['email'], db=self.local_session))
+        self.assertEqual(self.local_session.scalar.call_count, 2)
+
     # @unittest.skip('not implemented')
     async def test_create_user(self):
         body = UserDBSchema(**self.user_db_creation)
@@ -70,52 +82,67 @@ class TestAsyncUsers(unittest.IsolatedAsyncioTestCase):
 
         result = await create_user(body=body, db=self.local_session)
         
-        self.assertEqual(self.local_session.add.call_count, 1)
+        self.assertEqual(self.local_session.execute.call_count, 1)
         self.assertEqual(self.local_session.commit.call_count, 1)
-        self.assertEqual(self.local_session.refresh.call_count, 1)
+        self.assertEqual(self.local_session.refresh.call_count, 0)
         self.assertIsInstance(result, User)
 
         # self.assertDictContainsSubset(self.user_db_creation, result.__dict__)
         self.assertLessEqual(self.user_db_creation.items(), result.__dict__.items())
 
+        stmt = str(self.local_session.execute.call_args.args[0].compile(dialect=sqlite.dialect()))
+        self.assertIn('ON CONFLICT (email) DO NOTHING RETURNING', stmt)
+
+    async def test_create_user_exists(self):
+        self.moked_db_responce.scalar_one_or_none.return_value = None
+
+        result = await create_user(body=UserDBSchema(**self.user_db_creation), db=self.local_session)
+
+        self.assertEqual(self.local_session.execute.call_count, 1)
+        self.assertIsNone(result)
+
+    def assert_updated(self, values: dict):
+        self.assertEqual(self.local_session.execute.call_count, 1)
+        self.assertEqual(self.local_session.commit.call_count, 1)
+        self.assertEqual(self.local_session.refresh.call_count, 0)
+        compiled = self.local_session.execute.call_args.args[0].compile(dialect=sqlite.dialect())
+        self.assertTrue(str(compiled).startswith('UPDATE users SET'))
+        self.assertIn('RETURNING', str(compiled))
+        self.assertEqual(compiled.params['id_1'], self.user_valid.id)
+        self.assertLessEqual(values.items(), compiled.params.items())
+
     # @unittest.skip('not implemented')
     async def test_update_user_token(self):
         user = self.user_valid
         token = 'eruweutweyitewyewt'
+        self.moked_db_responce.scalar_one_or_none.return_value = user
 
         result = await update_user_token(user=user, token=token, db=self.local_session)
         
-        self.assertEqual(self.local_session.commit.call_count, 1)
-        self.assertEqual(self.local_session.refresh.call_count, 1)
+        self.assert_updated({'refresh_token': token})
         self.assertIsInstance(result, User)
 
-        self.assertEqual(result.refresh_token, token)
-
     # @unittest.skip('not implemented')
     async def test_user_email_confirmation(self):
         user=self.user_valid
+        self.moked_db_responce.scalar_one_or_none.return_value = user
 
         result = await user_email_confirmation(user=user, db=self.local_session)
 
-        self.assertEqual(self.local_session.commit.call_count, 1)
-        self.assertEqual(self.local_session.refresh.call_count, 1)
+        self.assert_updated({'confirmed': True})
         self.assertIsInstance(result, User)
 
-        self.assertTrue(result.confirmed)
-
     # @unittest.skip('not implemented')
     async def test_update_user_avatar(self):
         user = self.user_valid
         url = 'http://avatar.domain.com/avatar.jpg'
+        self.moked_db_responce.scalar_one_or_none.return_value = user
 
         result = await update_user_avatar(user=user, url=url, db=self.local_session)
 
-        self.assertEqual(self.local_session.commit.call_count, 1)
-        self.assertEqual(self.local_session.refresh.call_count, 1)
+        self.assert_updated({'avatar': url})
         self.assertIsInstance(result, User)
 
-        self.assertEqual(result.avatar, url)
-
 if __name__ == '__main__':
     
     unittest.main()
\ No newline at end of file